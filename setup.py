@@ -70,6 +70,7 @@ def runSetup():
             'console_scripts': [
                 'toil = toil.utils.toilMain:main',
                 '_toil_worker = toil.worker:main',
+                '_toil_persistent_worker = toil.worker:persistentMain',
                 'cwltoil = toil.cwl.cwltoil:main [cwl]',
                 'toil-cwl-runner = toil.cwl.cwltoil:main [cwl]',
                 'cwl-runner = toil.cwl.cwltoil:main [cwl]',
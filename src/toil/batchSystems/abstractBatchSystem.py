@@ -154,6 +154,44 @@ class AbstractBatchSystem(with_metaclass(ABCMeta, object)):
         """
         raise NotImplementedError()
 
+    def getUpdatedBatchJobs(self, maxWait, maxJobs=None):
+        """
+        Returns the jobs that have updated their status, draining as many as are available in a
+        single call. Only the first result is waited for, any further results are only returned
+        if they are already available.
+
+        The default implementation repeatedly calls :meth:`getUpdatedBatchJob`. Implementors
+        that can fetch many results more cheaply may override it.
+
+        :param float maxWait: the number of seconds to block, waiting for the first result
+
+        :param int maxJobs: the maximum number of results to return, or None for no limit
+
+        :rtype: list[tuple(str, int, float)]
+        :return: A list of (jobID, exitValue, wallTime) tuples as described in
+                 :meth:`getUpdatedBatchJob`. The list is empty if no result became available.
+        """
+        updatedJobs = []
+        updatedJob = self.getUpdatedBatchJob(maxWait)
+        while updatedJob is not None:
+            updatedJobs.append(updatedJob)
+            if maxJobs is not None and len(updatedJobs) >= maxJobs:
+                break
+            updatedJob = self.getUpdatedBatchJob(0)
+        return updatedJobs
+
+    def wakeUp(self):
+        """
+        Makes a pending or the next call to :meth:`getUpdatedBatchJob` return None without
+        waiting for a result. This lets another thread, e.g. the service manager, interrupt the
+        leader while it is blocked on the batch system. May be called from any thread.
+
+        The default implementation does nothing, in which case the call only returns once a job
+        has updated or maxWait has elapsed. Implementors waiting on a queue of updated jobs
+        typically put a sentinel on it.
+        """
+        pass
+
     @abstractmethod
     def shutdown(self):
         """
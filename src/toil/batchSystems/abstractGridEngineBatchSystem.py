@@ -391,11 +391,17 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
                 item = self.updatedJobsQueue.get(timeout=maxWait)
             except Empty:
                 return None
+            if item is None:
+                # Put there by wakeUp()
+                return None
             logger.debug('UpdatedJobsQueue Item: %s', item)
             jobID, retcode = item
             self.currentJobs.remove(jobID)
             return jobID, retcode, None
 
+    def wakeUp(self):
+        self.updatedJobsQueue.put(None)
+
     def shutdown(self):
         """
         Signals worker to shutdown (via sentinel) then cleanly joins the thread
@@ -260,8 +260,12 @@ class LSFBatchSystem(BatchSystemSupport):
 
     def getUpdatedBatchJob(self, maxWait):
         try:
-            sgeJobID, retcode = self.updatedJobsQueue.get(timeout=maxWait)
+            item = self.updatedJobsQueue.get(timeout=maxWait)
             self.updatedJobsQueue.task_done()
+            if item is None:
+                # Put there by wakeUp()
+                return None
+            sgeJobID, retcode = item
             jobID, retcode = (self.jobIDs[sgeJobID], retcode)
             self.currentjobs -= {self.jobIDs[sgeJobID]}
         except Empty:
@@ -269,6 +273,9 @@ class LSFBatchSystem(BatchSystemSupport):
         else:
             return jobID, retcode, None
 
+    def wakeUp(self):
+        self.updatedJobsQueue.put(None)
+
     def getWaitDuration(self):
         """We give parasol a second to catch its breath (in seconds)
         """
@@ -236,6 +236,9 @@ class MesosBatchSystem(BatchSystemSupport,
                 item = self.updatedJobsQueue.get(timeout=maxWait)
             except Empty:
                 return None
+            if item is None:
+                # Put there by wakeUp()
+                return None
             jobId, exitValue, wallTime = item
             try:
                 self.intendedKill.remove(jobId)
@@ -246,6 +249,9 @@ class MesosBatchSystem(BatchSystemSupport,
             else:
                 log.debug('Job %s ended naturally before it could be killed.', jobId)
 
+    def wakeUp(self):
+        self.updatedJobsQueue.put(None)
+
     def nodeInUse(self, nodeIP):
         return nodeIP in self.hostToJobIDs
 
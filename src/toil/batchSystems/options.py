@@ -56,6 +56,18 @@ def _singleMachineOptions(addOptionFn):
                 help=("When using Toil's importFile function for staging, input files are copied to the job store. "
                       "Specifying this option saves space by hard-linking imported files. As long as caching is "
                       "enabled Toil will protect the file automatically by changing the permissions to read-only."))
+    addOptionFn("--persistentWorkers", dest="persistentWorkers", default=None, action='store_true',
+                help=("Run jobs in processes forked from a pool of long-running worker processes that "
+                      "have already loaded Toil, the job store and the workflow's environment, instead "
+                      "of starting a new worker process for every job. This reduces the overhead of "
+                      "running many short jobs. Only supported with a file job store. Used in "
+                      "singleMachine batch system. default=false"))
+    addOptionFn("--noBackfill", dest="backfill", default=None, action='store_false',
+                help=("Start jobs strictly in the order they were issued, i.e. don't start a job "
+                      "while a job issued before it is waiting for resources. By default, smaller "
+                      "jobs are started around a job that doesn't fit yet, which keeps the machine "
+                      "busy but can delay a large job for as long as smaller ones keep coming. Used "
+                      "in singleMachine batch system. default=false"))
 
 
 def _mesosOptions(addOptionFn):
@@ -110,6 +122,8 @@ def setDefaultOptions(config):
     # single machine
     config.scale = 1
     config.linkImports = False
+    config.persistentWorkers = False
+    config.backfill = True
 
     # mesos
     config.mesosMasterAddress = '%s:5050' % getPublicIP()
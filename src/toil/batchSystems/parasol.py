@@ -269,9 +269,13 @@ class ParasolBatchSystem(BatchSystemSupport):
     def getUpdatedBatchJob(self, maxWait):
         while True:
             try:
-                jobID, status, wallTime = self.updatedJobsQueue.get(timeout=maxWait)
+                item = self.updatedJobsQueue.get(timeout=maxWait)
             except Empty:
                 return None
+            if item is None:
+                # Put there by wakeUp()
+                return None
+            jobID, status, wallTime = item
             try:
                 self.runningJobs.remove(jobID)
             except KeyError:
@@ -280,6 +284,9 @@ class ParasolBatchSystem(BatchSystemSupport):
             else:
                 return jobID, status, wallTime
 
+    def wakeUp(self):
+        self.updatedJobsQueue.put(None)
+
     @classmethod
     def getRescueBatchJobFrequency(cls):
         """
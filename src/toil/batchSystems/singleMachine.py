@@ -19,8 +19,7 @@ standard_library.install_aliases()
 from builtins import str
 from builtins import range
 from builtins import object
-from past.utils import old_div
-from contextlib import contextmanager
+import errno
 import logging
 import multiprocessing
 import os
@@ -28,14 +27,16 @@ import sys
 import subprocess
 import time
 import math
-from threading import Thread
-from threading import Lock, Condition
+from collections import defaultdict, namedtuple
+from threading import Thread, Lock, current_thread
 
 # Python 3 compatibility imports
 from six.moves.queue import Empty, Queue
 
 import toil
+from toil import resolveEntryPoint
 from toil.batchSystems.abstractBatchSystem import BatchSystemSupport
+from toil.common import Toil
 from toil import worker as toil_worker
 
 log = logging.getLogger(__name__)
@@ -60,9 +61,8 @@ class SingleMachineBatchSystem(BatchSystemSupport):
     minCores = 0.1
     """
     The minimal fractional CPU. Tasks with a smaller core requirement will be rounded up to this
-    value. One important invariant of this class is that each worker thread represents a CPU
-    requirement of minCores, meaning that we can never run more than numCores / minCores jobs
-    concurrently.
+    value. Cores are accounted for in units of minCores, meaning that we can never run more than
+    numCores / minCores jobs concurrently.
     """
     physicalMemory = toil.physicalMemory()
 
@@ -85,9 +85,7 @@ class SingleMachineBatchSystem(BatchSystemSupport):
         # squeezing more tasks onto each core (scale < 1) or stretching tasks over more cores
         # (scale > 1).
         self.scale = config.scale
-        # Number of worker threads that will be started
         self.debugWorker = config.debugWorker
-        self.numWorkers = int(old_div(self.maxCores, self.minCores))
         # A counter to generate job IDs and a lock to guard it
         self.jobIndex = 0
         self.jobIndexLock = Lock()
@@ -96,67 +94,79 @@ class SingleMachineBatchSystem(BatchSystemSupport):
         """
         :type: dict[str,toil.job.JobNode]
         """
-        # A queue of jobs waiting to be executed. Consumed by the workers.
-        self.inputQueue = Queue()
-        # A queue of finished jobs. Produced by the workers.
+        # A queue of finished jobs. Produced by the job threads.
         self.outputQueue = Queue()
         # A dictionary mapping IDs of currently running jobs to their Info objects
         self.runningJobs = {}
         """
         :type: dict[str,Info]
         """
-        # The list of worker threads
-        self.workerThreads = []
+        # Jobs waiting for resources to become available, in the order they were issued
+        self.pendingJobs = []
         """
-        :type list[Thread]
+        :type: list[PendingJob]
         """
-        # Variables involved with non-blocking resource acquisition
-        self.acquisitionTimeout = 5
-        self.acquisitionRetryDelay = 10
-        self.aquisitionCondition = Condition()
-
-        # A pool representing available CPU in units of minCores
-        self.coreFractions = ResourcePool(self.numWorkers, 'cores', self.acquisitionTimeout)
+        # The threads running jobs, one per running job
+        self.jobThreads = set()
+        """
+        :type: set[Thread]
+        """
+        # The resources not currently allocated to a running job. Cores are counted in units of
+        # minCores, memory and disk in bytes.
+        self.coreFractions = int(round(self.maxCores / self.minCores))
+        self.memory = self.maxMemory
+        self.disk = self.maxDisk
+        # Guards the pending jobs, the job threads and the available resources
+        self.schedulingLock = Lock()
+        # Whether pending jobs may be started ahead of an earlier one that doesn't fit yet
+        self.backfill = config.backfill
         # A lock to work around the lack of thread-safety in Python's subprocess module
         self.popenLock = Lock()
-        # A pool representing available memory in bytes
-        self.memory = ResourcePool(self.maxMemory, 'memory', self.acquisitionTimeout)
-        # A pool representing the available space in bytes
-        self.disk = ResourcePool(self.maxDisk, 'disk', self.acquisitionTimeout)
-
-        if not self.debugWorker:
-            log.debug('Setting up the thread pool with %i workers, '
-                     'given a minimum CPU fraction of %f '
-                     'and a maximum CPU value of %i.', self.numWorkers, self.minCores, maxCores)
-            for i in range(self.numWorkers):
-                worker = Thread(target=self.worker, args=(self.inputQueue,))
-                self.workerThreads.append(worker)
-                worker.start()
-        else:
+
+        # Whether Toil jobs are run by persistent worker processes instead of a fresh process each
+        self.persistentWorkers = config.persistentWorkers
+        if self.persistentWorkers and Toil.parseLocator(config.jobStore)[0] != 'file':
+            log.warn('Persistent workers are only supported with a file job store. Starting a '
+                     'new worker process for every job instead.')
+            self.persistentWorkers = False
+        # Persistent workers not currently running a job, keyed by the job store locator and
+        # the environment they were started with
+        self.idlePersistentWorkers = defaultdict(list)
+        """
+        :type: dict[tuple,list[PersistentWorker]]
+        """
+        self.persistentWorkersLock = Lock()
+
+        if self.debugWorker:
             log.debug('Started in worker debug mode.')
 
     def _runWorker(self, jobCommand, jobID, environment):
         """
         Run the jobCommand using the worker and wait for it to finish.
         The worker is forked unless it is a '_toil_worker' job and
-        debugWorker is True.
+        debugWorker is True. If persistent workers are enabled, '_toil_worker'
+        jobs are handed to an idle persistent worker instead.
         """
         startTime = time.time()  # Time job is started
         popen = None
         statusCode = None
         forkWorker = not (self.debugWorker and "_toil_worker" in jobCommand)
-        if forkWorker:
-            with self.popenLock:
-                popen = subprocess.Popen(jobCommand,
-                                         shell=True,
-                                         env=dict(os.environ, **environment))
-        else:
-            statusCode = toil_worker.main(jobCommand.split())
-            if statusCode is None:
-                statusCode = 0
-
-        info = Info(time.time(), popen, killIntended=False)
+        persistentWorker = forkWorker and self.persistentWorkers and "_toil_worker" in jobCommand
+        info = Info(startTime, None, killIntended=False)
         try:
+            if persistentWorker:
+                popen = self._runPersistentWorker(jobCommand, environment)
+            elif forkWorker:
+                with self.popenLock:
+                    popen = subprocess.Popen(jobCommand,
+                                             shell=True,
+                                             env=dict(os.environ, **environment))
+            else:
+                statusCode = toil_worker.main(jobCommand.split())
+                if statusCode is None:
+                    statusCode = 0
+
+            info.popen = popen
             self.runningJobs[jobID] = info
             try:
                 if forkWorker:
@@ -168,57 +178,109 @@ class SingleMachineBatchSystem(BatchSystemSupport):
                                   self.jobs[jobID])
             finally:
                 self.runningJobs.pop(jobID)
+        except:
+            # The job couldn't be run. Report it as failed rather than not at all, which would
+            # leave it to be rescued as missing much later.
+            log.exception('Failed to run job %s.', self.jobs[jobID])
+            statusCode = 1
+            raise
         finally:
+            if persistentWorker and popen is not None:
+                self._releasePersistentWorker(popen)
             if statusCode is not None and not info.killIntended:
                 self.outputQueue.put((jobID, statusCode,
                                       time.time() - startTime))
 
-    # Note: The input queue is passed as an argument because the corresponding attribute is reset
-    # to None in shutdown()
-
-    def worker(self, inputQueue):
-        while True:
-            if self.debugWorker and inputQueue.empty():
-                return
-            args = inputQueue.get()
-            if args is None:
-                log.debug('Received queue sentinel.')
-                break
-            jobCommand, jobID, jobCores, jobMemory, jobDisk, environment = args
-            while True:
-                try:
-                    coreFractions = int(old_div(jobCores, self.minCores))
-                    log.debug('Acquiring %i bytes of memory from a pool of %s.', jobMemory,
-                              self.memory)
-                    with self.memory.acquisitionOf(jobMemory):
-                        log.debug('Acquiring %i fractional cores from a pool of %s to satisfy a '
-                                  'request of %f cores', coreFractions, self.coreFractions,
-                                  jobCores)
-                        with self.coreFractions.acquisitionOf(coreFractions):
-                            with self.disk.acquisitionOf(jobDisk):
-                                self._runWorker(jobCommand, jobID, environment)
-
-                except ResourcePool.AcquisitionTimeoutException as e:
-                    log.debug('Could not acquire enough (%s) to run job (%s). Requested: (%s), '
-                              'Avaliable: %s. Sleeping for 10s.', e.resource, jobID, e.requested,
-                              e.available)
-                    with self.aquisitionCondition:
-                        # Make threads sleep for the given delay, or until another job finishes.
-                        # Whichever is sooner.
-                        self.aquisitionCondition.wait(timeout=self.acquisitionRetryDelay)
-                    continue
-                else:
-                    log.debug('Finished job. self.coreFractions ~ %s and self.memory ~ %s',
-                              self.coreFractions.value, self.memory.value)
-                    with self.aquisitionCondition:
-                        # Wake up sleeping threads
-                        self.aquisitionCondition.notifyAll()
-                    break
-        log.debug('Exiting worker thread normally.')
+    def _runPersistentWorker(self, jobCommand, environment):
+        """
+        Hands the given '_toil_worker' job to an idle persistent worker, starting a new persistent
+        worker if there is no idle one.
+
+        :rtype: PersistentWorker
+        """
+        _, jobName, jobStoreLocator, jobStoreID = jobCommand.split()
+        key = (jobStoreLocator, tuple(sorted(environment.items())))
+        persistentWorker = None
+        with self.persistentWorkersLock:
+            idlePersistentWorkers = self.idlePersistentWorkers[key]
+            while idlePersistentWorkers and persistentWorker is None:
+                persistentWorker = idlePersistentWorkers.pop()
+                if not persistentWorker.isAlive():
+                    persistentWorker = None
+        if persistentWorker is not None:
+            try:
+                persistentWorker.runJob(jobName, jobStoreID)
+            except PersistentWorkerError:
+                # The idle worker died after we checked on it. Retry on a fresh one.
+                log.warn('Persistent worker %i failed to start job %s, starting a new one.',
+                         persistentWorker.process.pid, jobStoreID, exc_info=True)
+            else:
+                return persistentWorker
+        with self.popenLock:
+            persistentWorker = PersistentWorker(key, jobStoreLocator, environment)
+        persistentWorker.runJob(jobName, jobStoreID)
+        return persistentWorker
+
+    def _releasePersistentWorker(self, persistentWorker):
+        """
+        Returns a persistent worker that finished running its job to the pool of idle ones.
+
+        :param PersistentWorker persistentWorker:
+        """
+        if persistentWorker.isAlive():
+            with self.persistentWorkersLock:
+                self.idlePersistentWorkers[persistentWorker.key].append(persistentWorker)
+
+    def _schedule(self):
+        """
+        Starts every pending job that fits into the currently available resources, in the order
+        the jobs were issued. Unless backfilling was disabled, a job that doesn't fit does not
+        prevent jobs issued after it from being started, i.e. smaller jobs are backfilled around
+        larger ones. Without backfilling, the first job that doesn't fit holds up all jobs
+        issued after it. Must be called with the scheduling lock held, whenever a job is issued
+        or resources are released.
+        """
+        stillPending = []
+        for pendingJob in self.pendingJobs:
+            if ((self.backfill or not stillPending)
+                and pendingJob.coreFractions <= self.coreFractions
+                and pendingJob.memory <= self.memory
+                and pendingJob.disk <= self.disk):
+                self.coreFractions -= pendingJob.coreFractions
+                self.memory -= pendingJob.memory
+                self.disk -= pendingJob.disk
+                log.debug('Starting job %s. Remaining fractional cores: %i, memory: %i, disk: %i',
+                          pendingJob.jobID, self.coreFractions, self.memory, self.disk)
+                thread = Thread(target=self._runJob, args=(pendingJob,))
+                self.jobThreads.add(thread)
+                thread.start()
+            else:
+                stillPending.append(pendingJob)
+        self.pendingJobs = stillPending
+
+    def _runJob(self, pendingJob):
+        """
+        Runs a job whose resources have been allocated by :meth:`_schedule` and releases them
+        once the job is done, possibly starting other pending jobs.
+
+        :param PendingJob pendingJob:
+        """
+        try:
+            self._runWorker(pendingJob.jobCommand, pendingJob.jobID, pendingJob.environment)
+        finally:
+            with self.schedulingLock:
+                self.coreFractions += pendingJob.coreFractions
+                self.memory += pendingJob.memory
+                self.disk += pendingJob.disk
+                self.jobThreads.discard(current_thread())
+                log.debug('Finished job %s. Available fractional cores: %i, memory: %i, disk: %i',
+                          pendingJob.jobID, self.coreFractions, self.memory, self.disk)
+                self._schedule()
 
     def issueBatchJob(self, jobNode):
         """
-        Adds the command and resources to a queue to be run.
+        Adds the command and resources to the pending jobs and starts it as soon as enough
+        resources are available.
         """
         # Round cores to minCores and apply scale
         cores = math.ceil(jobNode.cores * self.scale / self.minCores) * self.minCores
@@ -237,10 +299,18 @@ class SingleMachineBatchSystem(BatchSystemSupport):
             jobID = self.jobIndex
             self.jobIndex += 1
         self.jobs[jobID] = jobNode.command
-        self.inputQueue.put((jobNode.command, jobID, cores, jobNode.memory,
-                             jobNode.disk, self.environment.copy()))
         if self.debugWorker:  # then run immediately, blocking for return
-            self.worker(self.inputQueue)
+            self._runWorker(jobNode.command, jobID, self.environment.copy())
+        else:
+            pendingJob = PendingJob(jobCommand=jobNode.command,
+                                    jobID=jobID,
+                                    coreFractions=int(round(cores / self.minCores)),
+                                    memory=jobNode.memory,
+                                    disk=jobNode.disk,
+                                    environment=self.environment.copy())
+            with self.schedulingLock:
+                self.pendingJobs.append(pendingJob)
+                self._schedule()
         return jobID
 
     def killBatchJobs(self, jobIDs):
@@ -248,6 +318,18 @@ class SingleMachineBatchSystem(BatchSystemSupport):
         Kills jobs by ID
         """
         log.debug('Killing jobs: {}'.format(jobIDs))
+        with self.schedulingLock:
+            # Jobs that haven't been started yet can simply be dropped
+            killedJobIDs = set(jobIDs)
+            stillPending = []
+            for pendingJob in self.pendingJobs:
+                if pendingJob.jobID in killedJobIDs:
+                    self.jobs.pop(pendingJob.jobID)
+                else:
+                    stillPending.append(pendingJob)
+            self.pendingJobs = stillPending
+            # Without backfilling, a killed job may have held up others
+            self._schedule()
         for jobID in jobIDs:
             if jobID in self.runningJobs:
                 info = self.runningJobs[jobID]
@@ -268,16 +350,18 @@ class SingleMachineBatchSystem(BatchSystemSupport):
 
     def shutdown(self):
         """
-        Cleanly terminate worker threads. Add sentinels to inputQueue equal to maxThreads. Join
-        all worker threads.
+        Drops all pending jobs and waits for the running ones to finish.
         """
-        # Remove reference to inputQueue (raises exception if inputQueue is used after method call)
-        inputQueue = self.inputQueue
-        self.inputQueue = None
-        for i in range(self.numWorkers):
-            inputQueue.put(None)
-        for thread in self.workerThreads:
+        with self.schedulingLock:
+            self.pendingJobs = []
+            jobThreads = list(self.jobThreads)
+        for thread in jobThreads:
             thread.join()
+        with self.persistentWorkersLock:
+            for persistentWorkers in self.idlePersistentWorkers.values():
+                for persistentWorker in persistentWorkers:
+                    persistentWorker.shutdown()
+            self.idlePersistentWorkers.clear()
         BatchSystemSupport.workerCleanup(self.workerCleanupInfo)
 
     def getUpdatedBatchJob(self, maxWait):
@@ -288,11 +372,17 @@ class SingleMachineBatchSystem(BatchSystemSupport):
             item = self.outputQueue.get(timeout=maxWait)
         except Empty:
             return None
+        if item is None:
+            # Put there by wakeUp()
+            return None
         jobID, exitValue, wallTime = item
         jobCommand = self.jobs.pop(jobID)
         log.debug("Ran jobID: %s with exit value: %i", jobID, exitValue)
         return jobID, exitValue, wallTime
 
+    def wakeUp(self):
+        self.outputQueue.put(None)
+
     @classmethod
     def getRescueBatchJobFrequency(cls):
         """
@@ -303,7 +393,14 @@ class SingleMachineBatchSystem(BatchSystemSupport):
     @classmethod
     def setOptions(cls, setOption):
         setOption("scale", default=1)
-        
+        setOption("persistentWorkers", default=False)
+        setOption("backfill", default=True)
+
+
+PendingJob = namedtuple('PendingJob', ('jobCommand', 'jobID', 'coreFractions', 'memory', 'disk',
+                                       'environment'))
+
+
 class Info(object):
     # Can't use namedtuple here since killIntended needs to be mutable
     def __init__(self, startTime, popen, killIntended):
@@ -312,74 +409,79 @@ class Info(object):
         self.killIntended = killIntended
 
 
-class ResourcePool(object):
-    def __init__(self, initial_value, resourceType, timeout):
-        super(ResourcePool, self).__init__()
-        self.condition = Condition()
-        self.value = initial_value
-        self.resourceType = resourceType
-        self.timeout = timeout
-
-    def acquire(self, amount):
-        with self.condition:
-            startTime = time.time()
-            while amount > self.value:
-                if time.time() - startTime >= self.timeout:
-                    # This means the thread timed out waiting for the resource.  We exit the nested
-                    # context managers in worker to prevent blocking of a resource due to
-                    # unavailability of a nested resource request.
-                    raise self.AcquisitionTimeoutException(resource=self.resourceType,
-                                                           requested=amount, available=self.value)
-                # Allow 5 seconds to get the resource, else quit through the above if condition.
-                # This wait + timeout is the last thing in the loop such that a request that takes
-                # longer than 5s due to multiple wakes under the 5 second threshold are still
-                # honored.
-                self.condition.wait(timeout=self.timeout)
-            self.value -= amount
-            self.__validate()
-
-    def release(self, amount):
-        with self.condition:
-            self.value += amount
-            self.__validate()
-            self.condition.notifyAll()
-
-    def __validate(self):
-        assert 0 <= self.value
-
-    def __str__(self):
-        return str(self.value)
-
-    def __repr__(self):
-        return "ResourcePool(%i)" % self.value
-
-    @contextmanager
-    def acquisitionOf(self, amount):
-        self.acquire(amount)
-        try:
-            yield
-        finally:
-            self.release(amount)
+class PersistentWorker(object):
+    """
+    A persistent worker process, see :func:`toil.worker.persistentMain`. It runs one job at a
+    time and, while doing so, stands in for the subprocess.Popen object of that job, i.e. its pid
+    attribute is the ID of the process running the job and its wait() method waits for the job
+    to finish.
+    """
+
+    def __init__(self, key, jobStoreLocator, environment):
+        self.key = key
+        self.process = subprocess.Popen([resolveEntryPoint('_toil_persistent_worker'),
+                                         jobStoreLocator],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        env=dict(os.environ, **environment),
+                                        close_fds=True)
+        self.pid = None
+
+    def runJob(self, jobName, jobStoreID):
+        """
+        Asks the persistent worker to run the given job and waits for the job to be started.
 
-    class AcquisitionTimeoutException(Exception):
+        :raises PersistentWorkerError: if the persistent worker failed to start the job, in
+                which case it is terminated
         """
-        To be raised when a resource request times out.
+        try:
+            self.process.stdin.write('%s %s\n' % (jobName, jobStoreID))
+            self.process.stdin.flush()
+            reply = self.process.stdout.readline()
+        except IOError as e:
+            if e.errno != errno.EPIPE:
+                raise
+            reply = ''
+        try:
+            self.pid = int(reply)
+        except ValueError:
+            self.kill()
+            raise PersistentWorkerError('Persistent worker %i replied %r when asked to run job '
+                                        '%s and exited with status %s.' %
+                                        (self.process.pid, reply, jobStoreID,
+                                         self.process.returncode))
+
+    def wait(self):
         """
+        Waits for the current job to finish and returns its exit status.
 
-        def __init__(self, resource, requested, available):
-            """
-            Creates an instance of this exception that indicates which resource is insufficient for
-            current demands, as well as the amount requested and amount actually available.
+        :rtype: int
+        """
+        reply = self.process.stdout.readline()
+        if reply:
+            return int(reply)
+        else:
+            # The persistent worker itself went away while running the job
+            statusCode = self.process.wait()
+            log.warn('Persistent worker %i exited with status %i while running a job.',
+                     self.process.pid, statusCode)
+            return statusCode or 1
 
-            :param str resource: string representing the resource type
+    def isAlive(self):
+        return self.process.poll() is None
 
-            :param int|float requested: the amount of the particular resource requested that resulted
-                   in this exception
+    def kill(self):
+        if self.isAlive():
+            self.process.kill()
+        self.process.wait()
 
-            :param int|float available: amount of the particular resource actually available
-            """
-            self.requested = requested
-            self.available = available
-            self.resource = resource
+    def shutdown(self):
+        self.process.stdin.close()
+        self.process.wait()
 
 
+class PersistentWorkerError(Exception):
+    """
+    Raised when a persistent worker fails to start a job.
+    """
+    pass
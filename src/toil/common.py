@@ -124,6 +124,8 @@ class Config(object):
 
         #Misc
         self.disableCaching = False
+        self.cacheEvictionPolicy = 'lru'
+        self.deduplicateFiles = False
         self.maxLogFileSize = 64000
         self.writeLogs = None
         self.writeLogsGzip = None
@@ -131,6 +133,8 @@ class Config(object):
         self.cseKey = None
         self.servicePollingInterval = 60
         self.useAsync = True
+        self.asyncWriteThreads = 2
+        self.asyncWriteBufferSize = 4294967296
 
         #Debug options
         self.debugWorker = False
@@ -166,7 +170,7 @@ class Config(object):
 
         def parseJobStore(s):
             name, rest = Toil.parseLocator(s)
-            if name == 'file':
+            if name in ('file', 'sqlite'):
                 # We need to resolve relative paths early, on the leader, because the worker process
                 # may have a different working directory than the leader, e.g. under Mesos.
                 return Toil.buildLocator(name, os.path.abspath(rest))
@@ -258,6 +262,8 @@ class Config(object):
 
         #Misc
         setOption("disableCaching")
+        setOption("cacheEvictionPolicy")
+        setOption("deduplicateFiles")
         setOption("maxLogFileSize", h2b, iC(1))
         setOption("writeLogs")
         setOption("writeLogsGzip")
@@ -268,6 +274,8 @@ class Config(object):
         setOption("sseKey", checkFn=checkSse)
         setOption("cseKey", checkFn=checkSse)
         setOption("servicePollingInterval", float, fC(0.0))
+        setOption("asyncWriteThreads", int, iC(1))
+        setOption("asyncWriteBufferSize", h2b, iC(1))
 
         #Debug options
         setOption("debugWorker")
@@ -509,6 +517,24 @@ def _addOptions(addGroupFn, config):
                 help='Disables caching in the file store. This flag must be set to use '
                      'a batch system that does not support caching such as Grid Engine, Parasol, '
                      'LSF, or Slurm')
+    addOptionFn('--cacheEvictionPolicy', dest='cacheEvictionPolicy', default=None,
+                choices=['lru', 'gdsf'],
+                help="The order in which files are evicted from the cache on a node when space is "
+                     "needed. 'lru' evicts the least recently used files first, 'gdsf' evicts "
+                     "files accessed rarely relative to their size first, keeping small, "
+                     "frequently read files. Default is %s" % config.cacheEvictionPolicy)
+    addOptionFn('--deduplicateFiles', dest='deduplicateFiles', action='store_true', default=None,
+                help="Store a single copy of files with identical contents in the job store and "
+                     "in the cache. Only the file job store deduplicates files.")
+    addOptionFn('--asyncWriteThreads', dest='asyncWriteThreads', default=None, metavar='INT',
+                help="The number of threads with which a job writes files to the job store in the "
+                     "background when caching is enabled. Default is %i" % config.asyncWriteThreads)
+    addOptionFn('--asyncWriteBufferSize', dest='asyncWriteBufferSize', default=None, metavar='INT',
+                help="The most bytes of files a job may have waiting to be written to the job "
+                     "store in the background. Writing another file blocks the job until enough "
+                     "of them are written. Standard suffixes like K, Ki, M, Mi, G or Gi are "
+                     "supported. Default is %s" % bytes2human(config.asyncWriteBufferSize,
+                                                             symbols='iec'))
     addOptionFn("--maxLogFileSize", dest="maxLogFileSize", default=None,
                 help=("The maximum size of a job log file to keep (in bytes), log files "
                       "larger than this will be truncated to the last X bytes. Setting "
@@ -804,6 +830,9 @@ class Toil(object):
         if name == 'file':
             from toil.jobStores.fileJobStore import FileJobStore
             return FileJobStore(rest)
+        elif name == 'sqlite':
+            from toil.jobStores.sqliteJobStore import SQLiteJobStore
+            return SQLiteJobStore(rest)
         elif name == 'aws':
             from bd2k.util.ec2.credentials import enable_metadata_credential_caching
             from toil.jobStores.aws.jobStore import AWSJobStore
@@ -960,6 +989,12 @@ class Toil(object):
     def _cacheAllJobs(self):
         """
         Downloads all jobs in the current job store into self.jobCache.
+
+        The job store loads the jobs concurrently or in bulk, but the cache itself holds every
+        job in memory. This is deliberate: both the job store cleanup on restart and the
+        leader's ToilState need random access to the whole job graph, and the cleanup also has
+        to enumerate the jobs that are not reachable from the root. Loading them piecemeal
+        instead would bound memory at the cost of one round trip per job.
         """
         logger.info('Caching all jobs in job store')
         self._jobCache = {jobGraph.jobStoreID: jobGraph for jobGraph in self._jobStore.jobs()}
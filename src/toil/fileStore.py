@@ -31,16 +31,19 @@ import errno
 import logging
 import os
 import shutil
+import sqlite3
 import stat
 import tempfile
+import threading
 import time
 import uuid
 
 from contextlib import contextmanager
-from fcntl import flock, LOCK_EX, LOCK_UN
+from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_SH
 from functools import partial
 from hashlib import sha1
-from threading import Thread, Semaphore, Event
+from multiprocessing.pool import ThreadPool
+from threading import Thread, Semaphore, Event, Condition
 
 # Python 3 compatibility imports
 from six.moves.queue import Empty, Queue
@@ -106,6 +109,8 @@ class FileStore(with_metaclass(ABCMeta, object)):
     _pendingFileWritesLock = Semaphore()
     _pendingFileWrites = set()
     _terminateEvent = Event()  # Used to signify crashes in threads
+    # The most files downloaded at a time by readGlobalFiles() and prefetchGlobalFiles()
+    maxConcurrentReads = 8
 
     def __init__(self, jobStore, jobGraph, localTempDir, inputBlockFn):
         self.jobStore = jobStore
@@ -117,6 +122,8 @@ class FileStore(with_metaclass(ABCMeta, object)):
         self.loggingMessages = []
         self.filesToDelete = set()
         self.jobsToDelete = set()
+        # The threads downloading files in the background, created when first needed
+        self._readPool = None
 
     @staticmethod
     def createFileStore(jobStore, jobGraph, localTempDir, inputBlockFn, caching):
@@ -218,6 +225,55 @@ class FileStore(with_metaclass(ABCMeta, object)):
         """
         raise NotImplementedError()
 
+    def readGlobalFiles(self, fileStoreIDs, cache=True, mutable=None):
+        """
+        Downloads several files from the file store to the local directory, at most
+        maxConcurrentReads at a time. See :meth:`readGlobalFile`.
+
+        :param list[toil.fileStore.FileID] fileStoreIDs: job store ids for the files
+        :param bool cache: see :meth:`readGlobalFile`, applies to all the files
+        :param bool mutable: see :meth:`readGlobalFile`, applies to all the files
+        :return: Absolute paths to local, temporary copies of the files, in the order of
+                 fileStoreIDs
+        :rtype: list[str]
+        """
+        return [download.get() for download in self.prefetchGlobalFiles(fileStoreIDs,
+                                                                        cache=cache,
+                                                                        mutable=mutable)]
+
+    def prefetchGlobalFiles(self, fileStoreIDs, cache=True, mutable=None):
+        """
+        Starts downloading several files from the file store to the local directory in the
+        background, at most maxConcurrentReads at a time, and returns without waiting for them.
+        Each file is downloaded with :meth:`readGlobalFile`, so the cache is populated as usual
+        and a later readGlobalFile() of a file that was prefetched into the cache is a cache
+        hit. Downloads that are still running when the job finishes are waited for.
+
+        :param list[toil.fileStore.FileID] fileStoreIDs: job store ids for the files
+        :param bool cache: see :meth:`readGlobalFile`, applies to all the files
+        :param bool mutable: see :meth:`readGlobalFile`, applies to all the files
+        :return: An object for each file, in the order of fileStoreIDs. Its ready() method
+                 tells whether the download has completed and its get() method waits for the
+                 download to complete and returns the absolute path to the local copy of the
+                 file, or raises the exception that made the download fail.
+        :rtype: list[multiprocessing.pool.AsyncResult]
+        """
+        if self._readPool is None:
+            self._readPool = ThreadPool(self.maxConcurrentReads)
+        return [self._readPool.apply_async(self.readGlobalFile, (fileStoreID,),
+                                           dict(cache=cache, mutable=mutable))
+                for fileStoreID in fileStoreIDs]
+
+    def _waitForPrefetches(self):
+        """
+        Waits for the downloads started by prefetchGlobalFiles() to complete. Must be called
+        before the job's local files are cleaned up.
+        """
+        if self._readPool is not None:
+            self._readPool.close()
+            self._readPool.join()
+            self._readPool = None
+
     @abstractmethod
     def readGlobalFileStream(self, fileStoreID):
         """
@@ -272,55 +328,6 @@ class FileStore(with_metaclass(ABCMeta, object)):
         else:
             return os.path.join(self.localTempDir, filePath)
 
-    class _StateFile(object):
-        """
-        Utility class to read and write dill-ed state dictionaries from/to a file into a namespace.
-        """
-        def __init__(self, stateDict):
-            assert isinstance(stateDict, dict)
-            self.__dict__.update(stateDict)
-
-        @abstractclassmethod
-        @contextmanager
-        def open(cls, outer=None):
-            """
-            This is a context manager that state file and reads it into an object that is returned
-            to the user in the yield.
-
-            :param outer: Instance of the calling class (to use outer methods).
-            """
-            raise NotImplementedError()
-
-        @classmethod
-        def _load(cls, fileName):
-            """
-            Load the state of the cache from the state file
-
-            :param str fileName: Path to the cache state file.
-            :return: An instance of the state as a namespace.
-            :rtype: _StateFile
-            """
-            # Read the value from the cache state file then initialize and instance of
-            # _CacheState with it.
-            with open(fileName, 'r') as fH:
-                infoDict = dill.load(fH)
-            return cls(infoDict)
-
-        def write(self, fileName):
-            """
-            Write the current state into a temporary file then atomically rename it to the main
-            state file.
-
-            :param str fileName: Path to the state file.
-            """
-            with open(fileName + '.tmp', 'w') as fH:
-                # Based on answer by user "Mark" at:
-                # http://stackoverflow.com/questions/2709800/how-to-pickle-yourself
-                # We can't pickle nested classes. So we have to pickle the variables of the class
-                # If we ever change this, we need to ensure it doesn't break FileID
-                dill.dump(self.__dict__, fH)
-            os.rename(fileName + '.tmp', fileName)
-
     # Methods related to the deferred function logic
     @abstractclassmethod
     def findAndHandleDeadJobs(cls, nodeInfo, batchSystemShutdown=False):
@@ -430,12 +437,23 @@ class CachingFileStore(FileStore):
     A cache-enabled file store that attempts to use hard-links and asynchronous job store writes to
     reduce I/O between, and during jobs.
     """
+    # The number of bytes the asyncWrite threads copy to the job store at a time
+    asyncWriteChunkSize = 1 << 20
 
     def __init__(self, jobStore, jobGraph, localTempDir, inputBlockFn):
         super(CachingFileStore, self).__init__(jobStore, jobGraph, localTempDir, inputBlockFn)
         # Variables related to asynchronous writes.
-        self.workerNumber = 2
+        self.workerNumber = self.jobStore.config.asyncWriteThreads
         self.queue = Queue()
+        # The number of bytes in the files queued for or being written by the asyncWrite
+        # threads. Once it would exceed asyncWriteBufferSize, writeGlobalFile() blocks until
+        # enough of them are done, see _reserveAsyncWrite().
+        self._asyncWriteCondition = Condition()
+        self._asyncWriteBytes = 0
+        # Maps the ID of each file being written asynchronously to a list of the number of
+        # bytes written so far and the size of the file
+        self._asyncWriteProgress = {}
+        self._asyncWriteStatistics = dict(files=0, bytes=0, seconds=0.0)
         self.updateSemaphore = Semaphore()
         self.mutable = self.jobStore.config.readGlobalFileMutableByDefault
         self.workers = [Thread(target=self.asyncWrite) for i in range(self.workerNumber)]
@@ -447,12 +465,15 @@ class CachingFileStore(FileStore):
         # directory.
         self.localCacheDir = os.path.join(os.path.dirname(localTempDir),
                                           cacheDirName(self.jobStore.config.workflowID))
-        self.cacheLockFile = os.path.join(self.localCacheDir, '.cacheLock')
         self.cacheStateFile = os.path.join(self.localCacheDir, '_cacheState')
+        # The state of the cache shared by all jobs on this node, see _setupCache()
+        self._cacheState = None
         # Since each worker has it's own unique CachingFileStore instance, and only one Job can run
         # at a time on a worker, we can bookkeep the job's file store operated files in a
-        # dictionary.
-        self.jobSpecificFiles = {}
+        # dictionary. jobSpecificFiles maps each job store file ID to the local paths of the file
+        # and their sizes, filesToFSIDs maps each local path to the job store file IDs using it.
+        self.jobSpecificFiles = defaultdict(partial(defaultdict, int))
+        self.filesToFSIDs = defaultdict(set)
         self.jobName = str(self.jobGraph)
         self.jobID = sha1(self.jobName).hexdigest()
         logger.info('Starting job (%s) with ID (%s).', self.jobName, self.jobID)
@@ -475,25 +496,29 @@ class CachingFileStore(FileStore):
         startingDir = os.getcwd()
         self.localTempDir = makePublicDir(os.path.join(self.localTempDir, str(uuid.uuid4())))
         # Check the status of all jobs on this node. If there are jobs that started and died before
-        # cleaning up their presence from the cache state file, restore the cache file to a state
+        # cleaning up their presence from the cache state, restore the cache state to a state
         # where the jobs don't exist.
-        with self._CacheState.open(self) as cacheInfo:
-            self.findAndHandleDeadJobs(cacheInfo)
-            # While we have a lock on the cache file, run a naive check to see if jobs on this node
-            # have greatly gone over their requested limits.
-            if cacheInfo.sigmaJob < 0:
-                logger.warning('Detecting that one or more jobs on this node have used more '
-                               'resources than requested.  Turn on debug logs to see more'
-                               'information on cache usage.')
+        self.findAndHandleDeadJobs(self._cacheState)
+        # Run a naive check to see if jobs on this node have greatly gone over their requested
+        # limits.
+        if self._cacheState.sigmaJob < 0:
+            logger.warning('Detecting that one or more jobs on this node have used more '
+                           'resources than requested.  Turn on debug logs to see more'
+                           'information on cache usage.')
         # Get the requirements for the job and clean the cache if necessary. cleanCache will
-        # ensure that the requirements for this job are stored in the state file.
+        # ensure that the requirements for this job are stored in the cache state.
         jobReqs = job.disk
         # Cleanup the cache to free up enough space for this job (if needed)
         self.cleanCache(jobReqs)
+        # Start downloading the files the job declared as its inputs into the cache, so they are
+        # transferred while the job is being set up rather than when the job reads them
+        if job.inputFiles:
+            self.prefetchGlobalFiles(job.inputFiles, mutable=False)
         try:
             os.chdir(self.localTempDir)
             yield
         finally:
+            self._waitForPrefetches()
             diskUsed = getDirSizeRecursively(self.localTempDir)
             logString = ("Job {jobName} used {percent:.2f}% ({humanDisk}B [{disk}B] used, "
                          "{humanRequestedDisk}B [{requestedDisk}B] requested) at the end of "
@@ -513,15 +538,16 @@ class CachingFileStore(FileStore):
             os.chdir(startingDir)
             self.cleanupInProgress = True
             # Delete all the job specific files and return sizes to jobReqs
-            self.returnJobReqs(jobReqs)
-            with self._CacheState.open(self) as cacheInfo:
-                # Carry out any user-defined cleanup actions
-                deferredFunctions = cacheInfo.jobState[self.jobID]['deferredFunctions']
-                failures = self._runDeferredFunctions(deferredFunctions)
-                for failure in failures:
-                    self.logToMaster('Deferred function "%s" failed.' % failure, logging.WARN)
-                # Finally delete the job from the cache state file
-                cacheInfo.jobState.pop(self.jobID)
+            self.returnJobReqs()
+            # Carry out any user-defined cleanup actions
+            deferredFunctions = self._cacheState.jobState(self.jobID)['deferredFunctions']
+            failures = self._runDeferredFunctions(deferredFunctions)
+            for failure in failures:
+                self.logToMaster('Deferred function "%s" failed.' % failure, logging.WARN)
+            # Finally delete the job from the cache state
+            self._cacheState.removeJob(self.jobID)
+            logger.debug('CACHE: %(hits)i hits, %(misses)i misses and %(evictions)i evictions '
+                         'on this node so far.', self.cacheStatistics())
 
     # Functions related to reading, writing and removing files to/from the job store
     def writeGlobalFile(self, localFileName, cleanup=False):
@@ -534,14 +560,12 @@ class CachingFileStore(FileStore):
         cleanupID = None if not cleanup else self.jobGraph.jobStoreID
         # If the file is from the scope of local temp dir
         if absLocalFileName.startswith(self.localTempDir):
-            # If the job store is of type FileJobStore and the job store and the local temp dir
-            # are on the same file system, then we want to hard link the files istead of copying
-            # barring the case where the file being written was one that was previously read
-            # from the file store. In that case, you want to copy to the file store so that
-            # the two have distinct nlink counts.
-            # Can read without a lock because we're only reading job-specific info.
-            jobSpecificFiles = list(self._CacheState._load(self.cacheStateFile).jobState[
-                self.jobID]['filesToFSIDs'].keys())
+            # If the job store keeps files as plain local files and the job store and the local
+            # temp dir are on the same file system, then we want to hard link the files istead
+            # of copying barring the case where the file being written was one that was
+            # previously read from the file store. In that case, you want to copy to the file
+            # store so that the two have distinct nlink counts.
+            jobSpecificFiles = list(self.filesToFSIDs.keys())
             # Saying nlink is 2 implicitly means we are using the job file store, and it is on
             # the same device as the work dir.
             if self.nlinkThreshold == 2 and absLocalFileName not in jobSpecificFiles:
@@ -552,8 +576,11 @@ class CachingFileStore(FileStore):
                 os.link(absLocalFileName, self.jobStore._getAbsPath(jobStoreFileID))
             # If they're not on the file system, or if the file is already linked with an
             # existing file, we need to copy to the job store.
-            # Check if the user allows asynchronous file writes
-            elif self.jobStore.config.useAsync:
+            # Check if the user allows asynchronous file writes. A deduplicated file is named
+            # by its contents, so it must be written before its ID can be handed out.
+            elif self.jobStore.config.useAsync and not self.jobStore.config.deduplicateFiles:
+                fileSize = os.stat(absLocalFileName).st_size
+                self._reserveAsyncWrite(fileSize)
                 jobStoreFileID = self.jobStore.getEmptyFileStoreID(cleanupID)
                 # Before we can start the async process, we should also create a dummy harbinger
                 # file in the cache such that any subsequent jobs asking for this file will not
@@ -570,7 +597,8 @@ class CachingFileStore(FileStore):
                 # A file handle added to the queue allows the asyncWrite threads to remove their
                 # jobID from _pendingFileWrites. Therefore, a file should only be added after
                 # its fileID is added to _pendingFileWrites
-                self.queue.put((fileHandle, jobStoreFileID))
+                self._asyncWriteProgress[jobStoreFileID] = [0, fileSize]
+                self.queue.put((fileHandle, jobStoreFileID, fileSize))
             # Else write directly to the job store.
             else:
                 jobStoreFileID = self.jobStore.writeFile(absLocalFileName, cleanupID)
@@ -579,14 +607,12 @@ class CachingFileStore(FileStore):
             if absLocalFileName not in jobSpecificFiles:
                 self.addToCache(absLocalFileName, jobStoreFileID, 'write')
             else:
-                self._JobState.updateJobSpecificFiles(self, jobStoreFileID, absLocalFileName,
-                                                      0.0, False)
+                self.addToJobSpecFiles(jobStoreFileID, absLocalFileName, 0.0, False)
         # Else write directly to the job store.
         else:
             jobStoreFileID = self.jobStore.writeFile(absLocalFileName, cleanupID)
             # Non local files are NOT cached by default, but they are tracked as local files.
-            self._JobState.updateJobSpecificFiles(self, jobStoreFileID, None,
-                                                  0.0, False)
+            self.addToJobSpecFiles(jobStoreFileID, None, 0.0, False)
         return FileID.forPath(jobStoreFileID, absLocalFileName)
 
     def writeGlobalFileStream(self, cleanup=False):
@@ -637,94 +663,155 @@ class CachingFileStore(FileStore):
         else:
             localFilePath = self.getLocalTempFileName()
             fileIsLocal = True
-        # First check whether the file is in cache.  If it is, then hardlink the file to
-        # userPath. Cache operations can only occur on local files.
-        with self.cacheLock() as lockFileHandle:
-            if fileIsLocal and self._fileIsCached(fileStoreID):
+        # Cache operations can only occur on local files. None of them holds a lock on the cache
+        # while a file is being transferred, other jobs on the node are excluded from
+        # downloading the same file by the harbinger file alone.
+        while fileIsLocal:
+            # First check whether the file is in cache.  If it is, then hardlink the file to
+            # userPath.
+            if self._linkFromCache(fileStoreID, localFilePath, mutable):
                 logger.debug('CACHE: Cache hit on file with ID \'%s\'.' % fileStoreID)
-                assert not os.path.exists(localFilePath)
-                if mutable:
-                    shutil.copyfile(cachedFileName, localFilePath)
-                    cacheInfo = self._CacheState._load(self.cacheStateFile)
-                    jobState = self._JobState(cacheInfo.jobState[self.jobID])
-                    jobState.addToJobSpecFiles(fileStoreID, localFilePath, -1, None)
-                    cacheInfo.jobState[self.jobID] = jobState.__dict__
-                    cacheInfo.write(self.cacheStateFile)
-                else:
-                    os.link(cachedFileName, localFilePath)
-                    self.returnFileSize(fileStoreID, localFilePath, lockFileHandle,
-                                        fileAlreadyCached=True)
+                return localFilePath
             # If the file is not in cache, check whether the .harbinger file for the given
             # FileStoreID exists.  If it does, the wait and periodically check for the removal
             # of the file and the addition of the completed download into cache of the file by
-            # the other job. Then we link to it.
-            elif fileIsLocal and harbingerFile.exists():
-                harbingerFile.waitOnDownload(lockFileHandle)
-                # If the code reaches here, the harbinger file has been removed. This means
-                # either the file was successfully downloaded and added to cache, or something
-                # failed. To prevent code duplication, we recursively call readGlobalFile.
-                flock(lockFileHandle, LOCK_UN)
-                return self.readGlobalFile(fileStoreID, userPath=userPath, cache=cache,
-                                           mutable=mutable)
+            # the other job. Then we look in the cache again.
+            if harbingerFile.exists():
+                harbingerFile.waitOnDownload()
+            elif not cache:
+                break
             # If the file is not in cache, then download it to the userPath and then add to
-            # cache if specified.
-            else:
-                logger.debug('CACHE: Cache miss on file with ID \'%s\'.' % fileStoreID)
-                if fileIsLocal and cache:
-                    # If caching of the downloaded file is desired, First create the harbinger
-                    # file so other jobs know not to redundantly download the same file.  Write
-                    # the PID of this process into the file so other jobs know who is carrying
-                    # out the download.
-                    harbingerFile.write()
-                    # Now release the file lock while the file is downloaded as download could
-                    # take a while.
-                    flock(lockFileHandle, LOCK_UN)
-                    # Use try:finally: so that the .harbinger file is removed whether the
-                    # download succeeds or not.
-                    try:
-                        self.jobStore.readFile(fileStoreID,
-                                               '/.'.join(os.path.split(cachedFileName)))
-                    except:
-                        if os.path.exists('/.'.join(os.path.split(cachedFileName))):
-                            os.remove('/.'.join(os.path.split(cachedFileName)))
-                        raise
-                    else:
-                        # If the download succeded, officially add the file to cache (by
-                        # recording it in the cache lock file) if possible.
-                        if os.path.exists('/.'.join(os.path.split(cachedFileName))):
-                            os.rename('/.'.join(os.path.split(cachedFileName)), cachedFileName)
-                            self.addToCache(localFilePath, fileStoreID, 'read', mutable)
-                            # We don't need to return the file size here because addToCache
-                            # already does it for us
-                    finally:
-                        # In any case, delete the harbinger file.
-                        harbingerFile.delete()
-                else:
-                    # Release the cache lock since the remaining stuff is not cache related.
-                    flock(lockFileHandle, LOCK_UN)
-                    self.jobStore.readFile(fileStoreID, localFilePath)
-                    os.chmod(localFilePath, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
-                    # Now that we have the file, we have 2 options. It's modifiable or not.
-                    # Either way, we need to account for FileJobStore making links instead of
-                    # copies.
-                    if mutable:
-                        if self.nlinkThreshold == 2:
-                            # nlinkThreshold can only be 1 or 2 and it can only be 2 iff the
-                            # job store is FilejobStore, and the job store and local temp dir
-                            # are on the same device. An atomic rename removes the nlink on the
-                            # file handle linked from the job store.
-                            shutil.copyfile(localFilePath, localFilePath + '.tmp')
-                            os.rename(localFilePath + '.tmp', localFilePath)
-                        self._JobState.updateJobSpecificFiles(self, fileStoreID, localFilePath,
-                                                              -1, False)
-                    # If it was immutable
-                    else:
-                        if self.nlinkThreshold == 2:
-                            self._accountForNlinkEquals2(localFilePath)
-                        self._JobState.updateJobSpecificFiles(self, fileStoreID, localFilePath,
-                                                              0.0, False)
+            # cache. First create the harbinger file so other jobs know not to redundantly
+            # download the same file. Only one job can create it, every other job waits for
+            # that one.
+            elif harbingerFile.write():
+                # Use try:finally: so that the .harbinger file is removed whether the download
+                # succeeds or not.
+                try:
+                    # The file may have been added to the cache since we last looked
+                    if not self._fileIsCached(fileStoreID):
+                        logger.debug('CACHE: Cache miss on file with ID \'%s\'.' % fileStoreID)
+                        self._cacheState.recordMisses()
+                        self._downloadToCache(fileStoreID, localFilePath, mutable)
+                        return localFilePath
+                finally:
+                    # In any case, delete the harbinger file.
+                    harbingerFile.delete()
+        # If the file is not to be cached, download it straight to the userPath.
+        logger.debug('CACHE: Cache miss on file with ID \'%s\'.' % fileStoreID)
+        self._cacheState.recordMisses()
+        self.jobStore.readFile(fileStoreID, localFilePath)
+        # Now that we have the file, we have 2 options. It's modifiable or not.
+        # Either way, we need to account for the job store making links instead of
+        # copies.
+        if mutable:
+            if self.nlinkThreshold == 2:
+                # nlinkThreshold can only be 1 or 2 and it can only be 2 iff the
+                # job store keeps files as plain local files, and the job store and local
+                # temp dir are on the same device. An atomic rename removes the nlink on the
+                # file handle linked from the job store, leaving the job store's copy alone.
+                shutil.copyfile(localFilePath, localFilePath + '.tmp')
+                os.rename(localFilePath + '.tmp', localFilePath)
+            self.addToJobSpecFiles(fileStoreID, localFilePath, -1, False)
+        # If it was immutable
+        else:
+            os.chmod(localFilePath, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            if self.nlinkThreshold == 2:
+                self._accountForNlinkEquals2(localFilePath)
+            self.addToJobSpecFiles(fileStoreID, localFilePath, 0.0, False)
         return localFilePath
 
+    def _linkFromCache(self, fileStoreID, localFilePath, mutable):
+        """
+        Links the cached copy of the given file to the given local path, or copies it there if
+        the local copy is to be mutable, and records the local copy in the job's state.
+
+        :param str fileStoreID: job store ID of the file
+        :param str localFilePath: the path to link or copy the file to
+        :param bool mutable: see readGlobalFile
+        :return: False if the file is not in the cache, True otherwise
+        :rtype: bool
+        """
+        cachedFile = self.encodedFileID(fileStoreID)
+        if mutable:
+            # Copy from an open handle so it doesn't matter if the cached copy is evicted while
+            # the copy is made. The copy isn't accounted for by the cache.
+            try:
+                cachedFileHandle = open(cachedFile, 'r')
+            except IOError as err:
+                if err.errno == errno.ENOENT:
+                    return False
+                raise
+            with cachedFileHandle:
+                with open(localFilePath, 'w') as localFileHandle:
+                    shutil.copyfileobj(cachedFileHandle, localFileHandle)
+            self.addToJobSpecFiles(fileStoreID, localFilePath, -1, None)
+        else:
+            try:
+                with self._cachedFileLock(cachedFile, LOCK_SH):
+                    os.link(cachedFile, localFilePath)
+            except OSError as err:
+                if err.errno == errno.ENOENT:
+                    return False
+                raise
+            # The link keeps the cached copy from being evicted, so accounting for it doesn't
+            # need to be atomic with the link.
+            self.returnFileSize(fileStoreID, localFilePath, fileAlreadyCached=True)
+        self._cacheState.hitFile(os.path.basename(cachedFile))
+        return True
+
+    @contextmanager
+    def _cachedFileLock(self, cachedFile, operation):
+        """
+        A context manager that locks the given cached file. Hits on the cache hold a shared lock
+        on the cached file while linking to it and eviction holds an exclusive one while
+        checking the number of links to the file and removing it, so hits and eviction only
+        contend on the same file.
+
+        :param str cachedFile: Path to the cached file
+        :param int operation: LOCK_SH or LOCK_EX, optionally combined with LOCK_NB
+        :raises OSError: with ENOENT if the file is not, or no longer, in the cache and with
+                EWOULDBLOCK if LOCK_NB was given and the file is locked.
+        """
+        fd = os.open(cachedFile, os.O_RDONLY)
+        try:
+            try:
+                flock(fd, operation)
+            except IOError as err:
+                raise OSError(err.errno, err.strerror, cachedFile)
+            # The file may have been evicted while we were waiting for the lock
+            if os.fstat(fd).st_nlink == 0:
+                raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), cachedFile)
+            yield
+        finally:
+            os.close(fd)
+
+    def _downloadToCache(self, fileStoreID, localFilePath, mutable):
+        """
+        Downloads the given file into the cache and links it to, or copies it to, the given local
+        path. The caller must have created the harbinger file for the file.
+
+        :param str fileStoreID: job store ID of the file
+        :param str localFilePath: the path to link or copy the file to
+        :param bool mutable: see readGlobalFile
+        """
+        # The file is downloaded to a hidden file in the cache directory that is only renamed
+        # into place once the download is complete.
+        partialCachedFile = '/.'.join(os.path.split(self.encodedFileID(fileStoreID)))
+        try:
+            self.jobStore.readFile(fileStoreID, partialCachedFile)
+        except:
+            if os.path.exists(partialCachedFile):
+                os.remove(partialCachedFile)
+            raise
+        else:
+            # If the download succeded, officially add the file to cache (by recording it in
+            # the cache state) if possible.
+            if os.path.exists(partialCachedFile):
+                self.addToCache(localFilePath, fileStoreID, 'read', mutable)
+                # We don't need to return the file size here because addToCache already does it
+                # for us
+
     def exportFile(self, jobStoreFileID, dstUrl):
         while jobStoreFileID in self._pendingFileWrites:
             # The file is still being writting to the job store - wait for this process to finish prior to
@@ -738,12 +825,18 @@ class CachingFileStore(FileStore):
                 "Trying to access a file in the jobStore you've deleted: %s" % fileStoreID)
 
         # If fileStoreID is in the cache provide a handle from the local cache
-        if self._fileIsCached(fileStoreID):
-            logger.debug('CACHE: Cache hit on file with ID \'%s\'.' % fileStoreID)
-            return open(self.encodedFileID(fileStoreID), 'r')
-        else:
+        try:
+            fileHandle = open(self.encodedFileID(fileStoreID), 'r')
+        except IOError as err:
+            if err.errno != errno.ENOENT:
+                raise
             logger.debug('CACHE: Cache miss on file with ID \'%s\'.' % fileStoreID)
+            self._cacheState.recordMisses()
             return self.jobStore.readFileStream(fileStoreID)
+        else:
+            logger.debug('CACHE: Cache hit on file with ID \'%s\'.' % fileStoreID)
+            self._cacheState.hitFile(os.path.basename(fileHandle.name))
+            return fileHandle
 
     def deleteLocalFile(self, fileStoreID):
         # The local file may or may not have been cached. If it was, we need to do some
@@ -752,82 +845,65 @@ class CachingFileStore(FileStore):
         # if a file was cached or not based on the value held in the third tuple value for the
         # dict item having key = fileStoreID. If it was cached, it holds the value True else
         # False.
-        with self._CacheState.open(self) as cacheInfo:
-            jobState = self._JobState(cacheInfo.jobState[self.jobID])
-            if fileStoreID not in list(jobState.jobSpecificFiles.keys()):
-                # EOENT indicates that the file did not exist
-                raise OSError(errno.ENOENT, "Attempting to delete a non-local file")
-            # filesToDelete is a dictionary of file: fileSize
-            filesToDelete = jobState.jobSpecificFiles[fileStoreID]
-            allOwnedFiles = jobState.filesToFSIDs
-            for (fileToDelete, fileSize) in list(filesToDelete.items()):
-                # Handle the case where a file not in the local temp dir was written to
-                # filestore
-                if fileToDelete is None:
-                    filesToDelete.pop(fileToDelete)
-                    allOwnedFiles[fileToDelete].remove(fileStoreID)
-                    cacheInfo.jobState[self.jobID] = jobState.__dict__
-                    cacheInfo.write(self.cacheStateFile)
-                    continue
-                # If the file size is zero (copied into the local temp dir) or -1 (mutable), we
-                # can safely delete without any bookkeeping
-                if fileSize in (0, -1):
-                    # Only remove the file if there is only one FSID associated with it.
-                    if len(allOwnedFiles[fileToDelete]) == 1:
-                        try:
-                            os.remove(fileToDelete)
-                        except OSError as err:
-                            if err.errno == errno.ENOENT and fileSize == -1:
-                                logger.debug('%s was read mutably and deleted by the user',
-                                             fileToDelete)
-                            else:
-                                raise IllegalDeletionCacheError(fileToDelete)
-                    allOwnedFiles[fileToDelete].remove(fileStoreID)
-                    filesToDelete.pop(fileToDelete)
-                    cacheInfo.jobState[self.jobID] = jobState.__dict__
-                    cacheInfo.write(self.cacheStateFile)
-                    continue
-                # If not, we need to do bookkeeping
-                # Get the size of the file to be deleted, and the number of jobs using the file
-                # at the moment.
-                if not os.path.exists(fileToDelete):
-                    raise IllegalDeletionCacheError(fileToDelete)
-                fileStats = os.stat(fileToDelete)
-                if fileSize != fileStats.st_size:
-                    logger.warn("the size on record differed from the real size by " +
-                                "%s bytes" % str(fileSize - fileStats.st_size))
-                # Remove the file and return file size to the job
-                if len(allOwnedFiles[fileToDelete]) == 1:
-                    os.remove(fileToDelete)
-                cacheInfo.sigmaJob += fileSize
+        if fileStoreID not in list(self.jobSpecificFiles.keys()):
+            # EOENT indicates that the file did not exist
+            raise OSError(errno.ENOENT, "Attempting to delete a non-local file")
+        # filesToDelete is a dictionary of file: fileSize
+        filesToDelete = self.jobSpecificFiles[fileStoreID]
+        allOwnedFiles = self.filesToFSIDs
+        for (fileToDelete, fileSize) in list(filesToDelete.items()):
+            # Handle the case where a file not in the local temp dir was written to
+            # filestore
+            if fileToDelete is None:
                 filesToDelete.pop(fileToDelete)
                 allOwnedFiles[fileToDelete].remove(fileStoreID)
-                jobState.updateJobReqs(fileSize, 'remove')
-                cacheInfo.jobState[self.jobID] = jobState.__dict__
-            # If the job is not in the process of cleaning up, then we may need to remove the
-            # cached copy of the file as well.
-            if not self.cleanupInProgress:
-                # If the file is cached and if other jobs are using the cached copy of the file,
-                # or if retaining the file in the cache doesn't affect the cache equation, then
-                # don't remove it from cache.
-                if self._fileIsCached(fileStoreID):
-                    cachedFile = self.encodedFileID(fileStoreID)
-                    jobsUsingFile = os.stat(cachedFile).st_nlink
-                    if not cacheInfo.isBalanced() and jobsUsingFile == self.nlinkThreshold:
-                        os.remove(cachedFile)
-                        cacheInfo.cached -= fileSize
-                self.logToMaster('Successfully deleted cached copy of file with ID '
-                                 '\'%s\'.' % fileStoreID, level=logging.DEBUG)
-            self.logToMaster('Successfully deleted local copies of file with ID '
+                continue
+            # If the file size is zero (copied into the local temp dir) or -1 (mutable), we
+            # can safely delete without any bookkeeping
+            if fileSize in (0, -1):
+                # Only remove the file if there is only one FSID associated with it.
+                if len(allOwnedFiles[fileToDelete]) == 1:
+                    try:
+                        os.remove(fileToDelete)
+                    except OSError as err:
+                        if err.errno == errno.ENOENT and fileSize == -1:
+                            logger.debug('%s was read mutably and deleted by the user',
+                                         fileToDelete)
+                        else:
+                            raise IllegalDeletionCacheError(fileToDelete)
+                allOwnedFiles[fileToDelete].remove(fileStoreID)
+                filesToDelete.pop(fileToDelete)
+                continue
+            # If not, we need to do bookkeeping
+            # Get the size of the file to be deleted, and the number of jobs using the file
+            # at the moment.
+            if not os.path.exists(fileToDelete):
+                raise IllegalDeletionCacheError(fileToDelete)
+            fileStats = os.stat(fileToDelete)
+            if fileSize != fileStats.st_size:
+                logger.warn("the size on record differed from the real size by " +
+                            "%s bytes" % str(fileSize - fileStats.st_size))
+            # Remove the file and return file size to the job
+            if len(allOwnedFiles[fileToDelete]) == 1:
+                os.remove(fileToDelete)
+            filesToDelete.pop(fileToDelete)
+            allOwnedFiles[fileToDelete].remove(fileStoreID)
+            self._cacheState.updateJobReqs(self.jobID, fileSize)
+        # If the job is not in the process of cleaning up, then we may need to remove the
+        # cached copy of the file as well.
+        if not self.cleanupInProgress:
+            # If the file is cached and if other jobs are using the cached copy of the file,
+            # or if retaining the file in the cache doesn't affect the cache equation, then
+            # don't remove it from cache.
+            if self._fileIsCached(fileStoreID) and not self._cacheState.isBalanced():
+                self._evictCachedFile(self.encodedFileID(fileStoreID))
+            self.logToMaster('Successfully deleted cached copy of file with ID '
                              '\'%s\'.' % fileStoreID, level=logging.DEBUG)
+        self.logToMaster('Successfully deleted local copies of file with ID '
+                         '\'%s\'.' % fileStoreID, level=logging.DEBUG)
 
     def deleteGlobalFile(self, fileStoreID):
-        jobStateIsPopulated = False
-        with self._CacheState.open(self) as cacheInfo:
-            if self.jobID in cacheInfo.jobState:
-                jobState = self._JobState(cacheInfo.jobState[self.jobID])
-                jobStateIsPopulated = True
-        if jobStateIsPopulated and fileStoreID in list(jobState.jobSpecificFiles.keys()):
+        if fileStoreID in list(self.jobSpecificFiles.keys()):
             # Use deleteLocalFile in the backend to delete the local copy of the file.
             self.deleteLocalFile(fileStoreID)
             # At this point, the local file has been deleted, and possibly the cached copy. If
@@ -838,7 +914,10 @@ class CachingFileStore(FileStore):
         # Check if the fileStoreID is in the cache. If it is, ensure only the current job is
         # using it.
         cachedFile = self.encodedFileID(fileStoreID)
-        if os.path.exists(cachedFile):
+        # A file cached by its contents may be cached for other files with the same contents, so
+        # it is left to be evicted like any other file.
+        if (os.path.exists(cachedFile) and
+                not os.path.basename(cachedFile).startswith(self.contentHashPrefix)):
             self.removeSingleCachedFile(fileStoreID)
         # Add the file to the list of files to be deleted once the run method completes.
         self.filesToDelete.add(fileStoreID)
@@ -846,25 +925,6 @@ class CachingFileStore(FileStore):
                          ' globally deleted.', level=logging.DEBUG)
 
     # Cache related methods
-    @contextmanager
-    def cacheLock(self):
-        """
-        This is a context manager to acquire a lock on the Lock file that will be used to
-        prevent synchronous cache operations between workers.
-        :yields: File descriptor for cache lock file in r+ mode
-        """
-        cacheLockFile = open(self.cacheLockFile, 'w')
-        try:
-            flock(cacheLockFile, LOCK_EX)
-            logger.debug("CACHE: Obtained lock on file %s" % self.cacheLockFile)
-            yield cacheLockFile
-        except IOError:
-            logger.critical('CACHE: Unable to acquire lock on %s' % self.cacheLockFile)
-            raise
-        finally:
-            cacheLockFile.close()
-            logger.debug("CACHE: Released lock")
-
     def _setupCache(self):
         """
         Setup the cache based on the provided values for localCacheDir.
@@ -876,7 +936,7 @@ class CachingFileStore(FileStore):
             personalCacheDir = ''.join([os.path.dirname(self.localCacheDir), '/.ctmp-',
                                         str(uuid.uuid4())])
             os.mkdir(personalCacheDir, 0o755)
-            self._createCacheLockFile(personalCacheDir)
+            self._createCacheState(personalCacheDir)
             try:
                 os.rename(personalCacheDir, self.localCacheDir)
             except OSError as err:
@@ -890,28 +950,30 @@ class CachingFileStore(FileStore):
                 else:
                     raise
         # You can't reach here unless a local cache directory has been created successfully
-        with self._CacheState.open(self) as cacheInfo:
+        self._cacheState = self._CacheState(self.cacheStateFile)
+        with self._cacheState.transaction():
+            cacheInfo = self._cacheState
             # Ensure this cache is from the correct attempt at the workflow!  If it isn't, we
-            # need to reset the cache lock file
+            # need to reset the cache state
             if cacheInfo.attemptNumber != self.workflowAttemptNumber:
+                allCachedFiles = [(x, os.stat(os.path.join(self.localCacheDir, x)).st_size)
+                                  for x in os.listdir(self.localCacheDir)
+                                  if not self._isHidden(x)]
+                cacheInfo.reindexFiles(allCachedFiles)
                 if cacheInfo.nlink == 2:
                     cacheInfo.cached = 0  # cached file sizes are accounted for by job store
                 else:
-                    allCachedFiles = [os.path.join(self.localCacheDir, x)
-                                      for x in os.listdir(self.localCacheDir)
-                                      if not self._isHidden(x)]
-                    cacheInfo.cached = sum([os.stat(cachedFile).st_size
-                                            for cachedFile in allCachedFiles])
+                    cacheInfo.cached = sum(size for _, size in allCachedFiles)
                     # TODO: Delete the working directories
-                cacheInfo.sigmaJob = 0
+                cacheInfo.resetJobReqs()
                 cacheInfo.attemptNumber = self.workflowAttemptNumber
             self.nlinkThreshold = cacheInfo.nlink
 
-    def _createCacheLockFile(self, tempCacheDir):
+    def _createCacheState(self, tempCacheDir):
         """
-        Create the cache lock file file to contain the state of the cache on the node.
+        Create the cache state database to contain the state of the cache on the node.
 
-        :param str tempCacheDir: Temporary directory to use for setting up a cache lock file the
+        :param str tempCacheDir: Temporary directory to use for setting up a cache state the
                first time.
         """
         # The nlink threshold is setup along with the first instance of the cache class on the
@@ -919,21 +981,21 @@ class CachingFileStore(FileStore):
         self.setNlinkThreshold()
         # Get the free space on the device
         freeSpace, _ = getFileSystemSize(tempCacheDir)
-        # Create the cache lock file.
-        open(os.path.join(tempCacheDir, os.path.basename(self.cacheLockFile)), 'w').close()
-        # Setup the cache state file
+        # Setup the cache state database with the initial values
         personalCacheStateFile = os.path.join(tempCacheDir,
                                               os.path.basename(self.cacheStateFile))
-        # Setup the initial values for the cache state file in a dict
-        cacheInfo = self._CacheState({
-            'nlink': self.nlinkThreshold,
-            'attemptNumber': self.workflowAttemptNumber,
-            'total': freeSpace,
-            'cached': 0,
-            'sigmaJob': 0,
-            'cacheDir': self.localCacheDir,
-            'jobState': {}})
-        cacheInfo.write(personalCacheStateFile)
+        cacheInfo = self._CacheState.create(personalCacheStateFile,
+                                            policy=self.jobStore.config.cacheEvictionPolicy,
+                                            nlink=self.nlinkThreshold,
+                                            attemptNumber=self.workflowAttemptNumber,
+                                            total=freeSpace,
+                                            cached=0)
+        # The database is about to be moved so the connection to it must not be used again
+        cacheInfo.close()
+
+    # Prefixes the names of cached files named by their contents. '+' is not in the url safe
+    # base64 alphabet so they can't be confused with encoded file IDs.
+    contentHashPrefix = '+sha1-'
 
     def encodedFileID(self, jobStoreFileID):
         """
@@ -941,10 +1003,16 @@ class CachingFileStore(FileStore):
         use as filename within the cache folder.  jobstore IDs are essentially urls/paths to
         files and thus cannot be used as is. Base64 encoding is used since it is reversible.
 
+        If the job store knows the digest of the file's contents, the file is named by that
+        instead so that files with identical contents share a single copy in the cache.
+
         :param jobStoreFileID: string representing a job store file ID
         :return: outCachedFile: A path to the hashed file in localCacheDir
         :rtype: str
         """
+        contentHash = self.jobStore.getContentHash(jobStoreFileID)
+        if contentHash is not None:
+            return os.path.join(self.localCacheDir, self.contentHashPrefix + contentHash)
         outCachedFile = os.path.join(self.localCacheDir,
                                      base64.urlsafe_b64encode(jobStoreFileID))
         return outCachedFile
@@ -960,11 +1028,15 @@ class CachingFileStore(FileStore):
         Decode a cached fileName back to a job store file ID.
 
         :param str cachedFilePath: Path to the cached file
-        :return: The jobstore file ID associated with the file
+        :return: The jobstore file ID associated with the file, or the name of the file if it is
+                 named by its contents since any of the files with those contents may be cached
+                 by that name
         :rtype: str
         """
         fileDir, fileName = os.path.split(cachedFilePath)
         assert fileDir == self.localCacheDir, 'Can\'t decode uncached file names'
+        if fileName.startswith(self.contentHashPrefix):
+            return fileName
         # We convert to byes here because base64 can't work with unicode
         # Its probably worth, later, converting all file name variables to str
         # rather than unicode.
@@ -977,9 +1049,12 @@ class CachingFileStore(FileStore):
         WRITING
         The file is in localTempDir. It needs to be linked into cache if possible.
         READING
-        The file is already in the cache dir. Depending on whether it is modifiable or not, does
-        it need to be linked to the required location, or copied. If it is copied, can the file
-        still be retained in cache?
+        The file has been downloaded to a hidden file in the cache dir. Depending on whether it
+        is modifiable or not, does it need to be linked to the required location, or copied. If
+        it is copied, can the file still be retained in cache?
+
+        Every change to the cache directory is made in a transaction on the cache state that
+        also accounts for it.
 
         :param str localFilePath: Path to the Source file
         :param jobStoreFileID: jobStoreID for the file
@@ -991,48 +1066,51 @@ class CachingFileStore(FileStore):
         if mutable is None:
             mutable = self.mutable
         assert isinstance(mutable, bool)
-        with self.cacheLock() as lockFileHandle:
-            cachedFile = self.encodedFileID(jobStoreFileID)
-            # The file to be cached MUST originate in the environment of the TOIL temp directory
-            if (os.stat(self.localCacheDir).st_dev !=
-                    os.stat(os.path.dirname(localFilePath)).st_dev):
-                raise InvalidSourceCacheError('Attempting to cache a file across file systems '
-                                              'cachedir = %s, file = %s.' % (self.localCacheDir,
-                                                                             localFilePath))
-            if not localFilePath.startswith(self.localTempDir):
-                raise InvalidSourceCacheError('Attempting a cache operation on a non-local file '
-                                              '%s.' % localFilePath)
-            if callingFunc == 'read' and mutable:
-                shutil.copyfile(cachedFile, localFilePath)
-                fileSize = os.stat(cachedFile).st_size
-                cacheInfo = self._CacheState._load(self.cacheStateFile)
-                cacheInfo.cached += fileSize if cacheInfo.nlink != 2 else 0
+        cachedFile = self.encodedFileID(jobStoreFileID)
+        partialCachedFile = '/.'.join(os.path.split(cachedFile))
+        # The file to be cached MUST originate in the environment of the TOIL temp directory
+        if (os.stat(self.localCacheDir).st_dev !=
+                os.stat(os.path.dirname(localFilePath)).st_dev):
+            raise InvalidSourceCacheError('Attempting to cache a file across file systems '
+                                          'cachedir = %s, file = %s.' % (self.localCacheDir,
+                                                                         localFilePath))
+        if not localFilePath.startswith(self.localTempDir):
+            raise InvalidSourceCacheError('Attempting a cache operation on a non-local file '
+                                          '%s.' % localFilePath)
+        if callingFunc == 'read' and mutable:
+            # Copy the file before it is visible in the cache, i.e. before it can be evicted
+            shutil.copyfile(partialCachedFile, localFilePath)
+            fileSize = os.stat(partialCachedFile).st_size
+            with self._cacheState.transaction():
+                os.chmod(partialCachedFile, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                os.rename(partialCachedFile, cachedFile)
+                cacheInfo = self._cacheState
+                cacheInfo.addToCached(fileSize if cacheInfo.nlink != 2 else 0)
                 if not cacheInfo.isBalanced():
                     os.remove(cachedFile)
-                    cacheInfo.cached -= fileSize if cacheInfo.nlink != 2 else 0
+                    cacheInfo.addToCached(-fileSize if cacheInfo.nlink != 2 else 0)
                     logger.debug('Could not download both download ' +
                                  '%s as mutable and add to ' % os.path.basename(localFilePath) +
                                  'cache. Hence only mutable copy retained.')
                 else:
+                    cacheInfo.addFile(os.path.basename(cachedFile), fileSize)
                     logger.info('CACHE: Added file with ID \'%s\' to the cache.' %
                                 jobStoreFileID)
-                jobState = self._JobState(cacheInfo.jobState[self.jobID])
-                jobState.addToJobSpecFiles(jobStoreFileID, localFilePath, -1, False)
-                cacheInfo.jobState[self.jobID] = jobState.__dict__
-                cacheInfo.write(self.cacheStateFile)
-            else:
-                # There are two possibilities, read and immutable, and write. both cases do
-                # almost the same thing except for the direction of the os.link hence we're
-                # writing them together.
-                if callingFunc == 'read':  # and mutable is inherently False
-                    src = cachedFile
-                    dest = localFilePath
-                    # To mirror behaviour of shutil.copyfile
-                    if os.path.exists(dest):
-                        os.remove(dest)
-                else:  # write
-                    src = localFilePath
-                    dest = cachedFile
+            self.addToJobSpecFiles(jobStoreFileID, localFilePath, -1, False)
+        else:
+            # There are two possibilities, read and immutable, and write. both cases do
+            # almost the same thing except for the direction of the os.link hence we're
+            # writing them together.
+            if callingFunc == 'read':  # and mutable is inherently False
+                src = partialCachedFile
+                dest = localFilePath
+                # To mirror behaviour of shutil.copyfile
+                if os.path.exists(dest):
+                    os.remove(dest)
+            else:  # write
+                src = localFilePath
+                dest = cachedFile
+            with self._cacheState.transaction():
                 try:
                     os.link(src, dest)
                 except OSError as err:
@@ -1040,25 +1118,32 @@ class CachingFileStore(FileStore):
                         raise
                     # If we get the EEXIST error, it can only be from write since in read we are
                     # explicitly deleting the file.  This shouldn't happen with the .partial
-                    # logic hence we raise a cache error.
-                    raise CacheError('Attempting to recache a file %s.' % src)
+                    # logic hence we raise a cache error, unless another file with the same
+                    # contents is cached already. The written file is then left uncached.
+                    if not os.path.basename(dest).startswith(self.contentHashPrefix):
+                        raise CacheError('Attempting to recache a file %s.' % src)
+                    self.addToJobSpecFiles(jobStoreFileID, localFilePath, 0.0, False)
+                    return
                 else:
+                    if callingFunc == 'read':
+                        # The file only becomes visible in the cache once the job links to it
+                        os.rename(partialCachedFile, cachedFile)
                     # Chmod the cached file. Cached files can never be modified.
                     os.chmod(cachedFile, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                    self._cacheState.addFile(os.path.basename(cachedFile),
+                                             os.stat(cachedFile).st_size)
                     # Return the filesize of cachedFile to the job and increase the cached size
                     # The values passed here don't matter since rFS looks at the file only for
                     # the stat
-                    self.returnFileSize(jobStoreFileID, localFilePath, lockFileHandle,
-                                        fileAlreadyCached=False)
-                if callingFunc == 'read':
-                    logger.debug('CACHE: Read file with ID \'%s\' from the cache.' %
-                                 jobStoreFileID)
-                else:
-                    logger.debug('CACHE: Added file with ID \'%s\' to the cache.' %
-                                 jobStoreFileID)
+                    self.returnFileSize(jobStoreFileID, localFilePath, fileAlreadyCached=False)
+            if callingFunc == 'read':
+                logger.debug('CACHE: Read file with ID \'%s\' from the cache.' %
+                             jobStoreFileID)
+            else:
+                logger.debug('CACHE: Added file with ID \'%s\' to the cache.' %
+                             jobStoreFileID)
 
-    def returnFileSize(self, fileStoreID, cachedFileSource, lockFileHandle,
-                       fileAlreadyCached=False):
+    def returnFileSize(self, fileStoreID, cachedFileSource, fileAlreadyCached=False):
         """
         Returns the fileSize of the file described by fileStoreID to the job requirements pool
         if the file was recently added to, or read from cache (A job that reads n bytes from
@@ -1067,26 +1152,50 @@ class CachingFileStore(FileStore):
 
         :param fileStoreID: fileStore ID of the file bein added to cache
         :param str cachedFileSource: File being added to cache
-        :param file lockFileHandle: Open file handle to the cache lock file
         :param bool fileAlreadyCached: A flag to indicate whether the file was already cached or
                not. If it was, then it means that you don't need to add the filesize to cache again.
         """
         fileSize = os.stat(cachedFileSource).st_size
-        cacheInfo = self._CacheState._load(self.cacheStateFile)
         # If the file isn't cached, add the size of the file to the cache pool. However, if the
         # nlink threshold is not 1 -  i.e. it is 2 (it can only be 1 or 2), then don't do this
         # since the size of the file is accounted for by the file store copy.
         if not fileAlreadyCached and self.nlinkThreshold == 1:
-            cacheInfo.cached += fileSize
-        cacheInfo.sigmaJob -= fileSize
-        if not cacheInfo.isBalanced():
+            self._cacheState.addToCached(fileSize)
+        # Add the info to the job specific cache info. This returns the file size to the job.
+        self.addToJobSpecFiles(fileStoreID, cachedFileSource, fileSize, True)
+        # Returning the size of a file that was already cached can only improve the balance
+        if not fileAlreadyCached and not self._cacheState.isBalanced():
             self.logToMaster('CACHE: The cache was not balanced on returning file size',
                              logging.WARN)
-        # Add the info to the job specific cache info
-        jobState = self._JobState(cacheInfo.jobState[self.jobID])
-        jobState.addToJobSpecFiles(fileStoreID, cachedFileSource, fileSize, True)
-        cacheInfo.jobState[self.jobID] = jobState.__dict__
-        cacheInfo.write(self.cacheStateFile)
+
+    def addToJobSpecFiles(self, jobStoreFileID, filePath, fileSize, cached):
+        """
+        Records a local copy of a file in the job's state.
+
+        :param jobStoreFileID: job store Identifier for the file
+        :param filePath: The path to the file
+        :param fileSize: The size of the file (may be deprecated soon)
+        :param cached: T : F : None :: cached : not cached : mutably read
+        """
+        # If there is no entry for the jsfID, make one. self.jobSpecificFiles is a default
+        # dict of default dicts and the absence of a key will return an empty dict
+        # (equivalent to a None for the if)
+        if not self.jobSpecificFiles[jobStoreFileID]:
+            self.jobSpecificFiles[jobStoreFileID][filePath] = fileSize
+        else:
+            # If there's no entry for the filepath, create one
+            if not self.jobSpecificFiles[jobStoreFileID][filePath]:
+                self.jobSpecificFiles[jobStoreFileID][filePath] = fileSize
+            # This should never happen
+            else:
+                raise RuntimeError()
+        # Now add the file to the reverse mapper. This will speed up cleanup and local file
+        # deletion.
+        self.filesToFSIDs[filePath].add(jobStoreFileID)
+        if cached:
+            # If the file was added to the cache, its size is subtracted from the requirements
+            # of the job.
+            self._cacheState.updateJobReqs(self.jobID, -fileSize)
 
     @staticmethod
     def _isHidden(filePath):
@@ -1105,93 +1214,113 @@ class CachingFileStore(FileStore):
     def cleanCache(self, newJobReqs):
         """
         Cleanup all files in the cache directory to ensure that at lead newJobReqs are available
-        for use.
+        for use. Files are evicted in the order of the cache's eviction policy, see _CacheState.
 
         :param float newJobReqs: the total number of bytes of files allowed in the cache.
         """
-        with self._CacheState.open(self) as cacheInfo:
-            # Add the new job's disk requirements to the sigmaJobDisk variable
-            cacheInfo.sigmaJob += newJobReqs
-            # Initialize the job state here. we use a partial in the jobSpecificFiles call so
-            # that this entire thing is pickleable. Based on answer by user Nathaniel Gentile at
-            # http://stackoverflow.com/questions/2600790
-            assert self.jobID not in cacheInfo.jobState
-            cacheInfo.jobState[self.jobID] = {
-                'jobName': self.jobName,
-                'jobReqs': newJobReqs,
-                'jobDir': self.localTempDir,
-                'jobSpecificFiles': defaultdict(partial(defaultdict,int)),
-                'filesToFSIDs': defaultdict(set),
-                'pid': os.getpid(),
-                'deferredFunctions': []}
+        cacheInfo = self._cacheState
+        with cacheInfo.transaction():
+            # Register the job, adding its disk requirements to the sum of the requirements of
+            # all jobs on the node.
+            cacheInfo.addJob(self.jobID, self.jobName, newJobReqs, self.localTempDir,
+                             os.getpid())
             # If the caching equation is balanced, do nothing.
             if cacheInfo.isBalanced():
                 return None
 
-            # List of deletable cached files.  A deletable cache file is one
-            #  that is not in use by any other worker (identified by the number of symlinks to
-            # the file)
-            allCacheFiles = [os.path.join(self.localCacheDir, x)
-                             for x in os.listdir(self.localCacheDir)
-                             if not self._isHidden(x)]
-            allCacheFiles = [(path, os.stat(path)) for path in allCacheFiles]
-            # TODO mtime vs ctime
-            deletableCacheFiles = {(path, inode.st_mtime, inode.st_size)
-                                   for path, inode in allCacheFiles
-                                   if inode.st_nlink == self.nlinkThreshold}
-
-            # Sort in descending order of mtime so the first items to be popped from the list
-            # are the least recently created.
-            deletableCacheFiles = sorted(deletableCacheFiles, key=lambda x: (-x[1], -x[2]))
-            logger.debug('CACHE: Need %s bytes for new job. Detecting an estimated %s (out of a '
-                         'total %s) bytes available for running the new job. The size of the cache '
-                         'is %s bytes.', newJobReqs,
-                         (cacheInfo.total - (cacheInfo.cached + cacheInfo.sigmaJob - newJobReqs)),
-                         cacheInfo.total, cacheInfo.cached)
-            logger.debug('CACHE: Evicting files to make room for the new job.')
-
-            # Now do the actual file removal
-            totalEvicted = 0
-            while not cacheInfo.isBalanced() and len(deletableCacheFiles) > 0:
-                cachedFile, fileCreateTime, cachedFileSize = deletableCacheFiles.pop()
-                os.remove(cachedFile)
-                cacheInfo.cached -= cachedFileSize if self.nlinkThreshold != 2 else 0
-                totalEvicted += cachedFileSize
-                assert cacheInfo.cached >= 0
-                logger.debug('CACHE: Evicted  file with ID \'%s\' (%s bytes)' %
-                             (self.decodedFileID(cachedFile), cachedFileSize))
-            logger.debug('CACHE: Evicted a total of %s bytes. Available space is now %s bytes.',
-                         totalEvicted,
-                         (cacheInfo.total - (cacheInfo.cached + cacheInfo.sigmaJob - newJobReqs)))
-            if not cacheInfo.isBalanced():
-                raise CacheUnbalancedError()
+        logger.debug('CACHE: Need %s bytes for new job. Detecting an estimated %s (out of a '
+                     'total %s) bytes available for running the new job. The size of the cache '
+                     'is %s bytes.', newJobReqs,
+                     (cacheInfo.total - (cacheInfo.cached + cacheInfo.sigmaJob - newJobReqs)),
+                     cacheInfo.total, cacheInfo.cached)
+        logger.debug('CACHE: Evicting files to make room for the new job.')
+
+        # Evict files in the order given by the cache's eviction policy, skipping the files
+        # that are in use, i.e. that are linked to by a job.
+        totalEvicted = 0
+        evictions = 0
+        for cachedFileName in cacheInfo.evictionCandidates():
+            if cacheInfo.isBalanced():
+                break
+            cachedFile = os.path.join(self.localCacheDir, cachedFileName)
+            cachedFileSize = self._evictCachedFile(cachedFile)
+            if cachedFileSize is None:
+                continue
+            totalEvicted += cachedFileSize
+            evictions += 1
+            assert cacheInfo.cached >= 0
+            logger.debug('CACHE: Evicted  file with ID \'%s\' (%s bytes)' %
+                         (self.decodedFileID(cachedFile), cachedFileSize))
+        cacheInfo.recordEvictions(evictions)
+        logger.debug('CACHE: Evicted a total of %s bytes. Available space is now %s bytes.',
+                     totalEvicted,
+                     (cacheInfo.total - (cacheInfo.cached + cacheInfo.sigmaJob - newJobReqs)))
+        if not cacheInfo.isBalanced():
+            # The job won't run so it must not hold on to its requirements
+            cacheInfo.removeJob(self.jobID)
+            raise CacheUnbalancedError()
+
+    def _evictCachedFile(self, cachedFile):
+        """
+        Removes the given file from the cache unless a job is using it.
+
+        :param str cachedFile: Path to the cached file
+        :return: The size of the evicted file or None if the file is in use
+        :rtype: int|None
+        """
+        try:
+            with self._cachedFileLock(cachedFile, LOCK_EX | LOCK_NB):
+                cachedFileStats = os.stat(cachedFile)
+                if cachedFileStats.st_nlink != self.nlinkThreshold:
+                    return None
+                with self._cacheState.transaction():
+                    os.remove(cachedFile)
+                    self._cacheState.removeFile(os.path.basename(cachedFile))
+                    # Remove the file size from the cached file size if the jobstore is not
+                    # fileJobStore
+                    if self.nlinkThreshold != 2:
+                        self._cacheState.addToCached(-cachedFileStats.st_size)
+        except OSError as err:
+            if err.errno == errno.ENOENT:
+                # Another job has evicted the file already
+                return 0
+            elif err.errno in (errno.EWOULDBLOCK, errno.EAGAIN):
+                # Another job is linking to the file
+                return None
+            raise
+        return cachedFileStats.st_size
 
     def removeSingleCachedFile(self, fileStoreID):
         """
         Removes a single file described by the fileStoreID from the cache forcibly.
         """
-        with self._CacheState.open(self) as cacheInfo:
-            cachedFile = self.encodedFileID(fileStoreID)
-            cachedFileStats = os.stat(cachedFile)
-            # We know the file exists because this function was called in the if block.  So we
-            # have to ensure nothing has changed since then.
-            assert cachedFileStats.st_nlink == self.nlinkThreshold, 'Attempting to delete ' + \
-                                                                    'a global file that is in use by another job.'
-            # Remove the file size from the cached file size if the jobstore is not fileJobStore
-            # and then delete the file
-            os.remove(cachedFile)
-            if self.nlinkThreshold != 2:
-                cacheInfo.cached -= cachedFileStats.st_size
-            if not cacheInfo.isBalanced():
-                self.logToMaster('CACHE: The cache was not balanced on removing single file',
-                                 logging.WARN)
-            self.logToMaster('CACHE: Successfully removed file with ID \'%s\'.' % fileStoreID)
+        # We know the file exists because this function was called in the if block.  So we
+        # have to ensure nothing has changed since then.
+        assert self._evictCachedFile(self.encodedFileID(fileStoreID)) is not None, \
+            'Attempting to delete a global file that is in use by another job.'
+        if not self._cacheState.isBalanced():
+            self.logToMaster('CACHE: The cache was not balanced on removing single file',
+                             logging.WARN)
+        self.logToMaster('CACHE: Successfully removed file with ID \'%s\'.' % fileStoreID)
         return None
 
+    def cacheStatistics(self):
+        """
+        :return: the number of cache hits, cache misses and evicted files on this node so far,
+                 keyed by 'hits', 'misses' and 'evictions'
+        :rtype: dict[str,int]
+        """
+        return self._cacheState.statistics()
+
     def setNlinkThreshold(self):
         # FIXME Can't do this at the top because of loopy (circular) import errors
         from toil.jobStores.fileJobStore import FileJobStore
-        if (isinstance(self.jobStore, FileJobStore) and
+        from toil.jobStores.sqliteJobStore import SQLiteJobStore
+        # Both job stores hard-link files read from them if they can, so the job store's copy
+        # of a file accounts for one of the links to a cached file. A job store deduplicating
+        # files copies them instead.
+        if (isinstance(self.jobStore, (FileJobStore, SQLiteJobStore)) and
+                    not self.jobStore.config.deduplicateFiles and
                     os.stat(os.path.dirname(self.localCacheDir)).st_dev == os.stat(
                     self.jobStore.jobStoreDir).st_dev):
             self.nlinkThreshold = 2
@@ -1208,46 +1337,292 @@ class CachingFileStore(FileStore):
         """
         fileStats = os.stat(localFilePath)
         assert fileStats.st_nlink >= self.nlinkThreshold
-        with self._CacheState.open(self) as cacheInfo:
-            cacheInfo.sigmaJob -= fileStats.st_size
-            jobState = self._JobState(cacheInfo.jobState[self.jobID])
-            jobState.updateJobReqs(fileStats.st_size, 'remove')
+        self._cacheState.updateJobReqs(self.jobID, -fileStats.st_size)
 
-    def returnJobReqs(self, jobReqs):
+    def returnJobReqs(self):
         """
         This function returns the effective job requirements back to the pool after the job
-        completes. It also deletes the local copies of files with the cache lock held.
-
-        :param float jobReqs: Original size requirement of the job
+        completes. It also deletes the local copies of files.
         """
-        # Since we are only reading this job's specific values from the state file, we don't
-        # need a lock
-        jobState = self._JobState(self._CacheState._load(self.cacheStateFile
-                                                         ).jobState[self.jobID])
-        for x in list(jobState.jobSpecificFiles.keys()):
+        for x in list(self.jobSpecificFiles.keys()):
             self.deleteLocalFile(x)
-        with self._CacheState.open(self) as cacheInfo:
-            cacheInfo.sigmaJob -= jobReqs
-            # assert cacheInfo.isBalanced() # commenting this out for now. God speed
+        self._cacheState.setJobReqs(self.jobID, 0)
+
+    class _CacheState(object):
+        """
+        The state of the cache on a node, shared by all jobs running on the node. It consists of
+        the total space available to the cache, the size of the cached files, an index of the
+        cached files and, for each running job, its remaining disk requirements and deferred
+        functions.
+
+        The state is kept in a SQLite database in the cache directory so that concurrent jobs
+        update it with small transactions on the affected rows rather than rewriting all of it
+        under a lock on the node. The database is used in write-ahead logging mode which lets
+        jobs read the state while another job is writing it.
+
+        Also used for checking whether the caching equation is balanced or not.
+
+        The index of the cached files orders them by their eviction priority, the file with the
+        lowest priority being evicted first. The priority depends on the eviction policy of the
+        cache. With 'lru' it is the time the file was last accessed. With 'gdsf' (Greedy Dual
+        Size Frequency) it is the number of times the file was accessed divided by its size,
+        plus an inflation value that is raised to the priority of each evicted file so that
+        files that were popular in the past eventually age out.
+        """
+        # How long to wait for another job's transaction, in seconds
+        busyTimeout = 600
+
+        # The number of cached files fetched from the index at a time while evicting
+        evictionBatchSize = 100
+
+        evictionPolicies = ('lru', 'gdsf')
+
+        schema = """
+            CREATE TABLE properties (
+                name TEXT PRIMARY KEY,
+                value NOT NULL
+            );
+            CREATE TABLE jobs (
+                jobID TEXT PRIMARY KEY,
+                jobName TEXT NOT NULL,
+                jobReqs INTEGER NOT NULL,
+                jobDir TEXT NOT NULL,
+                pid INTEGER NOT NULL,
+                deferredFunctions BLOB NOT NULL
+            );
+            CREATE TABLE files (
+                name TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                hits INTEGER NOT NULL,
+                priority REAL NOT NULL
+            );
+            CREATE INDEX filesByPriority ON files (priority, name);
+        """
+
+        def __init__(self, fileName):
+            """
+            :param str fileName: Path to the cache state database
+            """
+            self.fileName = fileName
+            # SQLite connections can't be shared between threads nor survive a fork, so each
+            # thread of each process gets its own
+            self._local = threading.local()
+            # The eviction policy never changes, so it is only looked up once
+            self._policy = None
 
-    class _CacheState(FileStore._StateFile):
-        """
-        Utility class to read and write the cache lock file. Also for checking whether the
-        caching equation is balanced or not.  It extends the _StateFile class to add other cache
-        related functions.
-        """
         @classmethod
+        def create(cls, fileName, policy='lru', **properties):
+            """
+            Creates the cache state database with the given initial values of the properties.
+
+            :param str policy: the eviction policy of the cache, one of evictionPolicies
+            :rtype: CachingFileStore._CacheState
+            """
+            assert policy in cls.evictionPolicies
+            properties = dict(properties, policy=policy, inflation=0.0,
+                              hits=0, misses=0, evictions=0)
+            cacheState = cls(fileName)
+            connection = cacheState._connection()
+            # WAL mode is persistent, i.e. it only needs to be enabled once for the database
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.executescript(cls.schema)
+            with cacheState.transaction():
+                connection.executemany('INSERT INTO properties (name, value) VALUES (?, ?)',
+                                       list(properties.items()))
+            return cacheState
+
+        def _connection(self):
+            local = self._local
+            pid = os.getpid()
+            if getattr(local, 'pid', None) != pid:
+                # Either this thread never opened a connection or it did so in a parent process.
+                # In the latter case the inherited connection must not be used.
+                connection = sqlite3.connect(self.fileName,
+                                             timeout=self.busyTimeout,
+                                             isolation_level=None)
+                # The cache doesn't outlive the node, so the state needn't survive a crash of it
+                connection.execute('PRAGMA synchronous=OFF')
+                local.connection = connection
+                local.pid = pid
+                local.transactionDepth = 0
+            return local.connection
+
+        def close(self):
+            """
+            Closes the current thread's connection to the database.
+            """
+            local = self._local
+            if getattr(local, 'pid', None) == os.getpid():
+                local.connection.close()
+            local.pid = None
+            local.connection = None
+
         @contextmanager
-        def open(cls, outer=None):
+        def transaction(self):
+            """
+            A context manager for a write transaction. Other jobs can read the state while the
+            transaction is in progress but can't start their own. Nested transactions are folded
+            into the outermost one.
+            """
+            connection = self._connection()
+            local = self._local
+            if local.transactionDepth == 0:
+                # Acquire the write lock up front so we never have to upgrade a read lock
+                connection.execute('BEGIN IMMEDIATE')
+            local.transactionDepth += 1
+            try:
+                yield
+            except:
+                local.transactionDepth -= 1
+                if local.transactionDepth == 0:
+                    connection.execute('ROLLBACK')
+                raise
+            else:
+                local.transactionDepth -= 1
+                if local.transactionDepth == 0:
+                    connection.execute('COMMIT')
+
+        def _property(name):
+            def getter(self):
+                return self._connection().execute('SELECT value FROM properties WHERE name = ?',
+                                                  (name,)).fetchone()[0]
+
+            def setter(self, value):
+                self._connection().execute('UPDATE properties SET value = ? WHERE name = ?',
+                                           (value, name))
+
+            return property(getter, setter)
+
+        # The nlink threshold of the cache, see CachingFileStore.setNlinkThreshold()
+        nlink = _property('nlink')
+        # The attempt of the workflow the cache belongs to
+        attemptNumber = _property('attemptNumber')
+        # The space available to the cache and the jobs on the node
+        total = _property('total')
+        # The total size of the cached files
+        cached = _property('cached')
+        # The number of cache hits, misses and evicted files on the node
+        hits = _property('hits')
+        misses = _property('misses')
+        evictions = _property('evictions')
+
+        del _property
+
+        @property
+        def policy(self):
+            if self._policy is None:
+                self._policy = self._connection().execute(
+                    "SELECT value FROM properties WHERE name = 'policy'").fetchone()[0]
+            return self._policy
+
+        def _increment(self, name, amount=1):
+            self._connection().execute('UPDATE properties SET value = value + ? WHERE name = ?',
+                                       (amount, name))
+
+        def recordMisses(self, misses=1):
+            self._increment('misses', misses)
+
+        def recordEvictions(self, evictions):
+            self._increment('evictions', evictions)
+
+        def statistics(self):
+            """
+            :return: the number of cache hits, cache misses and evicted files on the node
+            :rtype: dict[str,int]
+            """
+            return dict(self._connection().execute(
+                "SELECT name, value FROM properties WHERE name IN ('hits', 'misses', 'evictions')"))
+
+        def addFile(self, name, size):
+            """
+            Adds a file to the index of cached files, counting the addition as an access.
+
+            :param str name: the name of the file in the cache directory
+            :param int size: the size of the file
+            """
+            with self.transaction():
+                self._connection().execute(
+                    'INSERT OR REPLACE INTO files (name, size, hits, priority) VALUES (?, ?, 0, 0)',
+                    (name, size))
+                self._access(name)
+
+        def hitFile(self, name):
+            """
+            Records a cache hit on the given file.
             """
-            This is a context manager that opens the cache state file and reads it into an object
-            that is returned to the user in the yield
+            with self.transaction():
+                self._access(name)
+                self._increment('hits')
+
+        def _access(self, name):
+            if self.policy == 'lru':
+                priority, params = '?', (time.time(),)
+            else:
+                # The right hand sides of an UPDATE see the row as it was before the UPDATE
+                priority, params = ("(SELECT value FROM properties WHERE name = 'inflation')"
+                                    " + (hits + 1.0) / MAX(size, 1)"), ()
+            self._connection().execute(
+                'UPDATE files SET hits = hits + 1, priority = %s WHERE name = ?' % priority,
+                params + (name,))
+
+        def removeFile(self, name):
+            """
+            Removes a file from the index of cached files.
+            """
+            with self.transaction():
+                connection = self._connection()
+                if self.policy == 'gdsf':
+                    connection.execute(
+                        "UPDATE properties SET value = MAX(value, (SELECT priority FROM files "
+                        "WHERE name = ?)) WHERE name = 'inflation'", (name,))
+                connection.execute('DELETE FROM files WHERE name = ?', (name,))
+
+        def reindexFiles(self, files):
+            """
+            Replaces the index of cached files.
+
+            :param list[tuple[str,int]] files: the name and size of each cached file
+            """
+            with self.transaction():
+                self._connection().execute('DELETE FROM files')
+                for name, size in files:
+                    self.addFile(name, size)
+
+        def evictionCandidates(self):
+            """
+            Generates the names of the cached files in the order they should be evicted in. The
+            index is read in small batches and no transaction is held between them, so files can
+            be evicted as they are generated. Files added while generating may be skipped.
+
+            :rtype: collections.Iterator[str]
+            """
+            connection = self._connection()
+            rows = connection.execute('SELECT priority, name FROM files '
+                                      'ORDER BY priority, name LIMIT ?',
+                                      (self.evictionBatchSize,)).fetchall()
+            while rows:
+                for priority, name in rows:
+                    yield name
+                rows = connection.execute('SELECT priority, name FROM files '
+                                          'WHERE priority > ? OR (priority = ? AND name > ?) '
+                                          'ORDER BY priority, name LIMIT ?',
+                                          (priority, priority, name,
+                                           self.evictionBatchSize)).fetchall()
+
+        def addToCached(self, fileSize):
+            """
+            Atomically adds the given size, which may be negative, to the size of the cached files.
+            """
+            self._connection().execute(
+                "UPDATE properties SET value = value + ? WHERE name = 'cached'", (fileSize,))
+
+        @property
+        def sigmaJob(self):
+            """
+            The sum of the remaining disk requirements of all jobs on the node.
             """
-            assert outer is not None
-            with outer.cacheLock():
-                cacheInfo = cls._load(outer.cacheStateFile)
-                yield cacheInfo
-                cacheInfo.write(outer.cacheStateFile)
+            return self._connection().execute(
+                'SELECT COALESCE(SUM(jobReqs), 0) FROM jobs').fetchone()[0]
 
         def isBalanced(self):
             """
@@ -1259,20 +1634,77 @@ class CachingFileStore(FileStore):
             :return: Boolean for equation is balanced (T) or not (F)
             :rtype: bool
             """
-            return self.cached + self.sigmaJob <= self.total
+            return bool(self._connection().execute(
+                "SELECT (SELECT value FROM properties WHERE name = 'cached')"
+                " + (SELECT COALESCE(SUM(jobReqs), 0) FROM jobs)"
+                " <= (SELECT value FROM properties WHERE name = 'total')").fetchone()[0])
 
-        def purgeRequired(self, jobReqs):
+        def addJob(self, jobID, jobName, jobReqs, jobDir, pid):
+            self._connection().execute(
+                'INSERT INTO jobs (jobID, jobName, jobReqs, jobDir, pid, deferredFunctions) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (jobID, jobName, jobReqs, jobDir, pid, sqlite3.Binary(dill.dumps([]))))
+
+        def removeJob(self, jobID):
+            self._connection().execute('DELETE FROM jobs WHERE jobID = ?', (jobID,))
+
+        def claimJob(self, jobID, pid):
             """
-            Similar to isBalanced, however it looks at the actual state of the system and
-            decides whether an eviction is required.
+            Makes the current process responsible for the given job if the job still belongs to
+            the given process.
 
-            :return: Is a purge required(T) or no(F)
+            :return: True if the job was claimed, False if another process claimed it first
             :rtype: bool
             """
-            return not self.isBalanced()
-            # totalStats = os.statvfs(self.cacheDir)
-            # totalFree = totalStats.f_bavail * totalStats.f_frsize
-            # return totalFree < jobReqs
+            return self._connection().execute('UPDATE jobs SET pid = ? WHERE jobID = ? AND pid = ?',
+                                              (os.getpid(), jobID, pid)).rowcount == 1
+
+        def setJobReqs(self, jobID, jobReqs):
+            self._connection().execute('UPDATE jobs SET jobReqs = ? WHERE jobID = ?',
+                                       (jobReqs, jobID))
+
+        def updateJobReqs(self, jobID, fileSize):
+            """
+            Atomically adds the given size, which may be negative, to the requirements of the
+            given job.
+            """
+            self._connection().execute('UPDATE jobs SET jobReqs = jobReqs + ? WHERE jobID = ?',
+                                       (fileSize, jobID))
+
+        def resetJobReqs(self):
+            """
+            Sets the requirements of all jobs to zero.
+            """
+            self._connection().execute('UPDATE jobs SET jobReqs = 0')
+
+        def addDeferredFunction(self, jobID, deferredFunction):
+            with self.transaction():
+                deferredFunctions = self.jobState(jobID)['deferredFunctions']
+                deferredFunctions.append(deferredFunction)
+                self._connection().execute('UPDATE jobs SET deferredFunctions = ? WHERE jobID = ?',
+                                           (sqlite3.Binary(dill.dumps(deferredFunctions)), jobID))
+
+        def jobState(self, jobID):
+            """
+            :return: the state of the given job, or None if there is no such job
+            :rtype: dict|None
+            """
+            row = self._connection().execute('SELECT * FROM jobs WHERE jobID = ?',
+                                             (jobID,)).fetchone()
+            return None if row is None else self._jobState(row)
+
+        def jobPIDs(self):
+            """
+            :return: the ID of each job on the node and the ID of the process running it
+            :rtype: list[tuple[str,int]]
+            """
+            return self._connection().execute('SELECT jobID, pid FROM jobs').fetchall()
+
+        @staticmethod
+        def _jobState(row):
+            jobID, jobName, jobReqs, jobDir, pid, deferredFunctions = row
+            return dict(jobID=jobID, jobName=jobName, jobReqs=jobReqs, jobDir=jobDir, pid=pid,
+                        deferredFunctions=dill.loads(bytes(deferredFunctions)))
 
     # Methods related to the deferred function logic
     @classmethod
@@ -1282,101 +1714,30 @@ class CachingFileStore(FileStore):
         :param toil.fileStore.CachingFileStore._CacheState nodeInfo: The state of the node cache as
                a _CacheState object
         """
-        # A list of tuples of (hashed job id, pid or process running job)
-        registeredJobs = [(jid, state['pid']) for jid, state in list(nodeInfo.jobState.items())]
-        for jobID, jobPID in registeredJobs:
+        for jobID, jobPID in nodeInfo.jobPIDs():
             if not cls._pidExists(jobPID):
-                jobState = CachingFileStore._JobState(nodeInfo.jobState[jobID])
+                # Another job may be handling the dead job already. If we die while handling it,
+                # it will be handled again since we become the job's process.
+                if not nodeInfo.claimJob(jobID, jobPID):
+                    continue
+                jobState = nodeInfo.jobState(jobID)
                 logger.warning('Detected that job (%s) prematurely terminated.  Fixing the state '
-                               'of the cache.', jobState.jobName)
+                               'of the cache.', jobState['jobName'])
                 if not batchSystemShutdown:
                     logger.debug("Returning dead job's used disk to cache.")
                     # Delete the old work directory if it still exists, to remove unwanted nlinks.
                     # Do this only during the life of the program and dont' do it during the
                     # batch system cleanup.  Leave that to the batch system cleanup code.
-                    if os.path.exists(jobState.jobDir):
-                        shutil.rmtree(jobState.jobDir)
-                    nodeInfo.sigmaJob -= jobState.jobReqs
+                    if os.path.exists(jobState['jobDir']):
+                        shutil.rmtree(jobState['jobDir'])
                 logger.debug('Running user-defined deferred functions.')
-                cls._runDeferredFunctions(jobState.deferredFunctions)
-                # Remove job from the cache state file
-                nodeInfo.jobState.pop(jobID)
+                cls._runDeferredFunctions(jobState['deferredFunctions'])
+                # Remove job from the cache state, which also returns its used disk
+                nodeInfo.removeJob(jobID)
 
     def _registerDeferredFunction(self, deferredFunction):
-        with self._CacheState.open(self) as cacheInfo:
-            cacheInfo.jobState[self.jobID]['deferredFunctions'].append(deferredFunction)
-            logger.debug('Registered "%s" with job "%s".', deferredFunction, self.jobName)
-
-    class _JobState(object):
-        """
-        This is a utility class to handle the state of a job in terms of it's current disk
-        requirements, working directory, and job specific files.
-        """
-
-        def __init__(self, dictObj):
-            assert isinstance(dictObj, dict)
-            self.__dict__.update(dictObj)
-
-        @classmethod
-        def updateJobSpecificFiles(cls, outer, jobStoreFileID, filePath, fileSize, cached):
-            """
-            This method will update the job specifc files in the job state object. It deals with
-            opening a cache lock file, etc.
-
-            :param toil.fileStore.CachingFileStore outer: An instance of CachingFileStore
-            :param str jobStoreFileID: job store Identifier for the file
-            :param str filePath: The path to the file
-            :param float fileSize: The size of the file (may be deprecated soon)
-            :param bool cached: T : F : None :: cached : not cached : mutably read
-            """
-            with outer._CacheState.open(outer) as cacheInfo:
-                jobState = cls(cacheInfo.jobState[outer.jobID])
-                jobState.addToJobSpecFiles(jobStoreFileID, filePath, fileSize, cached)
-                cacheInfo.jobState[outer.jobID] = jobState.__dict__
-
-        def addToJobSpecFiles(self, jobStoreFileID, filePath, fileSize, cached):
-            """
-            This is the real method that actually does the updations.
-
-            :param jobStoreFileID: job store Identifier for the file
-            :param filePath: The path to the file
-            :param fileSize: The size of the file (may be deprecated soon)
-            :param cached: T : F : None :: cached : not cached : mutably read
-            """
-            # If there is no entry for the jsfID, make one. self.jobSpecificFiles is a default
-            # dict of default dicts and the absence of a key will return an empty dict
-            # (equivalent to a None for the if)
-            if not self.jobSpecificFiles[jobStoreFileID]:
-                self.jobSpecificFiles[jobStoreFileID][filePath] = fileSize
-            else:
-                # If there's no entry for the filepath, create one
-                if not self.jobSpecificFiles[jobStoreFileID][filePath]:
-                    self.jobSpecificFiles[jobStoreFileID][filePath] = fileSize
-                # This should never happen
-                else:
-                    raise RuntimeError()
-            # Now add the file to the reverse mapper. This will speed up cleanup and local file
-            # deletion.
-            self.filesToFSIDs[filePath].add(jobStoreFileID)
-            if cached:
-                self.updateJobReqs(fileSize, 'add')
-
-        def updateJobReqs(self, fileSize, actions):
-            """
-            This method will update the current state of the disk required by the job after the
-            most recent cache operation.
-
-            :param fileSize: Size of the last file added/removed from the cache
-            :param actions: 'add' or 'remove'
-            """
-            assert actions in ('add', 'remove')
-            multiplier = 1 if actions == 'add' else -1
-            # If the file was added to the cache, the value is subtracted from the requirements,
-            # and it is added if the file was removed form the cache.
-            self.jobReqs -= (fileSize * multiplier)
-
-        def isPopulated(self):
-            return self.__dict__ != {}
+        self._cacheState.addDeferredFunction(self.jobID, deferredFunction)
+        logger.debug('Registered "%s" with job "%s".', deferredFunction, self.jobName)
 
     class HarbingerFile(object):
         """
@@ -1403,59 +1764,79 @@ class CachingFileStore(FileStore):
             self.harbingerFileName = '/.'.join(os.path.split(cachedFileName)) + '.harbinger'
 
         def write(self):
+            """
+            Atomically creates the harbinger file unless it exists already.
+
+            :return: True if the harbinger file was created, False if it existed
+            :rtype: bool
+            """
             self.fileStore.logToMaster('CACHE: Creating a harbinger file for (%s). '
                                        % self.fileStoreID, logging.DEBUG)
-            with open(self.harbingerFileName + '.tmp', 'w') as harbingerFile:
+            tempHarbingerFileName = '%s.%s.tmp' % (self.harbingerFileName, uuid.uuid4())
+            with open(tempHarbingerFileName, 'w') as harbingerFile:
                 harbingerFile.write(str(os.getpid()))
             # Make this File read only to prevent overwrites
-            os.chmod(self.harbingerFileName + '.tmp', 0o444)
-            os.rename(self.harbingerFileName + '.tmp', self.harbingerFileName)
+            os.chmod(tempHarbingerFileName, 0o444)
+            # Unlike a rename, a link fails if the harbinger file exists
+            try:
+                os.link(tempHarbingerFileName, self.harbingerFileName)
+            except OSError as err:
+                if err.errno == errno.EEXIST:
+                    return False
+                raise
+            finally:
+                os.remove(tempHarbingerFileName)
+            return True
 
-        def waitOnDownload(self, lockFileHandle):
+        def waitOnDownload(self):
             """
             This method is called when a readGlobalFile process is waiting on another process to
             write a file to the cache.
-
-            :param lockFileHandle: The open handle to the cache lock file
             """
-            while self.exists():
+            # The file may be downloaded by another thread of this process, e.g. because it
+            # was prefetched, so start polling quickly and back off if the download takes long
+            waitTime = 0.1
+            if self.exists():
                 logger.info('CACHE: Waiting for another worker to download file with ID %s.'
                             % self.fileStoreID)
+            while self.exists():
                 # Ensure that the process downloading the file is still alive.  The PID will
                 # be in the harbinger file.
-                pid = self.read()
+                try:
+                    pid = self.read()
+                except IOError as err:
+                    if err.errno == errno.ENOENT:
+                        # The download has just finished
+                        break
+                    raise
                 if FileStore._pidExists(pid):
-                    # Release the file lock and then wait for a bit before repeating.
-                    flock(lockFileHandle, LOCK_UN)
-                    time.sleep(20)
-                    # Grab the file lock before repeating.
-                    flock(lockFileHandle, LOCK_EX)
+                    # Wait for a bit before repeating.
+                    time.sleep(waitTime)
+                    waitTime = min(waitTime * 2, 20)
                 else:
                     # The process that was supposed to download the file has died so we need
                     # to remove the harbinger.
-                    self._delete()
+                    self.delete()
 
         def read(self):
-            return int(open(self.harbingerFileName).read())
+            with open(self.harbingerFileName) as harbingerFile:
+                return int(harbingerFile.read())
 
         def exists(self):
             return os.path.exists(self.harbingerFileName)
 
         def delete(self):
             """
-            Acquires the cache lock then attempts to delete the harbinger file.
+            Deletes the harbinger file, if it still exists.
             """
-            with self.fileStore.cacheLock():
-                self._delete()
-
-        def _delete(self):
-            """
-            This function assumes you already have the cache lock!
-            """
-            assert self.exists()
             self.fileStore.logToMaster('CACHE: Deleting the harbinger file for (%s)' %
                                        self.fileStoreID, logging.DEBUG)
-            os.remove(self.harbingerFileName)
+            try:
+                os.remove(self.harbingerFileName)
+            except OSError as err:
+                # Another job waiting on a dead download may have deleted it
+                if err.errno != errno.ENOENT:
+                    raise
 
     # Functions related to async updates
     def asyncWrite(self):
@@ -1477,7 +1858,7 @@ class CachingFileStore(FileStore):
                 # Normal termination condition is getting None from queue
                 if args is None:
                     break
-                inputFileHandle, jobStoreFileID = args
+                inputFileHandle, jobStoreFileID, fileSize = args
                 cachedFileName = self.encodedFileID(jobStoreFileID)
                 # Ensure that the harbinger exists in the cache directory and that the PID
                 # matches that of this writing thread.
@@ -1489,18 +1870,83 @@ class CachingFileStore(FileStore):
                 # We pass in a fileHandle, rather than the file-name, in case
                 # the file itself is deleted. The fileHandle itself should persist
                 # while we maintain the open file handle
+                startTime = time.time()
+                progress = self._asyncWriteProgress[jobStoreFileID]
                 with self.jobStore.updateFileStream(jobStoreFileID) as outputFileHandle:
-                    shutil.copyfileobj(inputFileHandle, outputFileHandle)
+                    while True:
+                        buf = inputFileHandle.read(self.asyncWriteChunkSize)
+                        if not buf:
+                            break
+                        outputFileHandle.write(buf)
+                        progress[0] += len(buf)
                 inputFileHandle.close()
                 # Remove the file from the lock files
                 with self._pendingFileWritesLock:
                     self._pendingFileWrites.remove(jobStoreFileID)
                 # Remove the harbinger file
                 harbingerFile.delete()
+                self._releaseAsyncWrite(jobStoreFileID, fileSize, time.time() - startTime)
         except:
             self._terminateEvent.set()
             raise
 
+    def _reserveAsyncWrite(self, fileSize):
+        """
+        Blocks until a file of the given size can be queued for an asynchronous write without
+        the files queued or being written exceeding asyncWriteBufferSize bytes, and accounts for
+        it. A file is always admitted if no other file is pending, however large it is.
+
+        :param int fileSize: the size of the file in bytes
+        """
+        bufferSize = self.jobStore.config.asyncWriteBufferSize
+        with self._asyncWriteCondition:
+            while 0 < self._asyncWriteBytes and self._asyncWriteBytes + fileSize > bufferSize:
+                logger.debug('Waiting for %sB of asynchronous writes to complete before writing '
+                             '%sB.', bytes2human(self._asyncWriteBytes), bytes2human(fileSize))
+                # Time out so that we notice the writing threads crashing
+                self._asyncWriteCondition.wait(timeout=2)
+                if self._terminateEvent.isSet():
+                    raise RuntimeError("The termination flag is set, exiting")
+            self._asyncWriteBytes += fileSize
+
+    def _releaseAsyncWrite(self, jobStoreFileID, fileSize, seconds):
+        """
+        Accounts for the completion of an asynchronous write and wakes up writeGlobalFile() if it
+        is waiting for one.
+        """
+        logger.debug('Wrote file %s of %sB to the job store in %.2f seconds (%sB/s).',
+                     jobStoreFileID, bytes2human(fileSize), seconds,
+                     bytes2human(fileSize / seconds if seconds > 0 else 0))
+        with self._asyncWriteCondition:
+            self._asyncWriteBytes -= fileSize
+            del self._asyncWriteProgress[jobStoreFileID]
+            self._asyncWriteStatistics['files'] += 1
+            self._asyncWriteStatistics['bytes'] += fileSize
+            self._asyncWriteStatistics['seconds'] += seconds
+            self._asyncWriteCondition.notify_all()
+
+    def asyncWriteProgress(self):
+        """
+        Reports on the files being written to the job store in the background, i.e. on the files
+        queued for an asynchronous write or being written.
+
+        :return: the number of bytes written so far and the size of each such file, by job store
+                 file ID
+        :rtype: dict[str,tuple[int,int]]
+        """
+        with self._asyncWriteCondition:
+            return {jobStoreFileID: tuple(progress)
+                    for jobStoreFileID, progress in self._asyncWriteProgress.items()}
+
+    def asyncWriteStatistics(self):
+        """
+        :return: the number of files and bytes written to the job store in the background by
+                 this file store and the number of seconds the threads spent writing them
+        :rtype: dict[str,int|float]
+        """
+        with self._asyncWriteCondition:
+            return dict(self._asyncWriteStatistics)
+
     def _updateJobWhenDone(self):
         """
         Asynchronously update the status of the job on the disk, first waiting \
@@ -1516,6 +1962,10 @@ class CachingFileStore(FileStore):
 
                 for thread in self.workers:
                     thread.join()
+                statistics = self.asyncWriteStatistics()
+                if statistics['files'] > 0:
+                    logger.debug('Wrote %(files)i files of %(bytes)i bytes in total to the job '
+                                 'store asynchronously in %(seconds).2f seconds.', statistics)
 
                 # Wait till input block-fn returns - in the event of an exception
                 # this will eventually terminate
@@ -1576,8 +2026,9 @@ class CachingFileStore(FileStore):
         """
         :param dir_: The directory that will contain the cache state file.
         """
-        cacheInfo = cls._CacheState._load(os.path.join(dir_, '_cacheState'))
+        cacheInfo = cls._CacheState(os.path.join(dir_, '_cacheState'))
         cls.findAndHandleDeadJobs(cacheInfo, batchSystemShutdown=True)
+        cacheInfo.close()
         shutil.rmtree(dir_)
 
     def __del__(self):
@@ -1623,6 +2074,7 @@ class NonCachingFileStore(FileStore):
             os.chdir(self.localTempDir)
             yield
         finally:
+            self._waitForPrefetches()
             diskUsed = getDirSizeRecursively(self.localTempDir)
             logString = ("Job {jobName} used {percent:.2f}% ({humanDisk}B [{disk}B] used, "
                          "{humanRequestedDisk}B [{requestedDisk}B] requested) at the end of "
@@ -65,6 +65,8 @@ class JobLikeObject(object):
     If the object doesn't specify explicit requirements, these properties will fall back
     to the configured defaults. If the value cannot be determined, an AttributeError is raised.
     """
+    __slots__ = ('unitName', 'jobName', '_cores', '_memory', '_disk', '_preemptable', '_config')
+
     def __init__(self, requirements, unitName, jobName=None):
         cores = requirements.get('cores')
         memory = requirements.get('memory')
@@ -197,6 +199,18 @@ class JobNode(JobLikeObject):
     """
     This object bridges the job graph, job, and batchsystem classes
     """
+    __slots__ = ('jobStoreID', 'predecessorNumber', 'command')
+
+    # The attributes making up the persistent state of an instance, in the order they are encoded
+    # by __getstate__(). Subclasses extend this tuple by appending to it, which makes the
+    # encoding of a subclass instance start with that of its base class.
+    _encodedFields = ('jobStoreID', 'command', 'unitName', 'jobName',
+                      '_cores', '_memory', '_disk', '_preemptable', 'predecessorNumber')
+
+    # The version of the encoding. Must be incremented whenever _encodedFields is changed in a
+    # way that __setstate__() needs to know about, i.e. when fields are removed or reordered.
+    _encodingVersion = 1
+
     def __init__(self, requirements, jobName, unitName, jobStoreID,
                  command, predecessorNumber=1):
         super(JobNode, self).__init__(requirements=requirements, unitName=unitName, jobName=jobName)
@@ -204,6 +218,30 @@ class JobNode(JobLikeObject):
         self.predecessorNumber = predecessorNumber
         self.command = command
 
+    def __getstate__(self):
+        """
+        Returns a compact encoding of this instance for pickling: a flat tuple of the encoding
+        version followed by the values of the encoded fields. In contrast to the default
+        encoding, a dictionary, the names of the fields are not repeated in every record.
+        Successors in a job graph's stack are JobNodes too and are encoded the same way.
+        """
+        return (self._encodingVersion,) + tuple(getattr(self, name)
+                                                for name in self._encodedFields)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            # An instance pickled before the compact encoding was introduced
+            values = state
+        else:
+            version = state[0]
+            if version != self._encodingVersion:
+                raise RuntimeError("Unsupported version %r of the encoding of a %s"
+                                   % (version, self.__class__.__name__))
+            values = dict(zip(self._encodedFields, state[1:]))
+        for name in self._encodedFields:
+            setattr(self, name, values.get(name))
+        self._config = None
+
     def __str__(self):
         return super(JobNode, self).__str__() + ' ' + self.jobStoreID
 
@@ -212,7 +250,7 @@ class JobNode(JobLikeObject):
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.__getstate__() == other.__getstate__()
         return NotImplemented
 
     def __ne__(self, other):
@@ -221,7 +259,8 @@ class JobNode(JobLikeObject):
         return NotImplemented
 
     def __repr__(self):
-        return '%s( **%r )' % (self.__class__.__name__, self.__dict__)
+        return '%s( **%r )' % (self.__class__.__name__,
+                               {name: getattr(self, name) for name in self._encodedFields})
 
     @classmethod
     def fromJobGraph(cls, jobGraph):
@@ -261,7 +300,7 @@ class Job(JobLikeObject):
     Class represents a unit of work in toil.
     """
     def __init__(self, memory=None, cores=None, disk=None, preemptable=None, unitName=None,
-                 checkpoint=False):
+                 checkpoint=False, inputFiles=None):
         """
         This method must be called by any overriding constructor.
 
@@ -273,6 +312,10 @@ class Job(JobLikeObject):
             exhausting all their retries, remove any successor jobs and rerun this job to restart the
             subtree. Job must be a leaf vertex in the job graph when initially defined, see
             :func:`toil.job.Job.checkNewCheckpointsAreCutVertices`.
+        :param inputFiles: the IDs of global files the job is going to read, or a promise of
+            them. With caching enabled, the worker starts downloading these files into the cache
+            before the run method is called, so reading them there is likely to be a cache hit.
+        :type inputFiles: list[toil.fileStore.FileID] or toil.job.Promise
         :type cores: int or string convertable by bd2k.util.humanize.human2bytes to an int
         :type disk: int or string convertable by bd2k.util.humanize.human2bytes to an int
         :type preemptable: bool
@@ -283,6 +326,7 @@ class Job(JobLikeObject):
                         'preemptable': preemptable}
         super(Job, self).__init__(requirements=requirements, unitName=unitName)
         self.checkpoint = checkpoint
+        self.inputFiles = inputFiles
         #Private class variables
 
         #See Job.addChild
@@ -1337,9 +1381,9 @@ class FunctionWrappingJob(Job):
         :param callable userFunction: The function to wrap. It will be called with ``*args`` and
                ``**kwargs`` as arguments.
 
-        The keywords ``memory``, ``cores``, ``disk``, ``preemptable`` and ``checkpoint`` are
-        reserved keyword arguments that if specified will be used to determine the resources
-        required for the job, as :func:`toil.job.Job.__init__`. If they are keyword arguments to
+        The keywords ``memory``, ``cores``, ``disk``, ``preemptable``, ``checkpoint`` and
+        ``inputFiles`` are reserved keyword arguments that if specified will be used to determine
+        the resources required for the job, as :func:`toil.job.Job.__init__`. If they are keyword arguments to
         the function they will be extracted from the function definition, but may be overridden
         by the user (as you would expect).
         """
@@ -1373,7 +1417,8 @@ class FunctionWrappingJob(Job):
                      disk=resolve('disk', dehumanize=True),
                      preemptable=resolve('preemptable'),
                      checkpoint=resolve('checkpoint', default=False),
-                     unitName=resolve('name', default=None))
+                     unitName=resolve('name', default=None),
+                     inputFiles=resolve('inputFiles'))
 
         self.userFunctionModule = ModuleDescriptor.forModule(userFunction.__module__).globalize()
         self.userFunctionName = str(userFunction.__name__)
@@ -1547,6 +1592,10 @@ class EncapsulatedJob(Job):
 
 
 class ServiceJobNode(JobNode):
+    __slots__ = ('startJobStoreID', 'terminateJobStoreID', 'errorJobStoreID')
+
+    _encodedFields = JobNode._encodedFields + __slots__
+
     def __init__(self, jobStoreID, memory, cores, disk, preemptable, startJobStoreID, terminateJobStoreID,
                  errorJobStoreID, unitName, jobName, command, predecessorNumber):
         requirements = dict(memory=memory, cores=cores, disk=disk, preemptable=preemptable)
@@ -26,6 +26,12 @@ class JobGraph(JobNode):
     scripts is persisted separately since it may be much bigger than the state managed by this
     class and should therefore only be held in memory for brief periods of time.
     """
+    __slots__ = ('remainingRetryCount', 'filesToDelete', 'predecessorsFinished', 'stack',
+                 'logJobStoreFileID', 'services', 'terminateJobStoreID', 'startJobStoreID',
+                 'errorJobStoreID', 'checkpoint', 'checkpointFilesToDelete', 'chainedJobs')
+
+    _encodedFields = JobNode._encodedFields + __slots__
+
     def __init__(self, command, memory, cores, disk, unitName, jobName, preemptable,
                  jobStoreID, remainingRetryCount, predecessorNumber,
                  filesToDelete=None, predecessorsFinished=None,
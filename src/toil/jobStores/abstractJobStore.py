@@ -465,7 +465,7 @@ class AbstractJobStore(with_metaclass(ABCMeta, object)):
                 try:
                     return jobCache[jobId]
                 except KeyError:
-                    self.load(jobId)
+                    return self.load(jobId)
             else:
                 return self.load(jobId)
 
@@ -489,21 +489,26 @@ class AbstractJobStore(with_metaclass(ABCMeta, object)):
         reachableFromRoot = set()
 
         def getConnectedJobs(jobGraph):
-            if jobGraph.jobStoreID in reachableFromRoot:
-                return
-            reachableFromRoot.add(jobGraph.jobStoreID)
-            # Traverse jobs in stack
-            for jobs in jobGraph.stack:
-                for successorJobStoreID in [x.jobStoreID for x in jobs]:
-                    if (successorJobStoreID not in reachableFromRoot
-                        and haveJob(successorJobStoreID)):
-                        getConnectedJobs(getJob(successorJobStoreID))
-            # Traverse service jobs
-            for jobs in jobGraph.services:
-                for serviceJobStoreID in [x.jobStoreID for x in jobs]:
-                    if haveJob(serviceJobStoreID):
-                        assert serviceJobStoreID not in reachableFromRoot
-                        reachableFromRoot.add(serviceJobStoreID)
+            # The graph is traversed with an explicit stack as deep chains of jobs would exceed
+            # the recursion limit
+            jobsToTraverse = [jobGraph]
+            while jobsToTraverse:
+                jobGraph = jobsToTraverse.pop()
+                if jobGraph.jobStoreID in reachableFromRoot:
+                    continue
+                reachableFromRoot.add(jobGraph.jobStoreID)
+                # Traverse jobs in stack
+                for jobs in jobGraph.stack:
+                    for successorJobStoreID in [x.jobStoreID for x in jobs]:
+                        if (successorJobStoreID not in reachableFromRoot
+                            and haveJob(successorJobStoreID)):
+                            jobsToTraverse.append(getJob(successorJobStoreID))
+                # Traverse service jobs
+                for jobs in jobGraph.services:
+                    for serviceJobStoreID in [x.jobStoreID for x in jobs]:
+                        if haveJob(serviceJobStoreID):
+                            assert serviceJobStoreID not in reachableFromRoot
+                            reachableFromRoot.add(serviceJobStoreID)
 
         logger.info("Checking job graph connectivity...")
         getConnectedJobs(self.loadRootJob())
@@ -897,6 +902,18 @@ class AbstractJobStore(with_metaclass(ABCMeta, object)):
         """
         raise NotImplementedError()
 
+    def getContentHash(self, jobStoreFileID):
+        """
+        Returns a digest of the contents of the given file if the job store knows it, e.g.
+        because it shares the contents of files with identical contents. Files with the same
+        digest have the same contents, so a cache can hold a single copy of them.
+
+        :param str jobStoreFileID: an ID referencing the file
+        :return: the hexadecimal digest or None if the job store doesn't know the digest
+        :rtype: str|None
+        """
+        return None
+
     @abstractmethod
     def updateFile(self, jobStoreFileID, localFilePath):
         """
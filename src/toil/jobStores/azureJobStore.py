@@ -766,6 +766,7 @@ class AzureJob(JobGraph):
     Copied almost entirely from AWSJob, except to take into account the
     fact that Azure properties must start with a letter or underscore.
     """
+    __slots__ = ()
 
     defaultAttrs = ['PartitionKey', 'RowKey', 'etag', 'Timestamp']
 
@@ -16,6 +16,8 @@ from __future__ import absolute_import
 
 from builtins import range
 from contextlib import contextmanager
+from itertools import islice
+from multiprocessing.pool import ThreadPool
 import logging
 import random
 import shutil
@@ -23,6 +25,9 @@ import os
 import tempfile
 import stat
 import errno
+import hashlib
+import re
+import struct
 
 try:
     import cPickle as pickle
@@ -65,7 +70,11 @@ class FileJobStore(AbstractJobStore):
         logger.debug("Path to job store directory is '%s'.", self.jobStoreDir)
         # Directory where temporary files go
         self.tempFilesDir = os.path.join(self.jobStoreDir, 'tmp')
+        # Directory holding one hard link to each distinct file written while deduplicating
+        self.blobsDir = os.path.join(self.jobStoreDir, 'blobs')
         self.linkImports = None
+        # The jobs created or updated within the current batch, by job store ID
+        self._batchedJobGraphs = None
 
     def initialize(self, config):
         try:
@@ -102,21 +111,27 @@ class FileJobStore(AbstractJobStore):
         # Make the job
         job = JobGraph.fromJobNode(jobNode, jobStoreID=self._getRelativePath(absJobDir),
                                    tryCount=self._defaultTryCount())
-        if hasattr(self, "_batchedJobGraphs") and self._batchedJobGraphs is not None:
-            self._batchedJobGraphs.append(job)
-        else:
-            self.update(job)
+        self.update(job)
         return job
 
     @contextmanager
     def batch(self):
-        self._batchedJobGraphs = []
-        yield
-        for jobGraph in self._batchedJobGraphs:
-            self.update(jobGraph)
-        self._batchedJobGraphs = None
+        """
+        Defers the writing of all jobs created or updated within the batch until its end, when
+        they are written to a single segment file, see :meth:`_writeSegment`. Within the batch,
+        :meth:`load` and :meth:`exists` reflect the deferred writes.
+        """
+        self._batchedJobGraphs = {}
+        try:
+            yield
+            if self._batchedJobGraphs:
+                self._writeSegment(list(self._batchedJobGraphs.values()))
+        finally:
+            self._batchedJobGraphs = None
 
     def exists(self, jobStoreID):
+        if self._batchedJobGraphs is not None and jobStoreID in self._batchedJobGraphs:
+            return True
         return os.path.exists(self._getJobFileName(jobStoreID))
 
     def getPublicUrl(self, jobStoreFileID):
@@ -135,11 +150,19 @@ class FileJobStore(AbstractJobStore):
             raise NoSuchFileException(sharedFileName)
 
     def load(self, jobStoreID):
+        if self._batchedJobGraphs is not None and jobStoreID in self._batchedJobGraphs:
+            # The job hasn't been written yet. Return a copy, just like a job read from its file.
+            return pickle.loads(pickle.dumps(self._batchedJobGraphs[jobStoreID],
+                                             pickle.HIGHEST_PROTOCOL))
         self._checkJobStoreId(jobStoreID)
         # Load a valid version of the job
         jobFile = self._getJobFileName(jobStoreID)
-        with open(jobFile, 'r') as fileHandle:
-            job = pickle.load(fileHandle)
+        with open(jobFile, 'rb') as fileHandle:
+            if fileHandle.read(len(self.segmentMagic)) == self.segmentMagic:
+                job = self._loadFromSegment(fileHandle, jobStoreID)
+            else:
+                fileHandle.seek(0)
+                job = pickle.load(fileHandle)
         # The following cleans up any issues resulting from the failure of the
         # job during writing by the batch system.
         if os.path.isfile(jobFile + ".new"):
@@ -149,31 +172,181 @@ class FileJobStore(AbstractJobStore):
         return job
 
     def update(self, job):
+        if self._batchedJobGraphs is not None:
+            self._batchedJobGraphs[job.jobStoreID] = job
+            return
         # The job is serialised to a file suffixed by ".new"
         # The file is then moved to its correct path.
         # Atomicity guarantees use the fact the underlying file systems "move"
         # function is atomic.
-        with open(self._getJobFileName(job.jobStoreID) + ".new", 'w') as f:
-            pickle.dump(job, f)
+        with open(self._getJobFileName(job.jobStoreID) + ".new", 'wb') as f:
+            pickle.dump(job, f, pickle.HIGHEST_PROTOCOL)
         # This should be atomic for the file system
         os.rename(self._getJobFileName(job.jobStoreID) + ".new", self._getJobFileName(job.jobStoreID))
 
     def delete(self, jobStoreID):
         # The jobStoreID is the relative path to the directory containing the job,
         # removing this directory deletes the job.
+        if self._batchedJobGraphs is not None:
+            self._batchedJobGraphs.pop(jobStoreID, None)
         if self.exists(jobStoreID):
+            # Files written into the job's directory may share their contents with files of
+            # other jobs, so their blobs can only be released once the directory is gone
+            filesDir = os.path.join(self._getAbsPath(jobStoreID), 'g')
+            digests = [_f for _f in map(self._contentDigest, os.listdir(filesDir)) if _f]
             shutil.rmtree(self._getAbsPath(jobStoreID))
+            for digest in digests:
+                self._releaseBlob(digest)
+
+    # The number of threads loading jobs concurrently in jobs() and the maximum number of jobs
+    # those threads load ahead of the caller
+    jobLoadingThreads = 16
+    jobLoadingBatchSize = 256
 
     def jobs(self):
+        # Job files are loaded by a pool of threads, a bounded batch at a time, which hides the
+        # latency of the file system when every job is loaded, e.g. on restart
+        pool = ThreadPool(self.jobLoadingThreads)
+        try:
+            jobStoreIDs = self._jobStoreIDs()
+            while True:
+                batch = list(islice(jobStoreIDs, self.jobLoadingBatchSize))
+                if not batch:
+                    break
+                for job in pool.map(self._loadIfExists, batch):
+                    if job is not None:
+                        yield job
+        finally:
+            pool.close()
+            pool.join()
+
+    def _jobStoreIDs(self):
         # Walk through list of temporary directories searching for jobs
         for tempDir in self._tempDirectories():
             for i in os.listdir(tempDir):
                 if i.startswith( 'job' ):
-                    try:
-                        yield self.load(self._getRelativePath(os.path.join(tempDir, i)))
-                    except NoSuchJobException:
-                        # An orphaned job may leave an empty or incomplete job file which we can safely ignore
-                        pass
+                    yield self._getRelativePath(os.path.join(tempDir, i))
+
+    def _loadIfExists(self, jobStoreID):
+        try:
+            return self.load(jobStoreID)
+        except NoSuchJobException:
+            # An orphaned job may leave an empty or incomplete job file which we can safely ignore
+            return None
+
+    # Identifies a job file that is a hard link to a segment written by _writeSegment()
+    segmentMagic = b'TOILSEG1'
+
+    # The format of an entry in a segment's index: the first 8 bytes of the SHA1 digest of the
+    # job store ID and the offset of the job's record
+    segmentIndexEntry = struct.Struct('>8sQ')
+
+    # The format of a segment's trailer: the offset of the index and the number of entries in it
+    segmentTrailer = struct.Struct('>QQ')
+
+    def _writeSegment(self, jobGraphs):
+        """
+        Writes the given jobs to a single segment file, followed by a compact index sorted by a
+        digest of the job store ID, and syncs its data to disk with a single fsync. The segment is then
+        hard-linked into place as the job file of each job, atomically replacing any existing
+        one. Compared to writing a separate file per job, this saves one file creation and one
+        data write per job, which are expensive on parallel file systems. Since job files are
+        never modified in place, the segment is removed by the file system once the last job
+        linking to it has been updated or deleted.
+
+        The segment is written among the job store's temporary files, like the files created
+        by :meth:`_getTempFile`, so a segment orphaned by a crash is never mistaken for a job.
+        The directories of the job files are synced once all links are in place, so the batch
+        is durable when this method returns.
+
+        :param list[JobGraph] jobGraphs: the jobs to write
+        """
+        fd, segmentPath = tempfile.mkstemp(prefix='segment', dir=self._getTempSharedDir())
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.segmentMagic)
+                index = []
+                for jobGraph in jobGraphs:
+                    index.append((self._segmentKey(jobGraph.jobStoreID), f.tell()))
+                    pickle.dump(jobGraph, f, pickle.HIGHEST_PROTOCOL)
+                index.sort()
+                indexOffset = f.tell()
+                for key, offset in index:
+                    f.write(self.segmentIndexEntry.pack(key, offset))
+                f.write(self.segmentTrailer.pack(indexOffset, len(index)))
+                f.flush()
+                os.fsync(f.fileno())
+            jobDirs = set()
+            for jobGraph in jobGraphs:
+                jobFile = self._getJobFileName(jobGraph.jobStoreID)
+                try:
+                    # Newly created jobs don't have a job file yet ...
+                    os.link(segmentPath, jobFile)
+                except OSError as e:
+                    if e.errno != errno.EEXIST:
+                        raise
+                    # ... others need an atomic replacement of the existing one. A link left
+                    # behind by a crash between linking and renaming is simply replaced.
+                    self._removeIfExists(jobFile + '.segment')
+                    os.link(segmentPath, jobFile + '.segment')
+                    os.rename(jobFile + '.segment', jobFile)
+                jobDirs.add(os.path.dirname(jobFile))
+            for jobDir in jobDirs:
+                self._syncDir(jobDir)
+        finally:
+            os.unlink(segmentPath)
+
+    @staticmethod
+    def _removeIfExists(path):
+        try:
+            os.unlink(path)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    @staticmethod
+    def _syncDir(dirPath):
+        """
+        Flushes the changes to the entries of the given directory to disk.
+        """
+        fd = os.open(dirPath, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _loadFromSegment(self, fileHandle, jobStoreID):
+        """
+        Loads a job from a segment written by :meth:`_writeSegment` by binary search of the
+        segment's index.
+
+        :param fileHandle: the open segment
+        :param str jobStoreID: the job to load
+        :rtype: JobGraph
+        """
+        key = self._segmentKey(jobStoreID)
+        fileHandle.seek(-self.segmentTrailer.size, os.SEEK_END)
+        indexOffset, count = self.segmentTrailer.unpack(fileHandle.read(self.segmentTrailer.size))
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            fileHandle.seek(indexOffset + mid * self.segmentIndexEntry.size)
+            midKey, offset = self.segmentIndexEntry.unpack(
+                fileHandle.read(self.segmentIndexEntry.size))
+            if midKey < key:
+                lo = mid + 1
+            elif midKey > key:
+                hi = mid
+            else:
+                fileHandle.seek(offset)
+                job = pickle.load(fileHandle)
+                assert job.jobStoreID == jobStoreID
+                return job
+        raise NoSuchJobException(jobStoreID)
+
+    @staticmethod
+    def _segmentKey(jobStoreID):
+        return hashlib.sha1(jobStoreID.encode('utf-8')).digest()[:8]
 
     ##########################################
     # Functions that deal with temporary files associated with jobs
@@ -196,6 +369,13 @@ class FileJobStore(AbstractJobStore):
     def _importFile(self, otherCls, url, sharedFileName=None):
         if issubclass(otherCls, FileJobStore):
             if sharedFileName is None:
+                if self.config.deduplicateFiles:
+                    def copy(absPath):
+                        os.unlink(absPath)
+                        self._copyOrLink(url, absPath)
+                    absPath = self._getAbsPath(
+                        self._writeDeduplicated(self._extractPathFromUrl(url), None, copy))
+                    return FileID(self._getRelativePath(absPath), os.stat(absPath).st_size)
                 fd, absPath = self._getTempFile()  # use this to get a valid path to write to in job store
                 os.close(fd)
                 os.unlink(absPath)
@@ -244,11 +424,117 @@ class FileJobStore(AbstractJobStore):
         return url.scheme.lower() == 'file'
 
     def writeFile(self, localFilePath, jobStoreID=None):
+        if self.config.deduplicateFiles:
+            return self._writeDeduplicated(localFilePath, jobStoreID,
+                                           lambda absPath: shutil.copyfile(localFilePath, absPath))
         fd, absPath = self._getTempFile(jobStoreID)
         shutil.copyfile(localFilePath, absPath)
         os.close(fd)
         return self._getRelativePath(absPath)
 
+    def _writeDeduplicated(self, localFilePath, jobStoreID, copy):
+        """
+        Writes the given file to the job store, sharing its contents with every other file of
+        the same contents written while config.deduplicateFiles is set. The SHA-1 digest of the
+        contents is part of the returned file ID and the file is hard-linked to the blob named by
+        that digest, so the number of links to the blob counts the files sharing it.
+
+        :param str localFilePath: path of the file to write
+        :param str jobStoreID: see writeFile
+        :param copy: function that copies the file to the absolute path it is passed, which it
+               may have to replace, if no file of the same contents is stored yet
+        :return: the ID of the written file
+        :rtype: str
+        """
+        digest = self._hashFile(localFilePath)
+        fd, absPath = self._getTempFile(jobStoreID, suffix='.%s.tmp' % digest)
+        os.close(fd)
+        blobPath = self._getBlobPath(digest)
+        try:
+            # Rename the link over the file so the file is replaced atomically
+            os.link(blobPath, absPath + '.link')
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            copy(absPath)
+            try:
+                os.link(absPath, blobPath)
+            except OSError as e:
+                # Another file of the same contents was written concurrently, this one just
+                # doesn't share its contents with it
+                if e.errno != errno.EEXIST:
+                    raise
+        else:
+            os.rename(absPath + '.link', absPath)
+        return self._getRelativePath(absPath)
+
+    @staticmethod
+    def _hashFile(localFilePath):
+        """
+        :return: the hexadecimal SHA-1 digest of the contents of the given file
+        :rtype: str
+        """
+        digest = hashlib.sha1()
+        with open(localFilePath, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _getBlobPath(self, digest):
+        """
+        :return: the path of the blob holding the contents of the given digest, creating the
+                 directory it is placed in if necessary
+        :rtype: str
+        """
+        blobDir = os.path.join(self.blobsDir, digest[:2])
+        if not os.path.exists(blobDir):
+            try:
+                os.makedirs(blobDir)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+        return os.path.join(blobDir, digest)
+
+    _digestPattern = re.compile(r'\.([0-9a-f]{40})\.tmp$')
+
+    @classmethod
+    def _contentDigest(cls, jobStoreFileID):
+        """
+        :return: the digest embedded in the name of a file written by _writeDeduplicated or None
+                 if the file was written otherwise
+        :rtype: str|None
+        """
+        match = cls._digestPattern.search(jobStoreFileID)
+        return match.group(1) if match else None
+
+    def _releaseBlob(self, digest):
+        """
+        Removes the blob of the given digest if no file in the job store shares it anymore.
+        """
+        blobPath = self._getBlobPath(digest)
+        try:
+            if os.stat(blobPath).st_nlink == 1:
+                os.remove(blobPath)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def getContentHash(self, jobStoreFileID):
+        digest = self._contentDigest(jobStoreFileID)
+        if digest is not None:
+            try:
+                fileStats = os.stat(self._getAbsPath(jobStoreFileID))
+                blobStats = os.stat(self._getBlobPath(digest))
+            except OSError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+            else:
+                # Updating the file or failing to link it to the blob leaves it with contents
+                # of its own
+                if (fileStats.st_dev, fileStats.st_ino) == (blobStats.st_dev, blobStats.st_ino):
+                    return digest
+        return None
+
     @contextmanager
     def writeFileStream(self, jobStoreID=None):
         fd, absPath = self._getTempFile(jobStoreID)
@@ -262,14 +548,34 @@ class FileJobStore(AbstractJobStore):
 
     def updateFile(self, jobStoreFileID, localFilePath):
         self._checkJobStoreFileID(jobStoreFileID)
-        shutil.copyfile(localFilePath, self._getAbsPath(jobStoreFileID))
+        with self._breakingLink(jobStoreFileID) as absPath:
+            shutil.copyfile(localFilePath, absPath)
+
+    @contextmanager
+    def _breakingLink(self, jobStoreFileID):
+        """
+        A context manager yielding the path to write the new contents of the given file to. A
+        file that shares its contents with other files is replaced by a new one rather than
+        being overwritten in place.
+        """
+        absPath = self._getAbsPath(jobStoreFileID)
+        digest = self._contentDigest(jobStoreFileID)
+        if digest is None:
+            yield absPath
+        else:
+            yield absPath + '.new'
+            os.rename(absPath + '.new', absPath)
+            self._releaseBlob(digest)
 
     def readFile(self, jobStoreFileID, localFilePath):
         self._checkJobStoreFileID(jobStoreFileID)
         jobStoreFilePath = self._getAbsPath(jobStoreFileID)
         localDirPath = os.path.dirname(localFilePath)
         # If local file would end up on same file system as the one hosting this job store ...
-        if os.stat(jobStoreFilePath).st_dev == os.stat(localDirPath).st_dev:
+        # A link to a file sharing its contents with other files would let it be modified
+        # through them, so deduplicated files are always copied.
+        if (not self.config.deduplicateFiles and
+                os.stat(jobStoreFilePath).st_dev == os.stat(localDirPath).st_dev):
             # ... we can hard-link the file, ...
             try:
                 os.link(jobStoreFilePath, localFilePath)
@@ -290,6 +596,9 @@ class FileJobStore(AbstractJobStore):
         if not self.fileExists(jobStoreFileID):
             return
         os.remove(self._getAbsPath(jobStoreFileID))
+        digest = self._contentDigest(jobStoreFileID)
+        if digest is not None:
+            self._releaseBlob(digest)
 
     def fileExists(self, jobStoreFileID):
         absPath = self._getAbsPath(jobStoreFileID)
@@ -307,8 +616,9 @@ class FileJobStore(AbstractJobStore):
         # File objects are context managers (CM) so we could simply return what open returns.
         # However, it is better to wrap it in another CM so as to prevent users from accessing
         # the file object directly, without a with statement.
-        with open(self._getAbsPath(jobStoreFileID), 'w') as f:
-            yield f
+        with self._breakingLink(jobStoreFileID) as absPath:
+            with open(absPath, 'w') as f:
+                yield f
 
     @contextmanager
     def readFileStream(self, jobStoreFileID):
@@ -445,7 +755,7 @@ class FileJobStore(AbstractJobStore):
         for tempDir in _dirs(self.tempFilesDir, self.levels):
             yield tempDir
 
-    def _getTempFile(self, jobStoreID=None):
+    def _getTempFile(self, jobStoreID=None, suffix=".tmp"):
         """
         :rtype : file-descriptor, string, string is the absolute path to a temporary file within
         the given job's (referenced by jobStoreID's) temporary file directory. The file-descriptor
@@ -455,8 +765,8 @@ class FileJobStore(AbstractJobStore):
         if jobStoreID != None:
             # Make a temporary file within the job's directory
             self._checkJobStoreId(jobStoreID)
-            return tempfile.mkstemp(suffix=".tmp",
+            return tempfile.mkstemp(suffix=suffix,
                                 dir=os.path.join(self._getAbsPath(jobStoreID), "g"))
         else:
             # Make a temporary file within the temporary file structure
-            return tempfile.mkstemp(prefix="tmp", suffix=".tmp", dir=self._getTempSharedDir())
+            return tempfile.mkstemp(prefix="tmp", suffix=suffix, dir=self._getTempSharedDir())
@@ -0,0 +1,484 @@
+# Copyright (C) 2015-2016 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+from contextlib import contextmanager
+from io import BytesIO
+import logging
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import uuid
+import errno
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+from bd2k.util.exceptions import require
+
+from toil.fileStore import FileID
+from toil.lib.bioio import absSymPath
+from toil.jobStores.abstractJobStore import (AbstractJobStore,
+                                             NoSuchJobException,
+                                             NoSuchFileException,
+                                             JobStoreExistsException,
+                                             NoSuchJobStoreException)
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.jobGraph import JobGraph
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteJobStore(AbstractJobStore):
+    """
+    A job store that keeps job records, file metadata and stats and logging messages in a single
+    SQLite database inside a directory on a locally attached file system. The contents of files
+    are kept as plain files next to the database. Every job store operation maps to a few
+    indexed queries in a single transaction instead of the directory walks, temporary files and
+    renames done by :class:`FileJobStore`.
+
+    The database is used in write-ahead logging (WAL) mode which lets readers proceed while a
+    writer is active. WAL mode requires all processes accessing the database to be on the same
+    host so this job store is only suitable for batch systems that run all jobs on the leader's
+    machine, e.g. the single machine batch system.
+    """
+
+    databaseName = 'jobStore.db'
+
+    # How long to wait for a lock held by another connection before giving up, in seconds
+    busyTimeout = 600
+
+    schema = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            jobStoreID TEXT PRIMARY KEY,
+            pickle BLOB NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS files (
+            jobStoreFileID TEXT PRIMARY KEY,
+            jobStoreID TEXT
+        );
+        CREATE INDEX IF NOT EXISTS filesByJob ON files (jobStoreID);
+        CREATE TABLE IF NOT EXISTS stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            data BLOB NOT NULL,
+            read INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS unreadStats ON stats (read);
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: Path to directory holding the job store
+        """
+        super(SQLiteJobStore, self).__init__()
+        self.jobStoreDir = absSymPath(path)
+        logger.debug("Path to job store directory is '%s'.", self.jobStoreDir)
+        self.databasePath = os.path.join(self.jobStoreDir, self.databaseName)
+        # Directory holding the contents of files
+        self.filesDir = os.path.join(self.jobStoreDir, 'files')
+        # Directory where files are written before being moved into place
+        self.tempFilesDir = os.path.join(self.jobStoreDir, 'tmp')
+        # SQLite connections can't be shared between threads nor survive a fork, so each thread
+        # of each process gets its own, see _connection()
+        self._local = threading.local()
+
+    def initialize(self, config):
+        try:
+            os.mkdir(self.jobStoreDir)
+        except OSError as e:
+            if e.errno == errno.EEXIST:
+                raise JobStoreExistsException(self.jobStoreDir)
+            else:
+                raise
+        os.mkdir(self.filesDir)
+        os.mkdir(self.tempFilesDir)
+        connection = self._connection()
+        # WAL mode is persistent, i.e. it only needs to be enabled once for the database
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(self.schema)
+        super(SQLiteJobStore, self).initialize(config)
+
+    def resume(self):
+        if not os.path.exists(self.databasePath):
+            raise NoSuchJobStoreException(self.jobStoreDir)
+        require(os.path.isdir(self.jobStoreDir), "'%s' is not a directory", self.jobStoreDir)
+        super(SQLiteJobStore, self).resume()
+
+    def destroy(self):
+        self._closeConnection()
+        if os.path.exists(self.jobStoreDir):
+            shutil.rmtree(self.jobStoreDir)
+
+    ##########################################
+    # The following methods deal with creating/loading/updating/writing/checking for the
+    # existence of jobs
+    ##########################################
+
+    def create(self, jobNode):
+        job = JobGraph.fromJobNode(jobNode, jobStoreID=self._newID(),
+                                   tryCount=self._defaultTryCount())
+        with self._transaction() as connection:
+            connection.execute('INSERT INTO jobs (jobStoreID, pickle) VALUES (?, ?)',
+                               (job.jobStoreID, self._pickle(job)))
+        return job
+
+    @contextmanager
+    def batch(self):
+        # All creates, updates and deletes in the batch are committed in a single transaction
+        with self._transaction():
+            yield
+
+    def exists(self, jobStoreID):
+        cursor = self._connection().execute('SELECT 1 FROM jobs WHERE jobStoreID = ?',
+                                            (jobStoreID,))
+        return cursor.fetchone() is not None
+
+    def getPublicUrl(self, jobStoreFileID):
+        self._checkJobStoreFileID(jobStoreFileID)
+        return 'file:' + self._getAbsPath(jobStoreFileID)
+
+    def getSharedPublicUrl(self, sharedFileName):
+        jobStorePath = self._getSharedFilePath(sharedFileName)
+        if os.path.exists(jobStorePath):
+            return 'file:' + jobStorePath
+        else:
+            raise NoSuchFileException(sharedFileName)
+
+    def load(self, jobStoreID):
+        cursor = self._connection().execute('SELECT pickle FROM jobs WHERE jobStoreID = ?',
+                                            (jobStoreID,))
+        row = cursor.fetchone()
+        if row is None:
+            raise NoSuchJobException(jobStoreID)
+        return self._unpickle(row[0])
+
+    def update(self, job):
+        with self._transaction() as connection:
+            cursor = connection.execute('UPDATE jobs SET pickle = ? WHERE jobStoreID = ?',
+                                        (self._pickle(job), job.jobStoreID))
+            if cursor.rowcount == 0:
+                raise NoSuchJobException(job.jobStoreID)
+
+    def delete(self, jobStoreID):
+        # Deleting a job also deletes the files associated with it
+        with self._transaction() as connection:
+            cursor = connection.execute('SELECT jobStoreFileID FROM files WHERE jobStoreID = ?',
+                                        (jobStoreID,))
+            jobStoreFileIDs = [row[0] for row in cursor]
+            connection.execute('DELETE FROM files WHERE jobStoreID = ?', (jobStoreID,))
+            connection.execute('DELETE FROM jobs WHERE jobStoreID = ?', (jobStoreID,))
+        for jobStoreFileID in jobStoreFileIDs:
+            self._removeFileContents(jobStoreFileID)
+
+    def jobs(self):
+        # Read all jobs up front so the cursor doesn't hold a read transaction open while the
+        # caller, possibly, modifies the job store
+        rows = self._connection().execute('SELECT pickle FROM jobs').fetchall()
+        for row in rows:
+            yield self._unpickle(row[0])
+
+    ##########################################
+    # Functions that deal with temporary files associated with jobs
+    ##########################################
+
+    def _importFile(self, otherCls, url, sharedFileName=None):
+        if issubclass(otherCls, FileJobStore) and sharedFileName is None:
+            srcPath = FileJobStore._extractPathFromUrl(url)
+            with self._newFile(None) as (tempPath, jobStoreFileID):
+                shutil.copyfile(srcPath, tempPath)
+            return FileID(jobStoreFileID, os.stat(srcPath).st_size)
+        else:
+            return super(SQLiteJobStore, self)._importFile(otherCls, url,
+                                                           sharedFileName=sharedFileName)
+
+    def _exportFile(self, otherCls, jobStoreFileID, url):
+        if issubclass(otherCls, FileJobStore):
+            self._checkJobStoreFileID(jobStoreFileID)
+            shutil.copyfile(self._getAbsPath(jobStoreFileID),
+                            FileJobStore._extractPathFromUrl(url))
+        else:
+            super(SQLiteJobStore, self)._exportFile(otherCls, jobStoreFileID, url)
+
+    # The contents of files are plain local files, so URLs of local files are handled exactly
+    # like FileJobStore does. FileJobStore claims those URLs, see _supportsUrl.
+
+    @classmethod
+    def getSize(cls, url):
+        return FileJobStore.getSize(url)
+
+    @classmethod
+    def _readFromUrl(cls, url, writable):
+        FileJobStore._readFromUrl(url, writable)
+
+    @classmethod
+    def _writeToUrl(cls, readable, url):
+        FileJobStore._writeToUrl(readable, url)
+
+    @classmethod
+    def _supportsUrl(cls, url, export=False):
+        return False
+
+    def writeFile(self, localFilePath, jobStoreID=None):
+        with self._newFile(jobStoreID) as (tempPath, jobStoreFileID):
+            shutil.copyfile(localFilePath, tempPath)
+        return jobStoreFileID
+
+    @contextmanager
+    def writeFileStream(self, jobStoreID=None):
+        with self._newFile(jobStoreID) as (tempPath, jobStoreFileID):
+            with open(tempPath, 'w') as f:
+                yield f, jobStoreFileID
+
+    def getEmptyFileStoreID(self, jobStoreID=None):
+        with self.writeFileStream(jobStoreID) as (fileHandle, jobStoreFileID):
+            return jobStoreFileID
+
+    def updateFile(self, jobStoreFileID, localFilePath):
+        self._checkJobStoreFileID(jobStoreFileID)
+        with self._replacedFile(jobStoreFileID) as tempPath:
+            shutil.copyfile(localFilePath, tempPath)
+
+    def readFile(self, jobStoreFileID, localFilePath):
+        self._checkJobStoreFileID(jobStoreFileID)
+        filePath = self._getAbsPath(jobStoreFileID)
+        localDirPath = os.path.dirname(localFilePath)
+        # Since updates replace the file instead of modifying it in place, hard-linking is safe
+        if os.stat(filePath).st_dev == os.stat(localDirPath).st_dev:
+            try:
+                os.link(filePath, localFilePath)
+            except OSError as e:
+                if e.errno == errno.EEXIST:
+                    # Overwrite existing file, emulating shutil.copyfile().
+                    os.unlink(localFilePath)
+                    os.link(filePath, localFilePath)
+                else:
+                    raise
+        else:
+            shutil.copyfile(filePath, localFilePath)
+
+    def deleteFile(self, jobStoreFileID):
+        with self._transaction() as connection:
+            connection.execute('DELETE FROM files WHERE jobStoreFileID = ?', (jobStoreFileID,))
+        self._removeFileContents(jobStoreFileID)
+
+    def fileExists(self, jobStoreFileID):
+        cursor = self._connection().execute('SELECT 1 FROM files WHERE jobStoreFileID = ?',
+                                            (jobStoreFileID,))
+        return cursor.fetchone() is not None
+
+    @contextmanager
+    def updateFileStream(self, jobStoreFileID):
+        self._checkJobStoreFileID(jobStoreFileID)
+        with self._replacedFile(jobStoreFileID) as tempPath:
+            with open(tempPath, 'w') as f:
+                yield f
+
+    @contextmanager
+    def readFileStream(self, jobStoreFileID):
+        self._checkJobStoreFileID(jobStoreFileID)
+        with open(self._getAbsPath(jobStoreFileID), 'r') as f:
+            yield f
+
+    ##########################################
+    # The following methods deal with shared files, i.e. files not associated
+    # with specific jobs.
+    ##########################################
+
+    def _getSharedFilePath(self, sharedFileName):
+        return os.path.join(self.jobStoreDir, sharedFileName)
+
+    @contextmanager
+    def writeSharedFileStream(self, sharedFileName, isProtected=None):
+        # the isProtected parameter has no effect on this job store
+        assert self._validateSharedFileName(sharedFileName)
+        fd, tempPath = tempfile.mkstemp(dir=self.tempFilesDir)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                yield f
+            os.rename(tempPath, self._getSharedFilePath(sharedFileName))
+        except:
+            os.unlink(tempPath)
+            raise
+
+    @contextmanager
+    def readSharedFileStream(self, sharedFileName):
+        assert self._validateSharedFileName(sharedFileName)
+        try:
+            with open(self._getSharedFilePath(sharedFileName), 'r') as f:
+                yield f
+        except IOError as e:
+            if e.errno == errno.ENOENT:
+                raise NoSuchFileException(sharedFileName, sharedFileName)
+            else:
+                raise
+
+    def writeStatsAndLogging(self, statsAndLoggingString):
+        with self._transaction() as connection:
+            connection.execute('INSERT INTO stats (data) VALUES (?)',
+                               (sqlite3.Binary(statsAndLoggingString),))
+
+    def readStatsAndLogging(self, callback, readAll=False):
+        connection = self._connection()
+        if readAll:
+            rows = connection.execute('SELECT id, data FROM stats ORDER BY id').fetchall()
+        else:
+            rows = connection.execute('SELECT id, data FROM stats WHERE read = 0 '
+                                      'ORDER BY id').fetchall()
+        for _, data in rows:
+            callback(BytesIO(bytes(data)))
+        with self._transaction() as connection:
+            connection.executemany('UPDATE stats SET read = 1 WHERE id = ?',
+                                   ((statsID,) for statsID, _ in rows))
+        return len(rows)
+
+    ##########################################
+    # Private methods
+    ##########################################
+
+    def _connection(self):
+        """
+        Returns the connection to the database for the current thread, opening it if necessary.
+
+        :rtype: sqlite3.Connection
+        """
+        local = self._local
+        pid = os.getpid()
+        if getattr(local, 'pid', None) != pid:
+            # Either this thread never opened a connection or it did so in a parent process. In
+            # the latter case the inherited connection must not be used, not even to close it.
+            connection = sqlite3.connect(self.databasePath,
+                                         timeout=self.busyTimeout,
+                                         isolation_level=None)
+            # In WAL mode, NORMAL is still safe against corruption but avoids a sync per commit
+            connection.execute('PRAGMA synchronous=NORMAL')
+            local.connection = connection
+            local.pid = pid
+            local.transactionDepth = 0
+        return local.connection
+
+    def _closeConnection(self):
+        local = self._local
+        if getattr(local, 'pid', None) == os.getpid():
+            local.connection.close()
+        local.pid = None
+        local.connection = None
+
+    @contextmanager
+    def _transaction(self):
+        """
+        A context manager for a write transaction on the current thread's connection. Nested
+        transactions are folded into the outermost one which is committed when it exits without
+        an exception and rolled back otherwise.
+
+        :rtype: sqlite3.Connection
+        """
+        connection = self._connection()
+        local = self._local
+        if local.transactionDepth == 0:
+            # Acquire the write lock up front so we never have to upgrade a read lock, which
+            # would fail immediately instead of waiting if another connection holds the lock.
+            connection.execute('BEGIN IMMEDIATE')
+        local.transactionDepth += 1
+        try:
+            yield connection
+        except:
+            local.transactionDepth -= 1
+            if local.transactionDepth == 0:
+                connection.execute('ROLLBACK')
+            raise
+        else:
+            local.transactionDepth -= 1
+            if local.transactionDepth == 0:
+                connection.execute('COMMIT')
+
+    @staticmethod
+    def _newID():
+        return uuid.uuid4().hex
+
+    @staticmethod
+    def _pickle(obj):
+        return sqlite3.Binary(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _unpickle(data):
+        return pickle.loads(bytes(data))
+
+    def _getAbsPath(self, jobStoreFileID):
+        """
+        Returns the path of the file holding the contents of the given file. Files are spread
+        over subdirectories by the first two characters of their ID to keep directories small.
+
+        :rtype: str
+        """
+        return os.path.join(self.filesDir, jobStoreFileID[:2], jobStoreFileID)
+
+    def _checkJobStoreFileID(self, jobStoreFileID):
+        """
+        :raise NoSuchFileException: if the jobStoreFileID does not exist
+        """
+        if not self.fileExists(jobStoreFileID):
+            raise NoSuchFileException(jobStoreFileID)
+
+    @contextmanager
+    def _newFile(self, jobStoreID):
+        """
+        A context manager for creating a file. Yields the path of a temporary file to write the
+        contents to and the ID of the new file. The file is registered when the context exits
+        without an exception.
+
+        :param str|None jobStoreID: the ID of the job to associate the file with, if any
+        """
+        if jobStoreID is not None and not self.exists(jobStoreID):
+            raise NoSuchJobException(jobStoreID)
+        jobStoreFileID = self._newID()
+        with self._replacedFile(jobStoreFileID) as tempPath:
+            yield tempPath, jobStoreFileID
+        with self._transaction() as connection:
+            connection.execute('INSERT INTO files (jobStoreFileID, jobStoreID) VALUES (?, ?)',
+                               (jobStoreFileID, jobStoreID))
+
+    @contextmanager
+    def _replacedFile(self, jobStoreFileID):
+        """
+        A context manager yielding the path of a temporary file that atomically replaces the
+        contents of the given file when the context exits without an exception. Local copies
+        hard-linked by :meth:`readFile` are therefore never modified.
+        """
+        fd, tempPath = tempfile.mkstemp(dir=self.tempFilesDir)
+        os.close(fd)
+        try:
+            yield tempPath
+            filePath = self._getAbsPath(jobStoreFileID)
+            try:
+                os.mkdir(os.path.dirname(filePath))
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            os.rename(tempPath, filePath)
+        except:
+            if os.path.exists(tempPath):
+                os.unlink(tempPath)
+            raise
+
+    def _removeFileContents(self, jobStoreFileID):
+        try:
+            os.unlink(self._getAbsPath(jobStoreFileID))
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
@@ -148,11 +148,20 @@ class Leader(object):
         self.clusterScaler = None if self.provisioner is None else ClusterScaler(self.provisioner, self, self.config)
 
         # A service manager thread to start and terminate services
-        self.serviceManager = ServiceManager(jobStore, self.toilState)
+        # The service manager wakes up the main loop if it is blocked on the batch system
+        self.serviceManager = ServiceManager(jobStore, self.toilState,
+                                             wakeUp=self.batchSystem.wakeUp)
 
         # A thread to manage the aggregation of statistics and logging from the run
         self.statsAndLogging = StatsAndLogging(self.jobStore, self.config)
 
+        # The longest time, in seconds, the main loop blocks waiting on the batch system when
+        # it has nothing else to do
+        self._maxUpdateWait = 2
+
+        # The most finished jobs gathered from the batch system in one pass of the main loop
+        self._maxUpdatesPerPass = 1000
+
         # Set used to monitor deadlocked jobs
         self.potentialDeadlockedJobs = set()
         self.potentialDeadlockTime = 0
@@ -229,6 +238,14 @@ class Leader(object):
     def innerLoop(self):
         """
         The main loop for processing jobs by the leader.
+
+        Each pass of the loop processes every job that is ready to be updated, drains the
+        service manager's queues and then gathers all the completed jobs available from the
+        batch system. The leader only blocks waiting on the batch system when there is nothing
+        else for it to do, so completions arriving in a burst are handled together rather than
+        one per pass. The service manager wakes the leader up through the batch system's
+        wakeUp() method whenever it has work for it, so services are handled without waiting
+        for the block to time out.
         """
         # Sets up the timing of the jobGraph rescuing method
         timeSinceJobsLastRescued = time.time()
@@ -236,233 +253,19 @@ class Leader(object):
         logger.info("Starting the main loop")
         while True:
             # Process jobs that are ready to be scheduled/have successors to schedule
-            if len(self.toilState.updatedJobs) > 0:
-                logger.debug('Built the jobs list, currently have %i jobs to update and %i jobs issued',
-                             len(self.toilState.updatedJobs), self.getNumberOfJobsIssued())
-
-                updatedJobs = self.toilState.updatedJobs # The updated jobs to consider below
-                self.toilState.updatedJobs = set() # Resetting the list for the next set
-
-                for jobGraph, resultStatus in updatedJobs:
-
-                    logger.debug('Updating status of job %s with ID %s: with result status: %s',
-                                 jobGraph, jobGraph.jobStoreID, resultStatus)
-
-                    # This stops a job with services being issued by the serviceManager from
-                    # being considered further in this loop. This catch is necessary because
-                    # the job's service's can fail while being issued, causing the job to be
-                    # added to updated jobs.
-                    if jobGraph in self.serviceManager.jobGraphsWithServicesBeingStarted:
-                        logger.debug("Got a job to update which is still owned by the service "
-                                     "manager: %s", jobGraph.jobStoreID)
-                        continue
-
-                    # If some of the jobs successors failed then either fail the job
-                    # or restart it if it has retries left and is a checkpoint job
-                    if jobGraph.jobStoreID in self.toilState.hasFailedSuccessors:
-
-                        # If the job has services running, signal for them to be killed
-                        # once they are killed then the jobGraph will be re-added to the
-                        # updatedJobs set and then scheduled to be removed
-                        if jobGraph.jobStoreID in self.toilState.servicesIssued:
-                            logger.debug("Telling job: %s to terminate its services due to successor failure",
-                                         jobGraph.jobStoreID)
-                            self.serviceManager.killServices(self.toilState.servicesIssued[jobGraph.jobStoreID],
-                                                        error=True)
-
-                        # If the job has non-service jobs running wait for them to finish
-                        # the job will be re-added to the updated jobs when these jobs are done
-                        elif jobGraph.jobStoreID in self.toilState.successorCounts:
-                            logger.debug("Job %s with ID: %s with failed successors still has successor jobs running",
-                                         jobGraph, jobGraph.jobStoreID)
-                            continue
-
-                        # If the job is a checkpoint and has remaining retries then reissue it.
-                        # The logic behind using > 1 rather than > 0 here: Since this job has
-                        # been tried once (without decreasing its retry count as the job
-                        # itself was successful), and its subtree failed, it shouldn't be retried
-                        # unless it has more than 1 try.
-                        elif jobGraph.checkpoint is not None and jobGraph.remainingRetryCount > 1:
-                            logger.warn('Job: %s is being restarted as a checkpoint after the total '
-                                        'failure of jobs in its subtree.', jobGraph.jobStoreID)
-                            self.issueJob(JobNode.fromJobGraph(jobGraph))
-                        else: # Mark it totally failed
-                            logger.debug("Job %s is being processed as completely failed", jobGraph.jobStoreID)
-                            self.processTotallyFailedJob(jobGraph)
-
-                    # If the jobGraph has a command it must be run before any successors.
-                    # Similarly, if the job previously failed we rerun it, even if it doesn't have a
-                    # command to run, to eliminate any parts of the stack now completed.
-                    elif jobGraph.command is not None or resultStatus != 0:
-                        isServiceJob = jobGraph.jobStoreID in self.toilState.serviceJobStoreIDToPredecessorJob
-
-                        # If the job has run out of retries or is a service job whose error flag has
-                        # been indicated, fail the job.
-                        if (jobGraph.remainingRetryCount == 0
-                            or isServiceJob and not self.jobStore.fileExists(jobGraph.errorJobStoreID)):
-                            self.processTotallyFailedJob(jobGraph)
-                            logger.warn("Job %s with ID %s is completely failed",
-                                        jobGraph, jobGraph.jobStoreID)
-                        else:
-                            # Otherwise try the job again
-                            self.issueJob(JobNode.fromJobGraph(jobGraph))
-
-                    # If the job has services to run, which have not been started, start them
-                    elif len(jobGraph.services) > 0:
-                        # Build a map from the service jobs to the job and a map
-                        # of the services created for the job
-                        assert jobGraph.jobStoreID not in self.toilState.servicesIssued
-                        self.toilState.servicesIssued[jobGraph.jobStoreID] = {}
-                        for serviceJobList in jobGraph.services:
-                            for serviceTuple in serviceJobList:
-                                serviceID = serviceTuple.jobStoreID
-                                assert serviceID not in self.toilState.serviceJobStoreIDToPredecessorJob
-                                self.toilState.serviceJobStoreIDToPredecessorJob[serviceID] = jobGraph
-                                self.toilState.servicesIssued[jobGraph.jobStoreID][serviceID] = serviceTuple
-
-                        # Use the service manager to start the services
-                        self.serviceManager.scheduleServices(jobGraph)
-
-                        logger.debug("Giving job: %s to service manager to schedule its jobs", jobGraph.jobStoreID)
-
-                    # There exist successors to run
-                    elif len(jobGraph.stack) > 0:
-                        assert len(jobGraph.stack[-1]) > 0
-                        logger.debug("Job: %s has %i successors to schedule",
-                                     jobGraph.jobStoreID, len(jobGraph.stack[-1]))
-                        #Record the number of successors that must be completed before
-                        #the jobGraph can be considered again
-                        assert jobGraph.jobStoreID not in self.toilState.successorCounts
-                        self.toilState.successorCounts[jobGraph.jobStoreID] = len(jobGraph.stack[-1])
-                        #List of successors to schedule
-                        successors = []
-
-                        #For each successor schedule if all predecessors have been completed
-                        for jobNode in jobGraph.stack[-1]:
-                            successorJobStoreID = jobNode.jobStoreID
-                            #Build map from successor to predecessors.
-                            if successorJobStoreID not in self.toilState.successorJobStoreIDToPredecessorJobs:
-                                self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID] = []
-                            self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID].append(jobGraph)
-                            #Case that the jobGraph has multiple predecessors
-                            if jobNode.predecessorNumber > 1:
-                                logger.debug("Successor job: %s of job: %s has multiple "
-                                             "predecessors", jobNode, jobGraph)
-
-                                # Get the successor job, using a cache
-                                # (if the successor job has already been seen it will be in this cache,
-                                # but otherwise put it in the cache)
-                                if successorJobStoreID not in self.toilState.jobsToBeScheduledWithMultiplePredecessors:
-                                    self.toilState.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID] = self.jobStore.load(successorJobStoreID)
-                                successorJobGraph = self.toilState.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID]
-
-                                #Add the jobGraph as a finished predecessor to the successor
-                                successorJobGraph.predecessorsFinished.add(jobGraph.jobStoreID)
-
-                                # If the successor is in the set of successors of failed jobs
-                                if successorJobStoreID in self.toilState.failedSuccessors:
-                                    logger.debug("Successor job: %s of job: %s has failed "
-                                                 "predecessors", jobNode, jobGraph)
-
-                                    # Add the job to the set having failed successors
-                                    self.toilState.hasFailedSuccessors.add(jobGraph.jobStoreID)
-
-                                    # Reduce active successor count and remove the successor as an active successor of the job
-                                    self.toilState.successorCounts[jobGraph.jobStoreID] -= 1
-                                    assert self.toilState.successorCounts[jobGraph.jobStoreID] >= 0
-                                    self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID].remove(jobGraph)
-                                    if len(self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID]) == 0:
-                                        self.toilState.successorJobStoreIDToPredecessorJobs.pop(successorJobStoreID)
-
-                                    # If the job now has no active successors add to active jobs
-                                    # so it can be processed as a job with failed successors
-                                    if self.toilState.successorCounts[jobGraph.jobStoreID] == 0:
-                                        logger.debug("Job: %s has no successors to run "
-                                                     "and some are failed, adding to list of jobs "
-                                                     "with failed successors", jobGraph)
-                                        self.toilState.successorCounts.pop(jobGraph.jobStoreID)
-                                        self.toilState.updatedJobs.add((jobGraph, 0))
-                                        continue
-
-                                # If the successor job's predecessors have all not all completed then
-                                # ignore the jobGraph as is not yet ready to run
-                                assert len(successorJobGraph.predecessorsFinished) <= successorJobGraph.predecessorNumber
-                                if len(successorJobGraph.predecessorsFinished) < successorJobGraph.predecessorNumber:
-                                    continue
-                                else:
-                                    # Remove the successor job from the cache
-                                    self.toilState.jobsToBeScheduledWithMultiplePredecessors.pop(successorJobStoreID)
-
-                            # Add successor to list of successors to schedule
-                            successors.append(jobNode)
-                        self.issueJobs(successors)
-
-                    elif jobGraph.jobStoreID in self.toilState.servicesIssued:
-                        logger.debug("Telling job: %s to terminate its services due to the "
-                                     "successful completion of its successor jobs",
-                                     jobGraph)
-                        self.serviceManager.killServices(self.toilState.servicesIssued[jobGraph.jobStoreID], error=False)
-
-                    #There are no remaining tasks to schedule within the jobGraph, but
-                    #we schedule it anyway to allow it to be deleted.
-
-                    #TODO: An alternative would be simple delete it here and add it to the
-                    #list of jobs to process, or (better) to create an asynchronous
-                    #process that deletes jobs and then feeds them back into the set
-                    #of jobs to be processed
-                    else:
-                        # Remove the job
-                        if jobGraph.remainingRetryCount > 0:
-                            self.issueJob(JobNode.fromJobGraph(jobGraph))
-                            logger.debug("Job: %s is empty, we are scheduling to clean it up", jobGraph.jobStoreID)
-                        else:
-                            self.processTotallyFailedJob(jobGraph)
-                            logger.warn("Job: %s is empty but completely failed - something is very wrong", jobGraph.jobStoreID)
+            numberOfJobsProcessed = self._processReadyJobs()
 
             # Start any service jobs available from the service manager
-            self.issueQueingServiceJobs()
-            while True:
-                serviceJob = self.serviceManager.getServiceJobsToStart(0)
-                # Stop trying to get jobs when function returns None
-                if serviceJob is None:
-                    break
-                logger.debug('Launching service job: %s', serviceJob)
-                self.issueServiceJob(serviceJob)
+            self._startServiceJobs()
 
             # Get jobs whose services have started
-            while True:
-                jobGraph = self.serviceManager.getJobGraphWhoseServicesAreRunning(0)
-                if jobGraph is None: # Stop trying to get jobs when function returns None
-                    break
-                logger.debug('Job: %s has established its services.', jobGraph.jobStoreID)
-                jobGraph.services = []
-                self.toilState.updatedJobs.add((jobGraph, 0))
-
-            # Gather any new, updated jobGraph from the batch system
-            updatedJobTuple = self.batchSystem.getUpdatedBatchJob(2)
-            if updatedJobTuple is not None:
-                jobID, result, wallTime = updatedJobTuple
-                # easy, track different state
-                try:
-                    updatedJob = self.jobBatchSystemIDToIssuedJob[jobID]
-                except KeyError:
-                    logger.warn("A result seems to already have been processed "
-                                "for job %s", jobID)
-                else:
-                    if result == 0:
-                        cur_logger = (logger.debug if str(updatedJob.jobName).startswith(CWL_INTERNAL_JOBS)
-                                      else logger.info)
-                        cur_logger('Job ended successfully: %s', updatedJob)
-                        if self.toilMetrics:
-                            self.toilMetrics.logCompletedJob(updatedJob)
-                    else:
-                        logger.warn('Job failed with exit value %i: %s',
-                                    result, updatedJob)
-                        if self.toilMetrics:
-                            self.toilMetrics.logFailedJob(updatedJob)
-                    self.processFinishedJob(jobID, result, wallTime=wallTime)
+            self._processJobsWithRunningServices()
 
-            else:
+            # Gather any new, updated jobGraphs from the batch system. If there is already work
+            # waiting for the next pass we only poll, otherwise we block for a short while or
+            # until the service manager wakes us up.
+            maxWait = 0 if len(self.toilState.updatedJobs) > 0 else self._maxUpdateWait
+            if self._gatherUpdatedJobs(maxWait) == 0:
                 # Process jobs that have gone awry
 
                 #In the case that there is nothing happening
@@ -497,7 +300,7 @@ class Leader(object):
                 logger.info("No jobs left to run so exiting.")
                 break
 
-            if len(updatedJobs) == 0 and len(self.toilState.updatedJobs) == 0:
+            if numberOfJobsProcessed == 0 and len(self.toilState.updatedJobs) == 0:
                 # Nothing happened this round. Check for deadlocks.
                 self.checkForDeadlocks()
 
@@ -512,6 +315,270 @@ class Leader(object):
         # assert self.toilState.jobsToBeScheduledWithMultiplePredecessors # These are not properly emptied yet
         # assert self.toilState.hasFailedSuccessors == set() # These are not properly emptied yet
 
+    def _processReadyJobs(self):
+        """
+        Processes, in bulk, all the jobs in toilState.updatedJobs. Jobs that become ready as a
+        consequence are added to a fresh set and handled in the next pass of the main loop.
+
+        :return: the number of jobs processed
+        :rtype: int
+        """
+        updatedJobs = self.toilState.updatedJobs # The updated jobs to consider below
+        if len(updatedJobs) == 0:
+            return 0
+        logger.debug('Built the jobs list, currently have %i jobs to update and %i jobs issued',
+                     len(updatedJobs), self.getNumberOfJobsIssued())
+        self.toilState.updatedJobs = set() # Resetting the list for the next set
+
+        for jobGraph, resultStatus in updatedJobs:
+
+            logger.debug('Updating status of job %s with ID %s: with result status: %s',
+                         jobGraph, jobGraph.jobStoreID, resultStatus)
+
+            # This stops a job with services being issued by the serviceManager from
+            # being considered further in this loop. This catch is necessary because
+            # the job's service's can fail while being issued, causing the job to be
+            # added to updated jobs.
+            if jobGraph in self.serviceManager.jobGraphsWithServicesBeingStarted:
+                logger.debug("Got a job to update which is still owned by the service "
+                             "manager: %s", jobGraph.jobStoreID)
+                continue
+
+            # If some of the jobs successors failed then either fail the job
+            # or restart it if it has retries left and is a checkpoint job
+            if jobGraph.jobStoreID in self.toilState.hasFailedSuccessors:
+
+                # If the job has services running, signal for them to be killed
+                # once they are killed then the jobGraph will be re-added to the
+                # updatedJobs set and then scheduled to be removed
+                if jobGraph.jobStoreID in self.toilState.servicesIssued:
+                    logger.debug("Telling job: %s to terminate its services due to successor failure",
+                                 jobGraph.jobStoreID)
+                    self.serviceManager.killServices(self.toilState.servicesIssued[jobGraph.jobStoreID],
+                                                error=True)
+
+                # If the job has non-service jobs running wait for them to finish
+                # the job will be re-added to the updated jobs when these jobs are done
+                elif jobGraph.jobStoreID in self.toilState.successorCounts:
+                    logger.debug("Job %s with ID: %s with failed successors still has successor jobs running",
+                                 jobGraph, jobGraph.jobStoreID)
+                    continue
+
+                # If the job is a checkpoint and has remaining retries then reissue it.
+                # The logic behind using > 1 rather than > 0 here: Since this job has
+                # been tried once (without decreasing its retry count as the job
+                # itself was successful), and its subtree failed, it shouldn't be retried
+                # unless it has more than 1 try.
+                elif jobGraph.checkpoint is not None and jobGraph.remainingRetryCount > 1:
+                    logger.warn('Job: %s is being restarted as a checkpoint after the total '
+                                'failure of jobs in its subtree.', jobGraph.jobStoreID)
+                    self.issueJob(JobNode.fromJobGraph(jobGraph))
+                else: # Mark it totally failed
+                    logger.debug("Job %s is being processed as completely failed", jobGraph.jobStoreID)
+                    self.processTotallyFailedJob(jobGraph)
+
+            # If the jobGraph has a command it must be run before any successors.
+            # Similarly, if the job previously failed we rerun it, even if it doesn't have a
+            # command to run, to eliminate any parts of the stack now completed.
+            elif jobGraph.command is not None or resultStatus != 0:
+                isServiceJob = jobGraph.jobStoreID in self.toilState.serviceJobStoreIDToPredecessorJob
+
+                # If the job has run out of retries or is a service job whose error flag has
+                # been indicated, fail the job.
+                if (jobGraph.remainingRetryCount == 0
+                    or isServiceJob and not self.jobStore.fileExists(jobGraph.errorJobStoreID)):
+                    self.processTotallyFailedJob(jobGraph)
+                    logger.warn("Job %s with ID %s is completely failed",
+                                jobGraph, jobGraph.jobStoreID)
+                else:
+                    # Otherwise try the job again
+                    self.issueJob(JobNode.fromJobGraph(jobGraph))
+
+            # If the job has services to run, which have not been started, start them
+            elif len(jobGraph.services) > 0:
+                # Build a map from the service jobs to the job and a map
+                # of the services created for the job
+                assert jobGraph.jobStoreID not in self.toilState.servicesIssued
+                self.toilState.servicesIssued[jobGraph.jobStoreID] = {}
+                for serviceJobList in jobGraph.services:
+                    for serviceTuple in serviceJobList:
+                        serviceID = serviceTuple.jobStoreID
+                        assert serviceID not in self.toilState.serviceJobStoreIDToPredecessorJob
+                        self.toilState.serviceJobStoreIDToPredecessorJob[serviceID] = jobGraph
+                        self.toilState.servicesIssued[jobGraph.jobStoreID][serviceID] = serviceTuple
+
+                # Use the service manager to start the services
+                self.serviceManager.scheduleServices(jobGraph)
+
+                logger.debug("Giving job: %s to service manager to schedule its jobs", jobGraph.jobStoreID)
+
+            # There exist successors to run
+            elif len(jobGraph.stack) > 0:
+                assert len(jobGraph.stack[-1]) > 0
+                logger.debug("Job: %s has %i successors to schedule",
+                             jobGraph.jobStoreID, len(jobGraph.stack[-1]))
+                #Record the number of successors that must be completed before
+                #the jobGraph can be considered again
+                assert jobGraph.jobStoreID not in self.toilState.successorCounts
+                self.toilState.successorCounts[jobGraph.jobStoreID] = len(jobGraph.stack[-1])
+                #List of successors to schedule
+                successors = []
+
+                #For each successor schedule if all predecessors have been completed
+                for jobNode in jobGraph.stack[-1]:
+                    successorJobStoreID = jobNode.jobStoreID
+                    #Build map from successor to predecessors.
+                    if successorJobStoreID not in self.toilState.successorJobStoreIDToPredecessorJobs:
+                        self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID] = []
+                    self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID].append(jobGraph)
+                    #Case that the jobGraph has multiple predecessors
+                    if jobNode.predecessorNumber > 1:
+                        logger.debug("Successor job: %s of job: %s has multiple "
+                                     "predecessors", jobNode, jobGraph)
+
+                        # Get the successor job, using a cache
+                        # (if the successor job has already been seen it will be in this cache,
+                        # but otherwise put it in the cache)
+                        if successorJobStoreID not in self.toilState.jobsToBeScheduledWithMultiplePredecessors:
+                            self.toilState.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID] = self.jobStore.load(successorJobStoreID)
+                        successorJobGraph = self.toilState.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID]
+
+                        #Add the jobGraph as a finished predecessor to the successor
+                        successorJobGraph.predecessorsFinished.add(jobGraph.jobStoreID)
+
+                        # If the successor is in the set of successors of failed jobs
+                        if successorJobStoreID in self.toilState.failedSuccessors:
+                            logger.debug("Successor job: %s of job: %s has failed "
+                                         "predecessors", jobNode, jobGraph)
+
+                            # Add the job to the set having failed successors
+                            self.toilState.hasFailedSuccessors.add(jobGraph.jobStoreID)
+
+                            # Reduce active successor count and remove the successor as an active successor of the job
+                            self.toilState.successorCounts[jobGraph.jobStoreID] -= 1
+                            assert self.toilState.successorCounts[jobGraph.jobStoreID] >= 0
+                            self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID].remove(jobGraph)
+                            if len(self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID]) == 0:
+                                self.toilState.successorJobStoreIDToPredecessorJobs.pop(successorJobStoreID)
+
+                            # If the job now has no active successors add to active jobs
+                            # so it can be processed as a job with failed successors
+                            if self.toilState.successorCounts[jobGraph.jobStoreID] == 0:
+                                logger.debug("Job: %s has no successors to run "
+                                             "and some are failed, adding to list of jobs "
+                                             "with failed successors", jobGraph)
+                                self.toilState.successorCounts.pop(jobGraph.jobStoreID)
+                                self.toilState.updatedJobs.add((jobGraph, 0))
+                                continue
+
+                        # If the successor job's predecessors have all not all completed then
+                        # ignore the jobGraph as is not yet ready to run
+                        assert len(successorJobGraph.predecessorsFinished) <= successorJobGraph.predecessorNumber
+                        if len(successorJobGraph.predecessorsFinished) < successorJobGraph.predecessorNumber:
+                            continue
+                        else:
+                            # Remove the successor job from the cache
+                            self.toilState.jobsToBeScheduledWithMultiplePredecessors.pop(successorJobStoreID)
+
+                    # Add successor to list of successors to schedule
+                    successors.append(jobNode)
+                self.issueJobs(successors)
+
+            elif jobGraph.jobStoreID in self.toilState.servicesIssued:
+                logger.debug("Telling job: %s to terminate its services due to the "
+                             "successful completion of its successor jobs",
+                             jobGraph)
+                self.serviceManager.killServices(self.toilState.servicesIssued[jobGraph.jobStoreID], error=False)
+
+            #There are no remaining tasks to schedule within the jobGraph, but
+            #we schedule it anyway to allow it to be deleted.
+
+            #TODO: An alternative would be simple delete it here and add it to the
+            #list of jobs to process, or (better) to create an asynchronous
+            #process that deletes jobs and then feeds them back into the set
+            #of jobs to be processed
+            else:
+                # Remove the job
+                if jobGraph.remainingRetryCount > 0:
+                    self.issueJob(JobNode.fromJobGraph(jobGraph))
+                    logger.debug("Job: %s is empty, we are scheduling to clean it up", jobGraph.jobStoreID)
+                else:
+                    self.processTotallyFailedJob(jobGraph)
+                    logger.warn("Job: %s is empty but completely failed - something is very wrong", jobGraph.jobStoreID)
+        return len(updatedJobs)
+
+    def _startServiceJobs(self):
+        """
+        Issues all the service jobs currently available from the service manager.
+        """
+        self.issueQueingServiceJobs()
+        while True:
+            serviceJob = self.serviceManager.getServiceJobsToStart(0)
+            # Stop trying to get jobs when function returns None
+            if serviceJob is None:
+                break
+            logger.debug('Launching service job: %s', serviceJob)
+            self.issueServiceJob(serviceJob)
+
+    def _processJobsWithRunningServices(self):
+        """
+        Adds all jobs whose services have been established to the set of updated jobs.
+        """
+        while True:
+            jobGraph = self.serviceManager.getJobGraphWhoseServicesAreRunning(0)
+            if jobGraph is None: # Stop trying to get jobs when function returns None
+                break
+            logger.debug('Job: %s has established its services.', jobGraph.jobStoreID)
+            jobGraph.services = []
+            self.toilState.updatedJobs.add((jobGraph, 0))
+
+    def _gatherUpdatedJobs(self, maxWait):
+        """
+        Drains the batch system of the jobs that have finished, blocking for up to maxWait
+        seconds for the first of them. At most self._maxUpdatesPerPass jobs are gathered so that
+        the successors of the jobs gathered so far get issued in a timely manner.
+
+        :param float maxWait: the number of seconds to block waiting for the first finished job
+
+        :return: the number of finished jobs gathered
+        :rtype: int
+        """
+        updatedJobTuples = self.batchSystem.getUpdatedBatchJobs(maxWait,
+                                                                maxJobs=self._maxUpdatesPerPass)
+        if len(updatedJobTuples) > 1:
+            logger.debug('Gathered %i finished jobs from the batch system', len(updatedJobTuples))
+        self.processFinishedJobs(updatedJobTuples)
+        return len(updatedJobTuples)
+
+    def processFinishedJobs(self, updatedJobTuples):
+        """
+        Logs the outcome of a batch of jobs reported by the batch system and processes each of
+        them as finished.
+
+        :param list[tuple(str, int, float)] updatedJobTuples: (jobID, exitValue, wallTime)
+               tuples as returned by the batch system's getUpdatedBatchJobs
+        """
+        for jobID, result, wallTime in updatedJobTuples:
+            # easy, track different state
+            try:
+                updatedJob = self.jobBatchSystemIDToIssuedJob[jobID]
+            except KeyError:
+                logger.warn("A result seems to already have been processed "
+                            "for job %s", jobID)
+                continue
+            if result == 0:
+                cur_logger = (logger.debug if str(updatedJob.jobName).startswith(CWL_INTERNAL_JOBS)
+                              else logger.info)
+                cur_logger('Job ended successfully: %s', updatedJob)
+                if self.toilMetrics:
+                    self.toilMetrics.logCompletedJob(updatedJob)
+            else:
+                logger.warn('Job failed with exit value %i: %s',
+                            result, updatedJob)
+                if self.toilMetrics:
+                    self.toilMetrics.logFailedJob(updatedJob)
+            self.processFinishedJob(jobID, result, wallTime=wallTime)
+
     def checkForDeadlocks(self):
         """
         Checks if the system is deadlocked running service jobs.
@@ -893,9 +960,15 @@ class Leader(object):
             if len(self.toilState.servicesIssued[predecessorJob.jobStoreID]) == 0: # Predecessor job has
                 # all its services terminated
                 self.toilState.servicesIssued.pop(predecessorJob.jobStoreID) # The job has no running services
-                self.toilState.updatedJobs.add((predecessorJob, 0)) # Now we know
-                # the job is done we can add it to the list of updated job files
-                logger.debug("Job %s services have completed or totally failed, adding to updated jobs", predecessorJob)
+                if predecessorJob.jobStoreID in self.toilState.successorCounts:
+                    # The services ended by themselves while the job's successors are still
+                    # running. The job is updated once the last of its successors has finished.
+                    logger.debug("Job %s services have completed or totally failed, but it still has "
+                                 "successor jobs running", predecessorJob)
+                else:
+                    self.toilState.updatedJobs.add((predecessorJob, 0)) # Now we know
+                    # the job is done we can add it to the list of updated job files
+                    logger.debug("Job %s services have completed or totally failed, adding to updated jobs", predecessorJob)
 
         elif jobStoreID not in self.toilState.successorJobStoreIDToPredecessorJobs:
             #We have reach the root job
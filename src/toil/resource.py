@@ -516,7 +516,8 @@ class ModuleDescriptor(namedtuple('ModuleDescriptor', ('dirPath', 'name', 'fromV
                 return False
 
             workerModuleFiles = concat(('worker' + ext for ext in self.moduleExtensions),
-                                       '_toil_worker')  # the setuptools entry point
+                                       '_toil_worker',  # the setuptools entry points
+                                       '_toil_persistent_worker')
             return mainModuleFile in workerModuleFiles
 
     def globalize(self):
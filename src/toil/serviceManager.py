@@ -32,7 +32,12 @@ class ServiceManager( object ):
     """
     Manages the scheduling of services.
     """
-    def __init__(self, jobStore, toilState):
+    def __init__(self, jobStore, toilState, wakeUp=None):
+        """
+        :param callable wakeUp: called without arguments whenever a service job is ready to be
+               started or a jobGraph's services are running, so that a consumer blocked
+               elsewhere can promptly collect them. Must be safe to call from any thread.
+        """
         logger.debug("Initializing service manager")
         self.jobStore = jobStore
         
@@ -46,11 +51,11 @@ class ServiceManager( object ):
         self._jobGraphsWithServicesToStart = Queue() # This is the input queue of
         # jobGraphs that have services that need to be started
 
-        self._jobGraphsWithServicesThatHaveStarted = Queue() # This is the output queue
-        # of jobGraphs that have services that are already started
+        self._jobGraphsWithServicesThatHaveStarted = NotifyingQueue(wakeUp) # This is the
+        # output queue of jobGraphs that have services that are already started
 
-        self._serviceJobGraphsToStart = Queue() # This is the queue of services for the
-        # batch system to start
+        self._serviceJobGraphsToStart = NotifyingQueue(wakeUp) # This is the queue of services
+        # for the batch system to start
 
         self.jobsIssuedToServiceManager = 0 # The number of jobs the service manager
         # is scheduling
@@ -222,6 +227,20 @@ class ServiceManager( object ):
                 for jobGraph in jobGraphsToRemove:
                     del servicesRemainingToStartForJob[jobGraph]
 
+class NotifyingQueue(Queue):
+    """
+    A queue that calls a function after each item put on it.
+    """
+    def __init__(self, notify=None):
+        # Queue is an old-style class in Python 2
+        Queue.__init__(self)
+        self.notify = notify
+
+    def put(self, item, block=True, timeout=None):
+        Queue.put(self, item, block, timeout)
+        if self.notify is not None:
+            self.notify()
+
 def blockUntilServiceGroupIsStarted(jobGraph, jobGraphsWithServicesThatHaveStarted, serviceJobsToStart, terminate, jobStore):
     # Start the service jobs in batches, waiting for each batch
     # to become established before starting the next batch
@@ -27,6 +27,7 @@ import os
 import fcntl
 import itertools
 import tempfile
+import threading
 from textwrap import dedent
 import time
 import multiprocessing
@@ -172,6 +173,38 @@ class hidden(object):
             # Make sure killBatchJobs can handle jobs that don't exist
             self.batchSystem.killBatchJobs([10])
 
+        def testGetUpdatedBatchJobs(self):
+            jobIDs = set()
+            for i in range(3):
+                jobNode = JobNode(command='true', jobName='test%i' % i, unitName=None,
+                                  jobStoreID=str(i), requirements=defaultRequirements)
+                jobIDs.add(self.batchSystem.issueBatchJob(jobNode))
+            updatedJobIDs = set()
+            while len(updatedJobIDs) < len(jobIDs):
+                updatedJobs = self.batchSystem.getUpdatedBatchJobs(maxWait=1000, maxJobs=2)
+                self.assertTrue(1 <= len(updatedJobs) <= 2)
+                for jobID, exitStatus, wallTime in updatedJobs:
+                    self.assertEqual(exitStatus, 0)
+                    self.assertNotIn(jobID, updatedJobIDs)
+                    updatedJobIDs.add(jobID)
+            self.assertEqual(updatedJobIDs, jobIDs)
+            self.assertEqual(self.batchSystem.getUpdatedBatchJobs(0), [])
+
+        def testWakeUp(self):
+            waker = threading.Timer(1, self.batchSystem.wakeUp)
+            waker.start()
+            try:
+                startTime = time.time()
+                self.assertIsNone(self.batchSystem.getUpdatedBatchJob(maxWait=60))
+                self.assertLess(time.time() - startTime, 30)
+            finally:
+                waker.cancel()
+            # The wakeup doesn't get in the way of the jobs updated after it
+            jobNode = JobNode(command='true', jobName='test', unitName=None,
+                              jobStoreID='1', requirements=defaultRequirements)
+            jobID = self.batchSystem.issueBatchJob(jobNode)
+            self.assertEqual(self.batchSystem.getUpdatedBatchJob(maxWait=1000)[:2], (jobID, 0))
+
         def testSetEnv(self):
             # Parasol disobeys shell rules and stupidly splits the command at the space character
             # before exec'ing it, whether the space is quoted, escaped or not. This means that we
@@ -382,6 +415,94 @@ class SingleMachineBatchSystemTest(hidden.AbstractBatchSystemTest):
         return SingleMachineBatchSystem(config=self.config,
                                         maxCores=numCores, maxMemory=1e9, maxDisk=2001)
 
+    def _createBatchSystem(self, backfill=True):
+        """
+        Replaces the batch system created by setUp with one that has backfilling switched on or
+        off as requested.
+        """
+        self.batchSystem.shutdown()
+        self.config.backfill = backfill
+        self.batchSystem = self.createBatchSystem()
+
+    def _issueJob(self, name, command, cores=1):
+        requirements = dict(defaultRequirements, cores=cores)
+        jobNode = JobNode(command=command, jobName=name, unitName=None,
+                          jobStoreID=name, requirements=requirements)
+        return self.batchSystem.issueBatchJob(jobNode)
+
+    def _completionOrder(self, jobIDs):
+        """
+        Waits for the given jobs to complete successfully and returns their IDs in the order
+        they completed in.
+        """
+        order = []
+        while len(order) < len(jobIDs):
+            jobID, exitStatus, wallTime = self.batchSystem.getUpdatedBatchJob(maxWait=100)
+            self.assertEqual(exitStatus, 0)
+            order.append(jobID)
+        self.assertEqual(set(order), set(jobIDs))
+        return order
+
+    def testPendingJobStartsOnRelease(self):
+        """
+        A pending job must be started as soon as a running one releases its resources rather
+        than on the next polling interval.
+        """
+        self._createBatchSystem()
+        finished = os.path.join(self.tempDir, 'finished')
+        started = os.path.join(self.tempDir, 'started')
+        stamp = sys.executable + ' -c "import time; open(\'%s\', \'w\').write(repr(time.time()))"'
+        self._issueJob('first', 'sleep 1 && ' + stamp % finished, cores=numCores)
+        self._issueJob('second', stamp % started, cores=numCores)
+        self._completionOrder(list(self.batchSystem.getIssuedBatchJobIDs()))
+        with open(finished) as f:
+            finishedAt = float(f.read())
+        with open(started) as f:
+            startedAt = float(f.read())
+        self.assertGreater(startedAt, finishedAt)
+        # Generous enough for the interpreter to start up, well below any polling interval
+        self.assertLess(startedAt - finishedAt, 0.5)
+
+    def testBackfill(self):
+        self._createBatchSystem(backfill=True)
+        small = self._issueJob('small', 'sleep 2')
+        large = self._issueJob('large', 'true', cores=numCores)
+        backfilled = self._issueJob('backfilled', 'true')
+        # The last job fits next to the first one and is started ahead of the large one
+        self.assertEqual(self._completionOrder([small, large, backfilled]),
+                         [backfilled, small, large])
+
+    def testNoBackfill(self):
+        self._createBatchSystem(backfill=False)
+        small = self._issueJob('small', 'sleep 2')
+        large = self._issueJob('large', 'true', cores=numCores)
+        held = self._issueJob('held', 'true')
+        self.assertEqual(self._completionOrder([small, large, held]), [small, large, held])
+
+    def testLargeJobBehindSmallOnes(self):
+        """
+        Without backfilling, a job requiring all cores must not be starved by a steady supply of
+        small jobs issued after it.
+        """
+        self._createBatchSystem(backfill=False)
+        running = [self._issueJob('running%i' % i, 'sleep 1') for i in range(numCores)]
+        large = self._issueJob('large', 'true', cores=numCores)
+        later = [self._issueJob('later%i' % i, 'true') for i in range(2 * numCores)]
+        order = self._completionOrder(running + [large] + later)
+        self.assertEqual(set(order[:numCores]), set(running))
+        self.assertEqual(order[numCores], large)
+
+    def testKillPendingJob(self):
+        self._createBatchSystem()
+        running = self._issueJob('running', 'sleep 1000', cores=numCores)
+        pending = self._issueJob('pending', 'true', cores=numCores)
+        self.assertEqual(self._waitForJobsToStart(1), [running])
+        self.batchSystem.killBatchJobs([pending])
+        self.assertEqual(self.batchSystem.getIssuedBatchJobIDs(), [running])
+        self.assertEqual(self.batchSystem.pendingJobs, [])
+        self.batchSystem.killBatchJobs([running])
+        self.assertFalse(self.batchSystem.getUpdatedBatchJob(0))
+
 @slow
 class MaxCoresSingleMachineBatchSystemTest(ToilTest):
     """
@@ -807,6 +928,67 @@ class SingleMachineBatchSystemJobTest(hidden.AbstractBatchSystemJobTest):
         assert outString.endswith('sJCsJGCfJC')
 
 
+class PersistentWorkersSingleMachineBatchSystemJobTest(hidden.AbstractBatchSystemJobTest):
+    """
+    Tests Toil workflow against the SingleMachine batch system using persistent workers
+    """
+
+    def getBatchSystemName(self):
+        return "singleMachine"
+
+    def getOptions(self, tempDir):
+        options = super(PersistentWorkersSingleMachineBatchSystemJobTest, self).getOptions(tempDir)
+        options.persistentWorkers = True
+        return options
+
+    def testPersistentWorkersAreReused(self):
+        """
+        Tests that a chain of jobs is run by processes forked from the same persistent worker.
+        """
+        tempDir = self._createTempDir('testFiles')
+        options = self.getOptions(tempDir)
+        options.maxCores = 1
+        parentPids = Job.Runner.startToil(Job.wrapJobFn(_chainOfParentPids, 4), options)
+        self.assertEqual(len(parentPids), 4)
+        self.assertEqual(len(set(parentPids)), 1)
+        self.assertNotEqual(parentPids[0], os.getpid())
+
+    def testPersistentWorkerFailure(self):
+        """
+        Tests that a job is reported as failed, rather than lost, if its persistent worker dies
+        before starting it, here because the job store can't be opened.
+        """
+        config = hidden.AbstractBatchSystemTest.createConfig()
+        config.persistentWorkers = True
+        config.jobStore = 'file:' + os.path.join(self._createTempDir(), 'missing')
+        batchSystem = SingleMachineBatchSystem(config, maxCores=1, maxMemory=1e9, maxDisk=1e9)
+        try:
+            for _ in range(2):
+                jobNode = JobNode(command='_toil_worker job %s a/b/job' % config.jobStore,
+                                  requirements=dict(cores=1, memory=1, disk=1,
+                                                    preemptable=preemptable),
+                                  jobName='job', unitName='', jobStoreID='a/b/job')
+                jobID = batchSystem.issueBatchJob(jobNode)
+                updatedJob = batchSystem.getUpdatedBatchJob(maxWait=60)
+                self.assertIsNotNone(updatedJob)
+                self.assertEqual(updatedJob[:2], (jobID, 1))
+            # The failed persistent workers are not reused
+            self.assertEqual(sum(map(len, batchSystem.idlePersistentWorkers.values())), 0)
+        finally:
+            batchSystem.shutdown()
+
+
+def _getParentPid():
+    return os.getppid()
+
+
+def _chainOfParentPids(job, length):
+    jobs = [job.addChildFn(_getParentPid)]
+    while len(jobs) < length:
+        jobs.append(jobs[-1].addFollowOnFn(_getParentPid))
+    return [j.rv() for j in jobs]
+
+
 def _resourceBlockTestAuxFn(outFile, sleepTime, writeVal):
     """
     Write a value to the out file and then sleep for requested seconds.
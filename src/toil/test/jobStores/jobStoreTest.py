@@ -23,6 +23,7 @@ from builtins import range
 from past.utils import old_div
 from builtins import object
 import socketserver
+import errno
 import pytest
 import hashlib
 import logging
@@ -34,6 +35,7 @@ import time
 import uuid
 from stubserver import FTPStubServer
 from abc import abstractmethod, ABCMeta
+from io import BytesIO
 from itertools import chain, islice, count
 from threading import Thread
 from unittest import skip
@@ -58,6 +60,7 @@ from toil.jobStores.abstractJobStore import (NoSuchJobException,
                                              NoSuchFileException)
 from toil.jobStores.aws.utils import region_to_bucket_location
 from toil.jobStores.fileJobStore import FileJobStore
+from toil.jobStores.sqliteJobStore import SQLiteJobStore
 from toil.test import (ToilTest,
                        needs_aws,
                        needs_azure,
@@ -841,13 +844,11 @@ class AbstractEncryptedJobStoreTest(object):
             return config
 
 
-class FileJobStoreTest(AbstractJobStoreTest.Test):
-    def _createJobStore(self):
-        return FileJobStore(self.namePrefix)
-
-    def _corruptJobStore(self):
-        assert isinstance(self.master, FileJobStore)  # type hint
-        shutil.rmtree(self.master.jobStoreDir)
+class AbstractLocalJobStoreTest(object):
+    """
+    The import/export helpers of the tests for job stores on the local file system. The external
+    store is a local directory.
+    """
 
     def _prepareTestFile(self, dirPath, size=None):
         fileName = 'testfile_%s' % uuid.uuid4()
@@ -874,6 +875,154 @@ class FileJobStoreTest(AbstractJobStoreTest.Test):
         shutil.rmtree(dirPath)
 
 
+class FileJobStoreTest(AbstractLocalJobStoreTest, AbstractJobStoreTest.Test):
+    def _createJobStore(self):
+        return FileJobStore(self.namePrefix)
+
+    def _corruptJobStore(self):
+        assert isinstance(self.master, FileJobStore)  # type hint
+        shutil.rmtree(self.master.jobStoreDir)
+
+    def testBatchSegment(self):
+        master = self.master
+        parent = master.create(self.arbitraryJob)
+        with master.batch():
+            children = [master.create(self.arbitraryJob) for _ in range(10)]
+            parent.stack.append(list(children))
+            master.update(parent)
+            # Nothing is written before the end of the batch ...
+            self.assertFalse(any(os.path.exists(master._getJobFileName(child.jobStoreID))
+                                 for child in children))
+            # ... but the batch's own jobs are visible within it
+            self.assertTrue(all(master.exists(child.jobStoreID) for child in children))
+            self.assertEqual(master.load(parent.jobStoreID).stack, [children])
+        # All jobs share a single segment
+        jobFiles = [master._getJobFileName(job.jobStoreID) for job in children + [parent]]
+        self.assertEqual(len({os.stat(jobFile).st_ino for jobFile in jobFiles}), 1)
+        for job in children + [parent]:
+            self.assertEqual(master.load(job.jobStoreID), job)
+        # Updating a job outside of a batch replaces its link to the segment
+        child = master.load(children[0].jobStoreID)
+        child.remainingRetryCount = 66
+        master.update(child)
+        self.assertEqual(master.load(child.jobStoreID), child)
+        self.assertEqual(master.load(children[1].jobStoreID), children[1])
+        children[0] = child
+        self.assertEqual(set(master.jobs()), set(children + [parent]))
+        for job in children + [parent]:
+            master.delete(job.jobStoreID)
+        self.assertEqual(list(master.jobs()), [])
+
+    def testBatchSegmentCrash(self):
+        master = self.master
+        with master.batch():
+            jobs = [master.create(self.arbitraryJob) for _ in range(10)]
+        oldRetryCount = jobs[0].remainingRetryCount
+        for job in jobs:
+            job.remainingRetryCount = 66
+        # Simulate a crash after half of the jobs have been replaced with links to the new
+        # segment, leaving behind the link to the segment that was about to be renamed.
+        realRename = os.rename
+        renames = count()
+
+        def crashingRename(src, dst):
+            if src.endswith('.segment') and next(renames) == len(jobs) // 2:
+                raise OSError(errno.EIO, 'Simulated crash')
+            realRename(src, dst)
+
+        with patch('os.rename', crashingRename):
+            with self.assertRaises(OSError):
+                with master.batch():
+                    for job in jobs:
+                        master.update(job)
+        # Every job is either in its old or its new state
+        retryCounts = [master.load(job.jobStoreID).remainingRetryCount for job in jobs]
+        self.assertEqual(retryCounts.count(66), len(jobs) // 2)
+        self.assertEqual(retryCounts.count(oldRetryCount), len(jobs) - len(jobs) // 2)
+        # Neither the stale link nor the segment get in the way of later batches
+        with master.batch():
+            for job in jobs:
+                master.update(job)
+        for job in jobs:
+            self.assertEqual(master.load(job.jobStoreID), job)
+        for tempDir in master._tempDirectories():
+            self.assertFalse([f for f in os.listdir(tempDir) if f.startswith('segment')])
+
+    def testDeduplicatedFiles(self):
+        master = self.master
+        master.config.deduplicateFiles = True
+        job = master.create(self.arbitraryJob)
+        content = os.urandom(1024)
+        digest = hashlib.sha1(content).hexdigest()
+        localFilePath = os.path.join(self._createTempDir(), 'file')
+        with open(localFilePath, 'w') as f:
+            f.write(content)
+        fileIDs = [master.writeFile(localFilePath, job.jobStoreID), master.writeFile(localFilePath),
+                   master.importFile('file://' + localFilePath)]
+        # All files share the blob named by their contents
+        blobPath = master._getBlobPath(digest)
+        self.assertEqual(os.stat(blobPath).st_nlink, len(fileIDs) + 1)
+        for fileID in fileIDs:
+            self.assertEqual(master.getContentHash(fileID), digest)
+            with master.readFileStream(fileID) as f:
+                self.assertEqual(f.read(), content)
+        # Updating a file leaves the others alone
+        with master.updateFileStream(fileIDs[1]) as f:
+            f.write('foo')
+        self.assertIsNone(master.getContentHash(fileIDs[1]))
+        with master.readFileStream(fileIDs[0]) as f:
+            self.assertEqual(f.read(), content)
+        # The blob is removed with the last file sharing it
+        master.deleteFile(fileIDs[2])
+        master.deleteFile(fileIDs[1])
+        self.assertTrue(os.path.exists(blobPath))
+        master.delete(job.jobStoreID)
+        self.assertFalse(os.path.exists(blobPath))
+
+
+class SQLiteJobStoreTest(AbstractLocalJobStoreTest, AbstractJobStoreTest.Test):
+    def _createJobStore(self):
+        return SQLiteJobStore(self.namePrefix)
+
+    def _corruptJobStore(self):
+        assert isinstance(self.master, SQLiteJobStore)  # type hint
+        shutil.rmtree(self.master.jobStoreDir)
+
+    def testFilesDeletedWithJob(self):
+        job = self.master.create(self.arbitraryJob)
+        jobStoreFileID = self.master.getEmptyFileStoreID(job.jobStoreID)
+        filePath = self.master._getAbsPath(jobStoreFileID)
+        self.assertTrue(os.path.exists(filePath))
+        self.master.delete(job.jobStoreID)
+        self.assertFalse(self.master.fileExists(jobStoreFileID))
+        self.assertFalse(os.path.exists(filePath))
+
+    def testFileUrls(self):
+        url, md5 = self._prepareTestFile(self._externalStore(), 1024)
+        url = urlparse.urlparse(url)
+        self.assertEqual(SQLiteJobStore.getSize(url), 1024)
+        readable = BytesIO()
+        SQLiteJobStore._readFromUrl(url, readable)
+        self.assertEqual(hashlib.md5(readable.getvalue()).hexdigest(), md5)
+        readable.seek(0)
+        otherUrl = self._prepareTestFile(self._externalStore())
+        SQLiteJobStore._writeToUrl(readable, urlparse.urlparse(otherUrl))
+        self.assertEqual(self._hashTestFile(otherUrl), md5)
+
+    def testBatchRollback(self):
+        jobGraphs = []
+        try:
+            with self.master.batch():
+                for i in range(10):
+                    jobGraphs.append(self.master.create(self.arbitraryJob))
+                raise RuntimeError()
+        except RuntimeError:
+            pass
+        self.assertEqual(len(jobGraphs), 10)
+        for jobGraph in jobGraphs:
+            self.assertFalse(self.master.exists(jobGraph.jobStoreID))
+
+
 @experimental
 @needs_google
 class GoogleJobStoreTest(AbstractJobStoreTest.Test):
@@ -23,6 +23,7 @@ from abc import abstractmethod, ABCMeta
 from struct import pack, unpack
 from uuid import uuid4
 
+from toil.common import Toil
 from toil.job import Job
 from toil.fileStore import IllegalDeletionCacheError, CachingFileStore
 from toil.test import ToilTest, needs_aws, needs_azure, needs_google, experimental, slow
@@ -63,6 +64,8 @@ class hidden(object):
         def _getTestJobStore(self):
             if self.jobStoreType == 'file':
                 return self._getTestJobStorePath()
+            elif self.jobStoreType == 'sqlite':
+                return 'sqlite:' + self._getTestJobStorePath()
             elif self.jobStoreType == 'aws':
                 return 'aws:%s:cache-tests-%s' % (self.awsRegion(), uuid4())
             elif self.jobStoreType == 'azure':
@@ -169,6 +172,54 @@ class hidden(object):
                             localFileIDs.remove(fsID)
                 i += 1
 
+        def testReadGlobalFiles(self):
+            """
+            Write several files to the job store, then read them all at once in one job and
+            prefetch them before reading them one by one in another.
+            """
+            A = Job.wrapJobFn(self._writeFilesWithContents, numFiles=10)
+            B = Job.wrapJobFn(self._readFilesWithContents, files=A.rv(), prefetch=False)
+            C = Job.wrapJobFn(self._readFilesWithContents, files=A.rv(), prefetch=True)
+            A.addChild(B)
+            B.addChild(C)
+            Job.Runner.startToil(A, self.options)
+
+        @staticmethod
+        def _writeFilesWithContents(job, numFiles):
+            """
+            :return: the ID and the contents of each file written
+            :rtype: list[tuple[toil.fileStore.FileID, str]]
+            """
+            files = []
+            for i in range(numFiles):
+                contents = os.urandom(1024 * (i + 1))
+                with job.fileStore.writeGlobalFileStream() as (fileHandle, fileStoreID):
+                    fileHandle.write(contents)
+                files.append((fileStoreID, contents))
+            return files
+
+        @staticmethod
+        def _readFilesWithContents(job, files, prefetch):
+            fileStoreIDs = [fileStoreID for fileStoreID, _ in files]
+            # Also read one of the files twice concurrently
+            fileStoreIDs.append(fileStoreIDs[0])
+            files = files + files[:1]
+            if prefetch:
+                downloads = job.fileStore.prefetchGlobalFiles(fileStoreIDs)
+                localFilePaths = [job.fileStore.readGlobalFile(fileStoreID)
+                                  for fileStoreID in fileStoreIDs]
+                # The prefetched copies must be complete too, hits on the cache or not
+                prefetchedFilePaths = [download.get() for download in downloads]
+                for localFilePath, (_, contents) in zip(prefetchedFilePaths, files):
+                    with open(localFilePath) as f:
+                        assert f.read() == contents
+            else:
+                localFilePaths = job.fileStore.readGlobalFiles(fileStoreIDs)
+            assert len(set(localFilePaths)) == len(fileStoreIDs)
+            for localFilePath, (_, contents) in zip(localFilePaths, files):
+                with open(localFilePath) as f:
+                    assert f.read() == contents
+
         # Tests for the various defer possibilities
         def testDeferredFunctionRunsWithMethod(self):
             """
@@ -490,9 +541,9 @@ class hidden(object):
         @slow
         def testCacheLockRace(self):
             """
-            Make 3 jobs compete for the same cache lock file.  If they have the lock at the same
-            time, the test will fail.  This test abuses the _CacheState class and modifies values in
-            the lock file.  DON'T TRY THIS AT HOME.
+            Make 3 jobs compete for transactions on the cache state.  If they are in a transaction
+            at the same time, the test will fail.  This test abuses the _CacheState class and
+            modifies values in the cache state.  DON'T TRY THIS AT HOME.
             """
             A = Job.wrapJobFn(self._setUpLockFile)
             B = Job.wrapJobFn(self._selfishLocker, cores=1)
@@ -512,36 +563,32 @@ class hidden(object):
             """
             Set nlink=0 for the cache test
             """
-            with job.fileStore.cacheLock():
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
+            cacheInfo = job.fileStore._cacheState
+            with cacheInfo.transaction():
                 cacheInfo.nlink = 0
-                cacheInfo.write(job.fileStore.cacheStateFile)
 
         @staticmethod
         def _selfishLocker(job):
             """
-            Try to acquire a lock on the lock file.  If 2 threads have the lock concurrently, then
-            abort.
+            Try to start a transaction on the cache state.  If 2 threads are in a transaction
+            concurrently, then abort.
             """
+            cacheInfo = job.fileStore._cacheState
             for i in range(0, 1000):
-                with job.fileStore.cacheLock():
-                    cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
+                with cacheInfo.transaction():
                     cacheInfo.nlink += 1
                     cacheInfo.cached = max(cacheInfo.nlink, cacheInfo.cached)
-                    cacheInfo.write(job.fileStore.cacheStateFile)
                 time.sleep(0.001)
-                with job.fileStore.cacheLock():
-                    cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
+                with cacheInfo.transaction():
                     cacheInfo.nlink -= 1
-                    cacheInfo.write(job.fileStore.cacheStateFile)
 
         @staticmethod
         def _raceTestSuccess(job):
             """
             Assert that the cache test passed successfully.
             """
-            with job.fileStore.cacheLock():
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
+            cacheInfo = job.fileStore._cacheState
+            with cacheInfo.transaction():
                 # Value of the nlink has to be zero for successful run
                 assert cacheInfo.nlink == 0
                 assert cacheInfo.cached > 1
@@ -597,9 +644,10 @@ class hidden(object):
         def _testValidityOfCacheEvictTest(self):
             # If the job store and cache are on the same file system, file sizes are accounted for
             # by the job store and are not reflected in the cache hence this test is redundant.
-            if not self.options.jobStore.startswith(('aws', 'azure', 'google')):
+            jobStoreName, jobStorePath = Toil.parseLocator(self.options.jobStore)
+            if jobStoreName in ('file', 'sqlite'):
                 workDirDev = os.stat(self.options.workDir).st_dev
-                jobStoreDev = os.stat(os.path.dirname(self.options.jobStore)).st_dev
+                jobStoreDev = os.stat(os.path.dirname(jobStorePath)).st_dev
                 if workDirDev == jobStoreDev:
                     self.skipTest('Job store and working directory are on the same filesystem.')
 
@@ -682,21 +730,18 @@ class hidden(object):
         @staticmethod
         def _forceModifyCacheLockFile(job, newTotalMB):
             """
-            This function opens and modifies the cache lock file to reflect a new "total"
-            value = newTotalMB and thereby fooling the cache logic into believing only newTotalMB is
-            allowed for the run.
+            This function modifies the cache state to reflect a new "total" value = newTotalMB
+            and thereby fooling the cache logic into believing only newTotalMB is allowed for the
+            run.
 
-            :param int newTotalMB: New value for "total" in the cacheLockFile
+            :param int newTotalMB: New value for "total" in the cache state
             """
-            with job.fileStore.cacheLock() as _:
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
-                cacheInfo.total = float(newTotalMB * 1024 * 1024)
-                cacheInfo.write(job.fileStore.cacheStateFile)
+            job.fileStore._cacheState.total = float(newTotalMB * 1024 * 1024)
 
         @staticmethod
         def _probeJobReqs(job, total=None, cached=None, sigmaJob=None):
             """
-            Probes the cacheLockFile to ensure the values for total, disk and cache are as expected.
+            Probes the cache state to ensure the values for total, disk and cache are as expected.
             Can also specify combinations of the requirements if desired.
 
             :param int total: Expected Total Space available for caching in MB.
@@ -705,8 +750,8 @@ class hidden(object):
             """
             valueDict = locals()
             assert (total or cached or sigmaJob)
-            with job.fileStore.cacheLock() as x:
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
+            cacheInfo = job.fileStore._cacheState
+            with cacheInfo.transaction():
                 for value in ('total', 'cached', 'sigmaJob'):
                     # If the value wasn't provided, it is None and should be ignored
                     if valueDict[value] is None:
@@ -782,6 +827,41 @@ class hidden(object):
             assert job.fileStore.HarbingerFile(job.fileStore, fileStoreID=fsID).exists()
             job.fileStore.readGlobalFile(fsID)
 
+        def testAsyncWriteBackpressure(self):
+            """
+            Rewrite several files to the job store, which writes them asynchronously, with a buffer
+            too small for any two of them. Ensure that no more than one of them is ever pending
+            and that all of them are written correctly.
+            """
+            self.options.asyncWriteThreads = 1
+            self.options.asyncWriteBufferSize = 1
+            A = Job.wrapJobFn(self._rewriteFilesWithContents, numFiles=5)
+            B = Job.wrapJobFn(self._readFilesWithContents, files=A.rv(), prefetch=False)
+            A.addChild(B)
+            Job.Runner.startToil(A, self.options)
+
+        @staticmethod
+        def _rewriteFilesWithContents(job, numFiles):
+            """
+            :return: the ID and the contents of each file written asynchronously
+            :rtype: list[tuple[toil.fileStore.FileID, str]]
+            """
+            files = []
+            for i in range(numFiles):
+                contents = os.urandom(1024 * (i + 1))
+                localFilePath = job.fileStore.getLocalTempFile()
+                with open(localFilePath, 'w') as f:
+                    f.write(contents)
+                job.fileStore.writeGlobalFile(localFilePath)
+                # The file is already known to the file store, so the second write is asynchronous
+                fileStoreID = job.fileStore.writeGlobalFile(localFilePath)
+                progress = job.fileStore.asyncWriteProgress()
+                assert len(progress) <= 1, progress
+                # A write completing in between is counted twice, but never missed
+                assert len(progress) + job.fileStore.asyncWriteStatistics()['files'] >= i + 1
+                files.append((fileStoreID, contents))
+            return files
+
         # writeGlobalFile tests
         def testWriteNonLocalFileToJobStore(self):
             """
@@ -876,6 +956,49 @@ class hidden(object):
             A.addChild(B)
             Job.Runner.startToil(A, self.options)
 
+        def testCacheStatistics(self):
+            """
+            Read a cached file and a file that isn't cached and ensure the hits and misses are
+            counted.
+            """
+            A = Job.wrapJobFn(self._writeFileToJobStoreWithAsserts, isLocalFile=True)
+            B = Job.wrapJobFn(self._writeFileToJobStoreWithAsserts, isLocalFile=False,
+                              nonLocalDir=self._createTempDir(purpose='nonLocalDir'))
+            C = Job.wrapJobFn(self._readAndCountCacheStatistics, cachedFileID=A.rv(),
+                              uncachedFileID=B.rv())
+            A.addChild(B)
+            B.addChild(C)
+            Job.Runner.startToil(A, self.options)
+
+        @staticmethod
+        def _readAndCountCacheStatistics(job, cachedFileID, uncachedFileID):
+            before = job.fileStore.cacheStatistics()
+            job.fileStore.readGlobalFile(cachedFileID)
+            job.fileStore.readGlobalFile(uncachedFileID, cache=False)
+            after = job.fileStore.cacheStatistics()
+            assert after['hits'] == before['hits'] + 1, (before, after)
+            assert after['misses'] == before['misses'] + 1, (before, after)
+            assert after['evictions'] == before['evictions'], (before, after)
+
+        def testInputFilesArePrefetched(self):
+            """
+            Write a non-local file to the job store (hence no cached copy) and ensure that it is
+            downloaded into the cache for a job that declares it as an input file without the job
+            reading it.
+            """
+            A = Job.wrapJobFn(self._writeFileToJobStoreWithAsserts, isLocalFile=False,
+                              nonLocalDir=self._createTempDir(purpose='nonLocalDir'))
+            B = Job.wrapJobFn(self._assertInputFileIsCached, fileStoreID=A.rv(),
+                              inputFiles=[A.rv()])
+            A.addChild(B)
+            Job.Runner.startToil(A, self.options)
+
+        @staticmethod
+        def _assertInputFileIsCached(job, fileStoreID):
+            assert job.inputFiles == [fileStoreID]
+            job.fileStore._waitForPrefetches()
+            assert job.fileStore._fileIsCached(fileStoreID)
+
         @slow
         def testMultipleJobsReadSameCacheHitGlobalFile(self):
             """
@@ -941,7 +1064,8 @@ class hidden(object):
             outfile = job.fileStore.readGlobalFile(fsID, '/'.join([work_dir, 'temp']), cache=True,
                                                    mutable=False)
             diskMB = diskMB * 1024 * 1024
-            with job.fileStore.cacheLock():
+            cacheInfo = job.fileStore._cacheState
+            with cacheInfo.transaction():
                 fileStats = os.stat(outfile)
                 fileSize = fileStats.st_size
                 fileNlinks = fileStats.st_nlink
@@ -950,7 +1074,6 @@ class hidden(object):
                     x.seek(0)
                     x.truncate()
                     x.write(str(max(prev_max, fileNlinks)))
-                cacheInfo = job.fileStore._CacheState._load(job.fileStore.cacheStateFile)
                 if cacheInfo.nlink == 2:
                     assert cacheInfo.cached == 0.0  # Since fileJobstore on same filesystem
                 else:
@@ -1105,8 +1228,9 @@ class hidden(object):
             Assert the values for job disk and total cached file sizes tracked in the job's cache
             state file is equal to the values we expect.
             """
-            with job.fileStore._CacheState.open(job.fileStore) as cacheInfo:
-                jobState = cacheInfo.jobState[job.fileStore.jobID]
+            cacheInfo = job.fileStore._cacheState
+            with cacheInfo.transaction():
+                jobState = cacheInfo.jobState(job.fileStore.jobID)
                 # cached should have a value only if the job store is on a different file system
                 # than the cache
                 if cacheInfo.nlink != 2:
@@ -1288,6 +1412,56 @@ class _deleteMethods(object):
             os.remove(nlf)
 
 
+class CacheStateTest(ToilTest):
+    """
+    Tests the index of cached files kept in the cache state.
+    """
+
+    def _createCacheState(self, policy):
+        fileName = os.path.join(self._createTempDir(), '_cacheState')
+        return CachingFileStore._CacheState.create(fileName, policy=policy, nlink=1,
+                                                   attemptNumber=0, total=0, cached=0)
+
+    def testLRU(self):
+        cacheState = self._createCacheState('lru')
+        for name in ('a', 'b', 'c'):
+            cacheState.addFile(name, 10)
+            # The clock must advance between accesses
+            time.sleep(0.01)
+        cacheState.hitFile('a')
+        self.assertEqual(list(cacheState.evictionCandidates()), ['b', 'c', 'a'])
+        cacheState.removeFile('b')
+        self.assertEqual(list(cacheState.evictionCandidates()), ['c', 'a'])
+        self.assertEqual(cacheState.statistics(), dict(hits=1, misses=0, evictions=0))
+
+    def testGDSF(self):
+        cacheState = self._createCacheState('gdsf')
+        cacheState.addFile('small', 10)
+        cacheState.addFile('large', 1000)
+        cacheState.addFile('popular', 1000)
+        for _ in range(20):
+            cacheState.hitFile('popular')
+        # Large files read rarely go first, small ones are kept even if they are read rarely
+        self.assertEqual(list(cacheState.evictionCandidates()), ['large', 'popular', 'small'])
+        cacheState.removeFile('popular')
+        # Files added after an eviction are aged in by the priority of the evicted file, so a
+        # new file is kept over an equally large one that wasn't read since it was added
+        cacheState.addFile('another', 1000)
+        self.assertEqual(list(cacheState.evictionCandidates()), ['large', 'another', 'small'])
+
+    def testEvictionCandidatesInBatches(self):
+        cacheState = self._createCacheState('gdsf')
+        cacheState.evictionBatchSize = 3
+        # Files of the same size have the same priority and are ordered by name
+        names = ['file%02i' % i for i in range(10)]
+        cacheState.reindexFiles([(name, 10) for name in reversed(names)])
+        self.assertEqual(list(cacheState.evictionCandidates()), names)
+        # Files can be removed while the candidates are being generated
+        for name in cacheState.evictionCandidates():
+            cacheState.removeFile(name)
+        self.assertEqual(list(cacheState.evictionCandidates()), [])
+
+
 class NonCachingFileStoreTestWithFileJobStore(hidden.AbstractNonCachingFileStoreTest):
     jobStoreType = 'file'
 
@@ -1295,6 +1469,44 @@ class NonCachingFileStoreTestWithFileJobStore(hidden.AbstractNonCachingFileStore
 class CachingFileStoreTestWithFileJobStore(hidden.AbstractCachingFileStoreTest):
     jobStoreType = 'file'
 
+    def testDeduplicatedFilesShareCachedCopy(self):
+        """
+        Write two local files with identical contents while the job store deduplicates files and
+        ensure that they share a single cached copy, which outlives the deletion of one of them.
+        """
+        self.options.deduplicateFiles = True
+        A = Job.wrapJobFn(self._writeIdenticalFiles)
+        B = Job.wrapJobFn(self._readIdenticalFiles, fileStoreIDs=A.rv())
+        A.addChild(B)
+        Job.Runner.startToil(A, self.options)
+
+    @staticmethod
+    def _writeIdenticalFiles(job):
+        content = os.urandom(1024)
+        fileStoreIDs = []
+        for _ in range(2):
+            localFilePath = job.fileStore.getLocalTempFile()
+            with open(localFilePath, 'w') as f:
+                f.write(content)
+            fileStoreIDs.append(job.fileStore.writeGlobalFile(localFilePath))
+        encodedFileIDs = set(map(job.fileStore.encodedFileID, fileStoreIDs))
+        assert len(encodedFileIDs) == 1
+        assert os.path.basename(encodedFileIDs.pop()).startswith(CachingFileStore.contentHashPrefix)
+        return fileStoreIDs
+
+    @staticmethod
+    def _readIdenticalFiles(job, fileStoreIDs):
+        localFilePaths = [job.fileStore.readGlobalFile(fileStoreID, mutable=False)
+                          for fileStoreID in fileStoreIDs]
+        assert len({os.stat(localFilePath).st_ino for localFilePath in localFilePaths}) == 1
+        job.fileStore.deleteGlobalFile(fileStoreIDs[0])
+        assert job.fileStore._fileIsCached(fileStoreIDs[1])
+
+
+@pytest.mark.timeout(1000)
+class CachingFileStoreTestWithSQLiteJobStore(hidden.AbstractCachingFileStoreTest):
+    jobStoreType = 'sqlite'
+
 
 @needs_aws
 class NonCachingFileStoreTestWithAwsJobStore(hidden.AbstractNonCachingFileStoreTest):
@@ -1350,3 +1562,4 @@ def _exportStaticMethodAsGlobalFunctions(cls):
 _exportStaticMethodAsGlobalFunctions(hidden.AbstractFileStoreTest)
 _exportStaticMethodAsGlobalFunctions(hidden.AbstractCachingFileStoreTest)
 _exportStaticMethodAsGlobalFunctions(hidden.AbstractNonCachingFileStoreTest)
+_exportStaticMethodAsGlobalFunctions(CachingFileStoreTestWithFileJobStore)
@@ -14,9 +14,14 @@
 
 from __future__ import absolute_import
 import os
+import copy
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
 from argparse import ArgumentParser
 from toil.common import Toil
-from toil.job import Job
+from toil.job import Job, JobNode, ServiceJobNode
 from toil.test import ToilTest
 from toil.jobGraph import JobGraph
 
@@ -80,3 +85,35 @@ class JobGraphTest(ToilTest):
         self.assertNotEquals(j, j2)
         
         ###TODO test other functionality
+
+    def testSerialization(self):
+        """
+        Tests that job graphs and the job nodes on their stack survive pickling and copying.
+        """
+        requirements = dict(memory=1, cores=2, disk=3, preemptable=False)
+        children = [JobNode(requirements=requirements, jobName='child', unitName=None,
+                            jobStoreID='child%i' % i, command='child', predecessorNumber=1)
+                    for i in range(3)]
+        service = ServiceJobNode(jobStoreID='service', memory=1, cores=2, disk=3,
+                                 preemptable=False, startJobStoreID='start',
+                                 terminateJobStoreID='terminate', errorJobStoreID='error',
+                                 unitName=None, jobName='service', command='service',
+                                 predecessorNumber=1)
+        j = JobGraph(command='parent', memory=1, cores=2, disk=3, preemptable=True,
+                     jobStoreID='parent', remainingRetryCount=5, predecessorNumber=0,
+                     jobName='parent', unitName=None, stack=[children], services=[[service]],
+                     filesToDelete=['file'], chainedJobs=['parent'])
+        self.assertFalse(hasattr(j, '__dict__'))
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            j2 = pickle.loads(pickle.dumps(j, protocol))
+            self.assertEquals(j, j2)
+            self.assertEquals(j2.stack[0], children)
+            self.assertEquals(j2.services[0][0].errorJobStoreID, 'error')
+            self.assertEquals(j2.chainedJobs, ['parent'])
+        self.assertEquals(j, copy.deepcopy(j))
+
+        # Job graphs pickled before the compact encoding was introduced can still be loaded
+        j2 = JobGraph.__new__(JobGraph)
+        j2.__setstate__({name: getattr(j, name) for name in JobGraph._encodedFields})
+        self.assertEquals(j, j2)
+        self.assertIsNone(j2._config)
@@ -0,0 +1,83 @@
+# Copyright (C) 2015-2016 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import os
+import time
+from argparse import ArgumentParser, Namespace
+from toil.batchSystems.singleMachine import SingleMachineBatchSystem
+from toil.common import Toil
+from toil.job import Job, ServiceJobNode
+from toil.jobGraph import JobGraph
+from toil.serviceManager import ServiceManager
+from toil.test import ToilTest
+
+class ServiceManagerTest(ToilTest):
+
+    def setUp(self):
+        super(ServiceManagerTest, self).setUp()
+        self.jobStorePath = self._getTestJobStorePath()
+        parser = ArgumentParser()
+        Job.Runner.addToilOptions(parser)
+        options = parser.parse_args(args=[self.jobStorePath])
+        self.toil = Toil(options)
+        self.assertEquals(self.toil, self.toil.__enter__())
+
+    def tearDown(self):
+        self.toil.__exit__(None, None, None)
+        self.toil._jobStore.destroy()
+        self.assertFalse(os.path.exists(self.jobStorePath))
+        super(ServiceManagerTest, self).tearDown()
+
+    def testWakeUp(self):
+        """
+        Tests that the service manager wakes up a leader blocked on the batch system as soon as
+        a service job is ready to be issued and as soon as the services of a job are running.
+        """
+        jobStore = self.toil._jobStore
+        batchSystem = SingleMachineBatchSystem(config=self.toil.config,
+                                               maxCores=1, maxMemory=1e9, maxDisk=1e9)
+        # Nothing is ever issued, so shutting the service manager down has no services to kill
+        serviceManager = ServiceManager(jobStore, Namespace(servicesIssued={}),
+                                        wakeUp=batchSystem.wakeUp)
+        service = ServiceJobNode(jobStoreID='service', memory=1, cores=1, disk=1,
+                                 preemptable=False,
+                                 startJobStoreID=jobStore.getEmptyFileStoreID(),
+                                 terminateJobStoreID=jobStore.getEmptyFileStoreID(),
+                                 errorJobStoreID=jobStore.getEmptyFileStoreID(),
+                                 unitName=None, jobName='service', command='service',
+                                 predecessorNumber=1)
+        jobGraph = JobGraph(command=None, memory=1, cores=1, disk=1, unitName=None,
+                            jobName='parent', preemptable=False, jobStoreID='parent',
+                            remainingRetryCount=1, predecessorNumber=0, services=[[service]])
+
+        def assertWokenUp():
+            # Without a wakeup this would block for the full minute
+            startTime = time.time()
+            self.assertIsNone(batchSystem.getUpdatedBatchJob(maxWait=60))
+            self.assertLess(time.time() - startTime, 10)
+
+        serviceManager.start()
+        try:
+            serviceManager.scheduleServices(jobGraph)
+            assertWokenUp()
+            self.assertEquals(serviceManager.getServiceJobsToStart(0), service)
+            # This is how a running service signals that it has started
+            jobStore.deleteFile(service.startJobStoreID)
+            assertWokenUp()
+            self.assertEquals(serviceManager.getJobGraphWhoseServicesAreRunning(0), jobGraph)
+            self.assertEquals(serviceManager.jobsIssuedToServiceManager, 0)
+        finally:
+            serviceManager.shutdown()
+            batchSystem.shutdown()
@@ -0,0 +1,76 @@
+# Copyright (C) 2015-2016 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import os
+from argparse import ArgumentParser
+from toil.common import Toil
+from toil.job import Job, JobNode
+from toil.test import ToilTest
+from toil.toilState import ToilState
+
+class ToilStateTest(ToilTest):
+
+    def setUp(self):
+        super(ToilStateTest, self).setUp()
+        self.jobStorePath = self._getTestJobStorePath()
+        parser = ArgumentParser()
+        Job.Runner.addToilOptions(parser)
+        options = parser.parse_args(args=[self.jobStorePath])
+        self.toil = Toil(options)
+        self.assertEquals(self.toil, self.toil.__enter__())
+
+    def tearDown(self):
+        self.toil.__exit__(None, None, None)
+        self.toil._jobStore.destroy()
+        self.assertFalse(os.path.exists(self.jobStorePath))
+        super(ToilStateTest, self).tearDown()
+
+    def testToilState(self):
+        """
+        Tests that the leader's state is built for chains of jobs deeper than the recursion limit
+        and for jobs with multiple predecessors, both with and without a job cache.
+        """
+        jobStore = self.toil._jobStore
+        requirements = dict(memory=1, cores=1, disk=1, preemptable=False)
+
+        def createJob(predecessorNumber=1):
+            return jobStore.create(JobNode(requirements=requirements, jobName='job',
+                                           unitName=None, jobStoreID=None, command='command',
+                                           predecessorNumber=predecessorNumber))
+
+        def addSuccessors(jobGraph, successors):
+            jobGraph.command = None
+            jobGraph.stack.append([JobNode.fromJobGraph(successor) for successor in successors])
+            jobStore.update(jobGraph)
+
+        # A diamond of jobs below the root, followed by a long chain of jobs
+        with jobStore.batch():
+            root = createJob(predecessorNumber=0)
+            left, right, join = createJob(), createJob(), createJob(predecessorNumber=2)
+            addSuccessors(root, [left, right])
+            addSuccessors(left, [join])
+            addSuccessors(right, [join])
+            chain = [join] + [createJob() for _ in range(2000)]
+            for predecessor, successor in zip(chain, chain[1:]):
+                addSuccessors(predecessor, [successor])
+
+        for jobCache in (None, {jobGraph.jobStoreID: jobGraph for jobGraph in jobStore.jobs()}):
+            toilState = ToilState(jobStore, jobStore.load(root.jobStoreID), jobCache=jobCache)
+            self.assertEquals([jobGraph.jobStoreID for jobGraph, _ in toilState.updatedJobs],
+                              [chain[-1].jobStoreID])
+            self.assertEquals(len(toilState.successorCounts), len(chain) + 2)
+            self.assertEquals(toilState.successorCounts[root.jobStoreID], 2)
+            self.assertEquals(len(toilState.successorJobStoreIDToPredecessorJobs[join.jobStoreID]), 2)
+            self.assertEquals(toilState.jobsToBeScheduledWithMultiplePredecessors, {})
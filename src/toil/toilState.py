@@ -16,6 +16,7 @@ from __future__ import absolute_import
 
 from builtins import object
 import logging
+from multiprocessing.pool import ThreadPool
 
 logger = logging.getLogger( __name__ )
 
@@ -72,25 +73,55 @@ class ToilState( object ):
         logger.info("(Re)building internal scheduler state")
         self._buildToilState(rootJob, jobStore, jobCache)
 
-    def _buildToilState(self, jobGraph, jobStore, jobCache=None):
+    # The maximum number of jobs that are loaded from the job store concurrently while the state
+    # is built, for jobs that are not in the job cache
+    maxConcurrentLoads = 16
+
+    def _buildToilState(self, rootJob, jobStore, jobCache=None):
         """
         Traverses tree of jobs from the root jobGraph (rootJob) building the
         ToilState class.
 
         If jobCache is passed, it must be a dict from job ID to JobGraph
         object. Jobs will be loaded from the cache (which can be downloaded from
-        the jobStore in a batch) instead of piecemeal when recursed into.
+        the jobStore in a batch) instead of piecemeal when traversed into.
+
+        The traversal is iterative, using an explicit stack of the jobs still to be
+        considered, so long chains of jobs cannot exhaust the recursion limit. The
+        successors of a job that are missing from the cache are loaded concurrently.
         """
+        pools = []
 
-        def getJob(jobId):
-            if jobCache is not None:
-                try:
-                    return jobCache[jobId]
-                except ValueError:
-                    return jobStore.load(jobId)
+        def getJobs(jobStoreIDs):
+            missing = [jobStoreID for jobStoreID in jobStoreIDs
+                       if jobCache is None or jobStoreID not in jobCache]
+            if len(missing) > 1:
+                if not pools:
+                    pools.append(ThreadPool(min(len(missing), self.maxConcurrentLoads)))
+                loaded = dict(zip(missing, pools[0].map(jobStore.load, missing)))
             else:
-                return jobStore.load(jobId)
+                loaded = {jobStoreID: jobStore.load(jobStoreID) for jobStoreID in missing}
+            return [loaded[jobStoreID] if jobStoreID in loaded else jobCache[jobStoreID]
+                    for jobStoreID in jobStoreIDs]
 
+        try:
+            jobsToConsider = [rootJob]
+            while jobsToConsider:
+                self._considerJob(jobsToConsider.pop(), getJobs, jobsToConsider)
+        finally:
+            for pool in pools:
+                pool.close()
+                pool.join()
+
+    def _considerJob(self, jobGraph, getJobs, jobsToConsider):
+        """
+        Adds the given job to the state and appends any of its successors that are ready to be
+        considered to the given list.
+
+        :param toil.jobGraph.JobGraph jobGraph: the job to add
+        :param getJobs: function mapping a list of job store IDs to a list of the JobGraphs
+        :param list jobsToConsider: the stack of jobs still to be considered
+        """
         # If the jobGraph has a command, is a checkpoint, has services or is ready to be
         # deleted it is ready to be processed
         if (jobGraph.command is not None
@@ -105,71 +136,76 @@ class ToilState( object ):
 
             if jobGraph.checkpoint is not None:
                 jobGraph.command = jobGraph.checkpoint
+            return
+
+        # There exist successors
+        logger.debug("Adding job: %s to the state with %s successors" % (jobGraph.jobStoreID, len(jobGraph.stack[-1])))
+
+        # Record the number of successors
+        self.successorCounts[jobGraph.jobStoreID] = len(jobGraph.stack[-1])
+
+        def processSuccessorWithMultiplePredecessors(successorJobGraph):
+            # If jobGraph is not reported as complete by the successor
+            if jobGraph.jobStoreID not in successorJobGraph.predecessorsFinished:
+
+                # Update the sucessor's status to mark the predecessor complete
+                successorJobGraph.predecessorsFinished.add(jobGraph.jobStoreID)
+
+            # If the successor has no predecessors to finish
+            assert len(successorJobGraph.predecessorsFinished) <= successorJobGraph.predecessorNumber
+            if len(successorJobGraph.predecessorsFinished) == successorJobGraph.predecessorNumber:
+
+                # It is ready to be run, so remove it from the cache
+                self.jobsToBeScheduledWithMultiplePredecessors.pop(successorJobGraph.jobStoreID)
+
+                # Consider the successor
+                jobsToConsider.append(successorJobGraph)
+
+        # The successors we have not yet considered, which are loaded together
+        newSuccessorJobNodes = []
 
-        else: # There exist successors
-            logger.debug("Adding job: %s to the state with %s successors" % (jobGraph.jobStoreID, len(jobGraph.stack[-1])))
-            
-            # Record the number of successors
-            self.successorCounts[jobGraph.jobStoreID] = len(jobGraph.stack[-1])
-            
-            def processSuccessorWithMultiplePredecessors(successorJobGraph):
-                # If jobGraph is not reported as complete by the successor
-                if jobGraph.jobStoreID not in successorJobGraph.predecessorsFinished:
-                    
-                    # Update the sucessor's status to mark the predecessor complete
-                    successorJobGraph.predecessorsFinished.add(jobGraph.jobStoreID)
-            
-                # If the successor has no predecessors to finish
-                assert len(successorJobGraph.predecessorsFinished) <= successorJobGraph.predecessorNumber
-                if len(successorJobGraph.predecessorsFinished) == successorJobGraph.predecessorNumber:
-                    
-                    # It is ready to be run, so remove it from the cache
-                    self.jobsToBeScheduledWithMultiplePredecessors.pop(successorJobStoreID)
-                    
-                    # Recursively consider the successor
-                    self._buildToilState(successorJobGraph, jobStore, jobCache=jobCache)
-            
-            # For each successor
-            for successorJobNode in jobGraph.stack[-1]:
-                successorJobStoreID = successorJobNode.jobStoreID
-                
-                # If the successor jobGraph does not yet point back at a
-                # predecessor we have not yet considered it
-                if successorJobStoreID not in self.successorJobStoreIDToPredecessorJobs:
-
-                    # Add the job as a predecessor
-                    self.successorJobStoreIDToPredecessorJobs[successorJobStoreID] = [jobGraph]
-                    
-                    # If predecessor number > 1 then the successor has multiple predecessors
-                    if successorJobNode.predecessorNumber > 1:
-                        
-                        # We load the successor job
-                        successorJobGraph =  getJob(successorJobStoreID)
-                        
-                        # We put the successor job in the cache of successor jobs with multiple predecessors
-                        assert successorJobStoreID not in self.jobsToBeScheduledWithMultiplePredecessors
-                        self.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID] = successorJobGraph
-                        
-                        # Process successor
-                        processSuccessorWithMultiplePredecessors(successorJobGraph)
-                            
-                    else:
-                        # The successor has only the jobGraph as a predecessor so
-                        # recursively consider the successor
-                        self._buildToilState(getJob(successorJobStoreID), jobStore, jobCache=jobCache)
-                
-                else:
-                    # We've already seen the successor
-                    
-                    # Add the job as a predecessor
-                    assert jobGraph not in self.successorJobStoreIDToPredecessorJobs[successorJobStoreID]
-                    self.successorJobStoreIDToPredecessorJobs[successorJobStoreID].append(jobGraph)
-                    
-                    # If the successor has multiple predecessors
-                    if successorJobStoreID in self.jobsToBeScheduledWithMultiplePredecessors:
-                        
-                        # Get the successor from cache
-                        successorJobGraph = self.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID]
-                        
-                        # Process successor
-                        processSuccessorWithMultiplePredecessors(successorJobGraph)
\ No newline at end of file
+        # For each successor
+        for successorJobNode in jobGraph.stack[-1]:
+            successorJobStoreID = successorJobNode.jobStoreID
+
+            # If the successor jobGraph does not yet point back at a
+            # predecessor we have not yet considered it
+            if successorJobStoreID not in self.successorJobStoreIDToPredecessorJobs:
+
+                # Add the job as a predecessor
+                self.successorJobStoreIDToPredecessorJobs[successorJobStoreID] = [jobGraph]
+                newSuccessorJobNodes.append(successorJobNode)
+
+            else:
+                # We've already seen the successor
+
+                # Add the job as a predecessor
+                assert jobGraph not in self.successorJobStoreIDToPredecessorJobs[successorJobStoreID]
+                self.successorJobStoreIDToPredecessorJobs[successorJobStoreID].append(jobGraph)
+
+                # If the successor has multiple predecessors
+                if successorJobStoreID in self.jobsToBeScheduledWithMultiplePredecessors:
+
+                    # Get the successor from cache
+                    successorJobGraph = self.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID]
+
+                    # Process successor
+                    processSuccessorWithMultiplePredecessors(successorJobGraph)
+
+        newSuccessorJobGraphs = getJobs([successorJobNode.jobStoreID
+                                         for successorJobNode in newSuccessorJobNodes])
+        for successorJobNode, successorJobGraph in zip(newSuccessorJobNodes, newSuccessorJobGraphs):
+
+            # If predecessor number > 1 then the successor has multiple predecessors
+            if successorJobNode.predecessorNumber > 1:
+
+                # We put the successor job in the cache of successor jobs with multiple predecessors
+                assert successorJobGraph.jobStoreID not in self.jobsToBeScheduledWithMultiplePredecessors
+                self.jobsToBeScheduledWithMultiplePredecessors[successorJobGraph.jobStoreID] = successorJobGraph
+
+                # Process successor
+                processSuccessorWithMultiplePredecessors(successorJobGraph)
+
+            else:
+                # The successor has only the jobGraph as a predecessor so consider the successor
+                jobsToConsider.append(successorJobGraph)
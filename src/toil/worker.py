@@ -77,17 +77,129 @@ def main(argv=None):
     ##########################################
     #Import necessary modules 
     ##########################################
+
+    _prepareWorkerProcess()
+
+    ##########################################
+    #Input args
+    ##########################################
+
+    jobName = argv[1]
+    jobStoreLocator = argv[2]
+    jobStoreID = argv[3]
+
+    ##########################################
+    #Load the jobStore/config file
+    ##########################################
     
+    jobStore = Toil.resumeJobStore(jobStoreLocator)
+    config = jobStore.config
+
+    ##########################################
+    #Load the environment for the jobGraph
+    ##########################################
+
+    loadEnvironment(jobStore)
+
+    return workerScript(jobStore, config, jobName, jobStoreID)
+
+
+def persistentMain(argv=None):
+    """
+    Entry point of a persistent worker process. A persistent worker loads Toil, the job store,
+    its config and the workflow's environment once and then reads requests to run jobs from its
+    standard input, one per line, each consisting of the job's name and its jobStoreID. Each job
+    is run by :func:`workerScript` in a process forked from the persistent worker, sparing the
+    job the cost of starting a fresh interpreter. For every job, the ID of the forked process
+    is written to standard output once the job has started, followed by the exit status of the
+    forked process once the job has finished. The persistent worker exits when its standard
+    input is closed.
+
+    See :class:`toil.batchSystems.singleMachine.PersistentWorker` for the other side of this
+    protocol.
+    """
+    logging.basicConfig()
+    if argv is None:
+        argv = sys.argv
+
+    _prepareWorkerProcess()
+    from toil.job import Job
+    from toil.resource import ModuleDescriptor
+
+    jobStoreLocator = argv[1]
+
+    # Move the requests and replies out of the way of the forked jobs, which would otherwise
+    # inherit them as their standard input and output.
+    requests = os.fdopen(os.dup(0), 'r')
+    replies = os.fdopen(os.dup(1), 'w')
+    devNull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devNull, 0)
+    os.close(devNull)
+    os.dup2(2, 1)
+
+    jobStore = Toil.resumeJobStore(jobStoreLocator)
+    config = jobStore.config
+    loadEnvironment(jobStore)
+
+    while True:
+        request = requests.readline()
+        if not request:
+            logger.debug('The leader has closed the connection to this persistent worker.')
+            break
+        jobName, jobStoreID = request.split()
+
+        # Import the user module here such that the forked jobs don't have to
+        try:
+            jobGraph = jobStore.load(jobStoreID)
+            if jobGraph.command is not None and jobGraph.command.startswith('_toil '):
+                Job._loadUserModule(ModuleDescriptor.fromCommand(jobGraph.command.split()[2:]))
+        except:
+            # The job will fail to load the user module too and report the failure properly
+            logger.debug('Failed to preload the user module for job %s.', jobStoreID,
+                         exc_info=True)
+
+        pid = os.fork()
+        if pid == 0:
+            # This is the forked job. Once the job is done, we exit just like a regular worker
+            # process would.
+            requests.close()
+            replies.close()
+            # Don't let all forked jobs share the persistent worker's random state
+            random.seed()
+            exitStatus = 1
+            try:
+                exitStatus = workerScript(jobStore, config, jobName, jobStoreID)
+            except SystemExit as e:
+                exitStatus = e.code
+            except:
+                logger.exception('Failed to run job %s.', jobStoreID)
+            finally:
+                # Never unwind into the persistent worker's loop, nor run the exit handlers the
+                # persistent worker registered. Like sys.exit(), treat None as success.
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(0 if exitStatus is None else
+                         exitStatus if isinstance(exitStatus, int) else 1)
+        replies.write('%i\n' % pid)
+        replies.flush()
+        _, status = os.waitpid(pid, 0)
+        if os.WIFSIGNALED(status):
+            # Mimic the exit status reported by subprocess for a process killed by a signal
+            exitStatus = -os.WTERMSIG(status)
+        else:
+            exitStatus = os.WEXITSTATUS(status)
+        replies.write('%i\n' % exitStatus)
+        replies.flush()
+
+
+def _prepareWorkerProcess():
+    """
+    Makes sure Toil can be imported by this worker process and patches the modules that need it.
+    """
     # This is assuming that worker.py is at a path ending in "/toil/worker.py".
     sourcePath = os.path.dirname(os.path.dirname(__file__))
     if sourcePath not in sys.path:
         sys.path.append(sourcePath)
-    
-    #Now we can import all the necessary functions
-    from toil.lib.bioio import setLogLevel
-    from toil.lib.bioio import getTotalCpuTime
-    from toil.lib.bioio import getTotalCpuTimeAndMemoryUsage
-    from toil.job import Job
     try:
         import boto
     except ImportError:
@@ -96,21 +208,46 @@ def main(argv=None):
         # boto is installed, monkey patch it now
         from bd2k.util.ec2.credentials import enable_metadata_credential_caching
         enable_metadata_credential_caching()
-    ##########################################
-    #Input args
-    ##########################################
 
-    listOfJobs = [argv[1]]
-    jobStoreLocator = argv[2]
-    jobStoreID = argv[3]
 
-    ##########################################
-    #Load the jobStore/config file
-    ##########################################
-    
-    jobStore = Toil.resumeJobStore(jobStoreLocator)
-    config = jobStore.config
-    
+def loadEnvironment(jobStore):
+    """
+    Loads the environment the workflow was started with from the job store and applies it to
+    the current process.
+
+    :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore: the workflow's job store
+    """
+    with jobStore.readSharedFileStream("environment.pickle") as fileHandle:
+        environment = pickle.load(fileHandle)
+    for i in environment:
+        if i not in ("TMPDIR", "TMP", "HOSTNAME", "HOSTTYPE"):
+            os.environ[i] = environment[i]
+    # sys.path is used by __import__ to find modules
+    if "PYTHONPATH" in environment:
+        for e in environment["PYTHONPATH"].split(':'):
+            if e != '':
+                sys.path.append(e)
+
+
+def workerScript(jobStore, config, jobName, jobStoreID):
+    """
+    Runs the job with the given jobStoreID, along with any successors that can be chained to
+    it, and cleans up after them. Expects the workflow's environment to have been loaded into
+    the current process, see :func:`loadEnvironment`.
+
+    :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore: the workflow's job store
+    :param toil.common.Config config: the workflow's config
+    :param str jobName: the name of the job, used for logging until the job is loaded
+    :param str jobStoreID: the ID of the job to run
+    """
+    #Import all the necessary functions
+    from toil.lib.bioio import setLogLevel
+    from toil.lib.bioio import getTotalCpuTime
+    from toil.lib.bioio import getTotalCpuTimeAndMemoryUsage
+    from toil.job import Job
+
+    listOfJobs = [jobName]
+
     ##########################################
     #Create the worker killer, if requested
     ##########################################
@@ -134,22 +271,6 @@ def main(argv=None):
         # daemon
         t.start()
 
-    ##########################################
-    #Load the environment for the jobGraph
-    ##########################################
-    
-    #First load the environment for the jobGraph.
-    with jobStore.readSharedFileStream("environment.pickle") as fileHandle:
-        environment = pickle.load(fileHandle)
-    for i in environment:
-        if i not in ("TMPDIR", "TMP", "HOSTNAME", "HOSTTYPE"):
-            os.environ[i] = environment[i]
-    # sys.path is used by __import__ to find modules
-    if "PYTHONPATH" in environment:
-        for e in environment["PYTHONPATH"].split(':'):
-            if e != '':
-                sys.path.append(e)
-
     setLogLevel(config.logLevel)
 
     toilWorkflowDir = Toil.getWorkflowDir(config.workflowID, config.workDir)